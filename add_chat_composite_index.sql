@@ -0,0 +1,8 @@
+-- 为最近上下文 / prompt 查询添加联合索引
+-- 问题：WHERE user_id = ? AND session_id = ? ORDER BY id DESC LIMIT n 只能用到单列索引，需要额外排序
+-- 联合索引 (user_id, session_id, id) 可以直接按索引倒序取前 n 条
+
+SET NAMES utf8mb4;
+
+ALTER TABLE `chat` ADD INDEX `idx_user_session_id`(`user_id` ASC, `session_id` ASC, `id` ASC) USING BTREE;
+ALTER TABLE `prompt` ADD INDEX `idx_prompt_user_session_id`(`user_id` ASC, `session_id` ASC, `id` ASC) USING BTREE;
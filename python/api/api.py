@@ -1,15 +1,17 @@
 import os
+import json
 import uvicorn
 import logging
 from pydantic import BaseModel
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import StreamingResponse
 from dotenv import load_dotenv
 from fastapi.middleware.cors import CORSMiddleware
 from python.local_model import LocalModel
 import mysql.connector  # 用于 MySQL 数据库访问
 from mysql.connector import Error, pooling
 
-from python.mysql import MySQLPool
+from python.mysql import MySQLPool, SQLitePool, AsyncChatStore
 
 # 加载环境变量
 load_dotenv()
@@ -17,8 +19,12 @@ ip = os.getenv("IP")
 path = os.getenv("MODEL_PATH")
 model = LocalModel(path, "cpu")
 
-# 初始化数据库连接池
-db = MySQLPool()
+# 初始化数据库连接池（CHAT_DB=sqlite 时使用 SQLite 替身，方便测试）
+pool_size = int(os.getenv("MYSQL_POOL_SIZE", 5))
+if os.getenv("CHAT_DB", "mysql") == "sqlite":
+    db = AsyncChatStore(SQLitePool(os.getenv("SQLITE_PATH", ":memory:"), pool_size=pool_size))
+else:
+    db = AsyncChatStore(MySQLPool(pool_size=pool_size))
 
 # 设置日志
 logging.basicConfig(level=logging.INFO)
@@ -30,6 +36,7 @@ class ChatRequest(BaseModel):
     sessionId: int  # 会话ID
     question: str
     prompt: str = "你是个智能助手"  # 默认值
+    stream: bool = False  # 是否以 SSE 流式返回
 
 
 # FastAPI 实例
@@ -45,14 +52,27 @@ app.add_middleware(
 )
 
 
+@app.on_event("shutdown")
+async def shutdown():
+    # 关闭大模型客户端的连接池
+    await model.aclose()
+    db.close()
+
 
 @app.get("/addpropmt")
 async def root(user_id: int, session_id: int, prompt: str):
     # 向数据库插入 prompt
-    db.add_propmt(user_id, session_id, prompt)
+    await db.add_propmt(user_id, session_id, prompt)
     return {"message": "Prompt added successfully"}
 
 
+@app.get("/chatwritten")
+async def chat_written(user_id: int, session_id: int):
+    # java 端写完这一轮问答后调用，之后该会话的上下文重新走缓存
+    db.confirm_write(user_id, session_id)
+    return {"message": "Chat write confirmed"}
+
+
 # 聊天接口
 @app.post("/chatbyqwen3")
 async def chat(request: ChatRequest):
@@ -61,7 +81,7 @@ async def chat(request: ChatRequest):
     question = request.question
     prompt = request.prompt
     # 获取最近五条聊天记录作为上下文
-    context = db.get_last_five_chats(user_id, session_id)
+    context = await db.get_last_five_chats(user_id, session_id)
     # 创建用户消息
     user_message = {"role": "user", "content": question}
     # 将 prompt 加入到上下文
@@ -71,9 +91,25 @@ async def chat(request: ChatRequest):
     # 将用户消息加入上下文
     context.append(user_message)
 
+    # 流式返回：边生成边推送，每段为一条 SSE 消息
+    if request.stream:
+        async def event_stream():
+            try:
+                async for content in model.stream_qwe3(ip, context):
+                    yield f"data: {json.dumps({'answer': content}, ensure_ascii=False)}\n\n"
+            except Exception as e:
+                logger.error(f"Error generating answer: {str(e)}")
+                yield f"data: {json.dumps({'error': str(e)}, ensure_ascii=False)}\n\n"
+            # 这一轮问答随后由 java 端写库，确认写入前该会话不走缓存
+            db.mark_pending_write(user_id, session_id)
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(event_stream(), media_type="text/event-stream")
+
     # 使用上下文生成回答
     try:
-        answer = model.load_qwe3(ip, context)
+        answer = await model.aload_qwe3(ip, context)
+        db.mark_pending_write(user_id, session_id)
         return {"answer": answer}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error generating answer: {str(e)}")
@@ -2,6 +2,7 @@
 # reference: https://github.com/lifeiteng/vall-e
 
 # sys.path.append("/data/docker/liujing04/gpt-vits/mq-vits-s1bert_no_bert")
+import json
 import os
 import traceback
 from typing import Dict, List
@@ -10,6 +11,7 @@ import numpy as np
 import pandas as pd
 import torch
 from torch.utils.data import DataLoader, Dataset
+from tqdm import tqdm
 
 version = os.environ.get("version", None)
 
@@ -54,11 +56,6 @@ class Text2SemanticDataset(Dataset):
     ) -> None:
         super().__init__()
 
-        self.semantic_data = pd.read_csv(
-            semantic_path,
-            delimiter="\t",
-            encoding="utf-8",
-        )
         # get dict
         self.path2 = phoneme_path  # "%s/2-name2text.txt"%exp_dir#phoneme_path
         self.path3 = "%s/3-bert" % (
@@ -69,6 +66,28 @@ class Text2SemanticDataset(Dataset):
         self.path6 = semantic_path  # "%s/6-name2semantic.tsv"%exp_dir#semantic_path
         assert os.path.exists(self.path2)
         assert os.path.exists(self.path6)
+        # pad for semantic tokens
+        self.PAD: int = pad_val
+        self.hz = int(os.environ.get("hz", "25hz")[:-2])
+        # max seconds of semantic token
+        self.max_sec = max_sec
+        self.min_ps_ratio = min_ps_ratio
+        self.max_ps_ratio = max_ps_ratio
+
+        ### 有和tsv/txt对应的编译格式（prepare_datasets/5-compile-s1.py）就直接memmap读取
+        compiled_dir = "%s/%s" % (os.path.dirname(phoneme_path), COMPILED_S1_DIR)
+        self.compiled = None
+        if max_sample is None and CompiledS1Data.is_fresh(compiled_dir, phoneme_path, semantic_path):
+            print("using compiled s1 dataset:", compiled_dir)
+            self.compiled = CompiledS1Data(compiled_dir)
+            self.init_compiled()
+            return
+
+        self.semantic_data = pd.read_csv(
+            semantic_path,
+            delimiter="\t",
+            encoding="utf-8",
+        )
         self.phoneme_data = {}
         with open(self.path2, "r", encoding="utf8") as f:
             lines = f.read().strip("\n").split("\n")
@@ -80,18 +99,10 @@ class Text2SemanticDataset(Dataset):
             self.phoneme_data[tmp[0]] = [tmp[1], tmp[2], tmp[3]]
 
         # self.phoneme_data = np.load(phoneme_path, allow_pickle=True).item()
-        # pad for semantic tokens
-        self.PAD: int = pad_val
         # self.hz = 25
         # with open("/data/docker/liujing04/gpt-vits/mq-vits-s1bert_no_bert/configs/s2.json", "r") as f:data = f.read()
         # data=json.loads(data)["model"]["semantic_frame_rate"]#50hz
         # self.hz=int(data[:-2])#
-        self.hz = int(os.environ.get("hz", "25hz")[:-2])
-
-        # max seconds of semantic token
-        self.max_sec = max_sec
-        self.min_ps_ratio = min_ps_ratio
-        self.max_ps_ratio = max_ps_ratio
 
         if max_sample is not None:
             self.semantic_data = self.semantic_data[:max_sample]
@@ -205,13 +216,56 @@ class Text2SemanticDataset(Dataset):
         # 345410 for LibriTTS
         print("dataset.__len__():", self.__len__())
 
+    def init_compiled(self):
+        ### 长度和ps比例的过滤在偏移表上向量化计算
+        data = self.compiled
+        semantic_lens = data.semantic_lens
+        phoneme_lens = data.phoneme_lens
+        print("semantic_data_len:", len(semantic_lens))
+        too_long = semantic_lens > self.max_sec * self.hz
+        with np.errstate(divide="ignore", invalid="ignore"):
+            ps_ratio = phoneme_lens / (semantic_lens / self.hz)
+        bad_ps = (phoneme_lens > self.max_sec * self.hz / 2.5) | (ps_ratio > self.max_ps_ratio) | (ps_ratio < self.min_ps_ratio)
+        bad_ps |= semantic_lens == 0
+        bad_ps &= ~too_long
+        self.indices = np.flatnonzero(~too_long & ~bad_ps)
+
+        min_num = 100  # 20直接不补#30补了也不存ckpt
+        leng = len(self.indices)
+        if leng < min_num:
+            ### 与init_batch一致：init_batch先清空再拼k遍，结果共k份（不是原有的再加k份）
+            self.indices = np.tile(self.indices, max(2, int(min_num / leng)))
+        self.item_names = [data.names[i] for i in self.indices]
+        num_not_in = data.meta["num_not_in"]
+        if num_not_in > 0:
+            print(f"there are {num_not_in} semantic datas not in phoneme datas")
+        if too_long.sum() > 0:
+            print(f"deleted {too_long.sum()} audios who's duration are bigger than {self.max_sec} seconds")
+        if bad_ps.sum() > 0:
+            print(
+                f"deleted {bad_ps.sum()} audios who's phoneme/sec are bigger than {self.max_ps_ratio} or smaller than {self.min_ps_ratio}",
+            )
+        print("dataset.__len__():", self.__len__())
+
     def __get_item_names__(self) -> List[str]:
         return self.item_names
 
     def __len__(self) -> int:
+        if self.compiled is not None:
+            return len(self.indices)
         return len(self.semantic_phoneme)
 
     def __getitem__(self, idx: int) -> Dict:
+        if self.compiled is not None:
+            semantic_ids, phoneme_ids, bert_feature = self.compiled.get(int(self.indices[idx]))
+            return {
+                "idx": idx,
+                "phoneme_ids": phoneme_ids,
+                "phoneme_ids_len": len(phoneme_ids),
+                "semantic_ids": semantic_ids,
+                "semantic_ids_len": len(semantic_ids),
+                "bert_feature": bert_feature,
+            }
         semantic_ids, phoneme_ids = self.semantic_phoneme[idx]
         item_name = self.item_names[idx]
         phoneme_ids_len = len(phoneme_ids)
@@ -239,6 +293,8 @@ class Text2SemanticDataset(Dataset):
         }
 
     def get_sample_length(self, idx: int):
+        if self.compiled is not None:
+            return 1.0 * self.compiled.semantic_lens[self.indices[idx]] / self.hz
         semantic_ids = self.semantic_phoneme[idx][0]
         sec = 1.0 * len(semantic_ids) / self.hz
         return sec
@@ -291,6 +347,155 @@ class Text2SemanticDataset(Dataset):
         }
 
 
+COMPILED_S1_DIR = "9-s1-compiled"
+COMPILED_S1_FORMAT = 1
+
+
+def _source_stamp(path):
+    stat = os.stat(path)
+    return [stat.st_size, int(stat.st_mtime)]
+
+
+class CompiledS1Data:
+    """
+    s1训练集的编译格式：
+        semantic.bin  int16 所有样本的semantic token首尾相接，semantic_offsets.npy (N+1) 为偏移
+        phones.bin    int16 音素id，phone_offsets.npy (N+1)
+        bert.bin      fp16 (行, 1024)，和音素一一对应；bert_offsets.npy (N) 为起始行，没有bert的样本为-1
+        names.txt     样本名
+    memmap在每个进程第一次读取时才打开，不会被pickle到DataLoader的worker里。
+    """
+
+    def __init__(self, compiled_dir):
+        self.compiled_dir = compiled_dir
+        with open("%s/meta.json" % compiled_dir, "r", encoding="utf8") as f:
+            self.meta = json.load(f)
+        self.semantic_offsets = np.load("%s/semantic_offsets.npy" % compiled_dir)
+        self.phone_offsets = np.load("%s/phone_offsets.npy" % compiled_dir)
+        self.bert_offsets = np.load("%s/bert_offsets.npy" % compiled_dir)
+        self.semantic_lens = np.diff(self.semantic_offsets)
+        self.phoneme_lens = np.diff(self.phone_offsets)
+        with open("%s/names.txt" % compiled_dir, "r", encoding="utf8") as f:
+            self.names = f.read().split("\n")
+        self.maps = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["maps"] = None
+        return state
+
+    @staticmethod
+    def is_fresh(compiled_dir, phoneme_path, semantic_path):
+        meta_path = "%s/meta.json" % compiled_dir
+        if not os.path.exists(meta_path):
+            return False
+        with open(meta_path, "r", encoding="utf8") as f:
+            meta = json.load(f)
+        if meta.get("format") != COMPILED_S1_FORMAT or meta.get("version") != version:
+            return False
+        if meta["phoneme_stamp"] != _source_stamp(phoneme_path) or meta["semantic_stamp"] != _source_stamp(semantic_path):
+            print("compiled s1 dataset is older than %s / %s, ignored" % (phoneme_path, semantic_path))
+            return False
+        return True
+
+    def _open(self):
+        if self.maps is None:
+            bert_path = "%s/bert.bin" % self.compiled_dir
+            self.maps = {
+                "semantic": np.memmap("%s/semantic.bin" % self.compiled_dir, dtype=np.int16, mode="r"),
+                "phones": np.memmap("%s/phones.bin" % self.compiled_dir, dtype=np.int16, mode="r"),
+                "bert": np.memmap(bert_path, dtype=np.float16, mode="r").reshape(-1, self.meta["bert_dim"])
+                if os.path.getsize(bert_path) > 0
+                else None,
+            }
+        return self.maps
+
+    def get(self, i):
+        maps = self._open()
+        semantic_ids = maps["semantic"][self.semantic_offsets[i] : self.semantic_offsets[i + 1]]
+        phoneme_ids = maps["phones"][self.phone_offsets[i] : self.phone_offsets[i + 1]]
+        bert_feature = None
+        b0 = self.bert_offsets[i]
+        if b0 >= 0:
+            bert_feature = torch.from_numpy(np.ascontiguousarray(maps["bert"][b0 : b0 + len(phoneme_ids)].T))
+        return semantic_ids, phoneme_ids, bert_feature
+
+
+def compile_s1_dataset(phoneme_path: str, semantic_path: str):
+    """
+    把2-name2text.txt、6-name2semantic.tsv和3-bert编译成CompiledS1Data，写到同目录的9-s1-compiled。
+    样本顺序与tsv一致，过滤不在这里做（在加载时按偏移表向量化计算），只去掉没有音素的样本。
+    """
+    exp_dir = os.path.dirname(phoneme_path)
+    bert_dir = "%s/3-bert" % exp_dir
+    compiled_dir = "%s/%s" % (exp_dir, COMPILED_S1_DIR)
+    os.makedirs(compiled_dir, exist_ok=True)
+    if os.path.exists("%s/meta.json" % compiled_dir):
+        os.remove("%s/meta.json" % compiled_dir)
+    phoneme_data = {}
+    with open(phoneme_path, "r", encoding="utf8") as f:
+        for line in f.read().strip("\n").split("\n"):
+            tmp = line.split("\t")
+            if len(tmp) == 4:
+                phoneme_data[tmp[0]] = tmp[1]
+    with open(semantic_path, "r", encoding="utf8") as f:
+        semantic_lines = f.read().strip("\n").split("\n")[1:]  # 第一行是表头
+
+    names = []
+    semantic_offsets = [0]
+    phone_offsets = [0]
+    bert_offsets = []
+    bert_rows = 0
+    bert_dim = 1024
+    num_not_in = 0
+    with open("%s/semantic.bin" % compiled_dir, "wb") as f_semantic, open(
+        "%s/phones.bin" % compiled_dir, "wb"
+    ) as f_phones, open("%s/bert.bin" % compiled_dir, "wb") as f_bert:
+        for line in tqdm(semantic_lines):
+            try:
+                item_name, semantic_str = line.split("\t")[:2]
+                phoneme_ids = np.asarray(cleaned_text_to_sequence(phoneme_data[item_name].split(" "), version), dtype=np.int16)
+                semantic_ids = np.asarray(semantic_str.split(" "), dtype=np.int64).astype(np.int16)
+            except Exception:
+                traceback.print_exc()
+                num_not_in += 1
+                continue
+            path_bert = "%s/%s.pt" % (bert_dir, item_name)
+            if os.path.exists(path_bert):
+                bert_feature = torch.load(path_bert, map_location="cpu")
+                assert bert_feature.shape[-1] == len(phoneme_ids), item_name
+                bert_dim = bert_feature.shape[0]
+                f_bert.write(bert_feature.T.contiguous().half().numpy().tobytes())
+                bert_offsets.append(bert_rows)
+                bert_rows += len(phoneme_ids)
+            else:
+                bert_offsets.append(-1)
+            f_semantic.write(semantic_ids.tobytes())
+            f_phones.write(phoneme_ids.tobytes())
+            semantic_offsets.append(semantic_offsets[-1] + len(semantic_ids))
+            phone_offsets.append(phone_offsets[-1] + len(phoneme_ids))
+            names.append(item_name)
+    np.save("%s/semantic_offsets.npy" % compiled_dir, np.asarray(semantic_offsets, dtype=np.int64))
+    np.save("%s/phone_offsets.npy" % compiled_dir, np.asarray(phone_offsets, dtype=np.int64))
+    np.save("%s/bert_offsets.npy" % compiled_dir, np.asarray(bert_offsets, dtype=np.int64))
+    with open("%s/names.txt" % compiled_dir, "w", encoding="utf8") as f:
+        f.write("\n".join(names))
+    meta = {
+        "format": COMPILED_S1_FORMAT,
+        "version": version,
+        "count": len(names),
+        "num_not_in": num_not_in,
+        "bert_dim": bert_dim,
+        "bert_rows": bert_rows,
+        "phoneme_stamp": _source_stamp(phoneme_path),
+        "semantic_stamp": _source_stamp(semantic_path),
+    }
+    ### meta.json最后写，中途失败的编译不会被加载
+    with open("%s/meta.json" % compiled_dir, "w", encoding="utf8") as f:
+        json.dump(meta, f, indent=2)
+    return meta
+
+
 if __name__ == "__main__":
     root_dir = "/data/docker/liujing04/gpt-vits/prepare/dump_mix/"
     dataset = Text2SemanticDataset(
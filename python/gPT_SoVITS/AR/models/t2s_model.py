@@ -70,6 +70,37 @@ def scaled_dot_product_attention(
     return attn_weight @ value
 
 
+def alloc_static_kv_cache(k_cache: List[torch.Tensor], v_cache: List[torch.Tensor], max_len: int):
+    """
+    Copy the kv cache returned by `process_prompt` into preallocated [batch, max_len, hidden] buffers,
+    later tokens are written in place by `decode_next_token_static`.
+    """
+    static_k_cache: List[torch.Tensor] = []
+    static_v_cache: List[torch.Tensor] = []
+    for k, v in zip(k_cache, v_cache):
+        cache_len = k.shape[1]
+        k_buf = k.new_zeros(k.shape[0], max(max_len, cache_len), k.shape[2])
+        v_buf = v.new_zeros(v.shape[0], max(max_len, cache_len), v.shape[2])
+        k_buf[:, :cache_len] = k
+        v_buf[:, :cache_len] = v
+        static_k_cache.append(k_buf)
+        static_v_cache.append(v_buf)
+    return static_k_cache, static_v_cache
+
+
+def compact_static_kv_cache(k_cache: List[torch.Tensor], v_cache: List[torch.Tensor], index: torch.Tensor):
+    """
+    Keep only the batch rows in `index`, moved to the front of the same buffers (no reallocation of the cache).
+    """
+    n = index.shape[0]
+    for i in range(len(k_cache)):
+        k_cache[i][:n] = k_cache[i][index]
+        v_cache[i][:n] = v_cache[i][index]
+        k_cache[i] = k_cache[i][:n]
+        v_cache[i] = v_cache[i][:n]
+    return k_cache, v_cache
+
+
 @torch.jit.script
 class T2SMLP:
     def __init__(self, w1, b1, w2, b2):
@@ -118,6 +149,13 @@ class T2SBlock:
 
         self.false = torch.tensor(False, dtype=torch.bool)
 
+    ### 线性层单独成方法，CPU int8 推理时由 T2SBlockInt8 覆盖
+    def in_proj(self, x: torch.Tensor):
+        return F.linear(x, self.qkv_w, self.qkv_b)
+
+    def out_proj(self, x: torch.Tensor):
+        return F.linear(x, self.out_w, self.out_b)
+
     @torch.jit.ignore
     def to_mask(
         self,
@@ -139,7 +177,7 @@ class T2SBlock:
         padding_mask: Optional[torch.Tensor] = None,
         torch_sdpa: bool = True,
     ):
-        q, k, v = F.linear(self.to_mask(x, padding_mask), self.qkv_w, self.qkv_b).chunk(3, dim=-1)
+        q, k, v = self.in_proj(self.to_mask(x, padding_mask)).chunk(3, dim=-1)
 
         batch_size = q.shape[0]
         q_len = q.shape[1]
@@ -159,7 +197,7 @@ class T2SBlock:
             attn = scaled_dot_product_attention(q, k, v, attn_mask)
 
         attn = attn.transpose(1, 2).reshape(batch_size, q_len, -1)
-        attn = F.linear(self.to_mask(attn, padding_mask), self.out_w, self.out_b)
+        attn = self.out_proj(self.to_mask(attn, padding_mask))
 
         x = x + attn
         x = F.layer_norm(x, [self.hidden_dim], self.norm_w1, self.norm_b1, self.norm_eps1)
@@ -181,7 +219,7 @@ class T2SBlock:
         attn_mask: torch.Tensor = None,
         torch_sdpa: bool = True,
     ):
-        q, k, v = F.linear(x, self.qkv_w, self.qkv_b).chunk(3, dim=-1)
+        q, k, v = self.in_proj(x).chunk(3, dim=-1)
 
         k_cache = torch.cat([k_cache, k], dim=1)
         v_cache = torch.cat([v_cache, v], dim=1)
@@ -200,7 +238,7 @@ class T2SBlock:
             attn = scaled_dot_product_attention(q, k, v, attn_mask)
 
         attn = attn.transpose(1, 2).reshape(batch_size, q_len, -1)
-        attn = F.linear(attn, self.out_w, self.out_b)
+        attn = self.out_proj(attn)
 
         x = x + attn
         x = F.layer_norm(
@@ -220,6 +258,55 @@ class T2SBlock:
         )
         return x, k_cache, v_cache
 
+    def decode_next_token_static(
+        self,
+        x: torch.Tensor,
+        k_cache: torch.Tensor,
+        v_cache: torch.Tensor,
+        cache_len: int,
+        attn_mask: Optional[torch.Tensor] = None,
+        torch_sdpa: bool = True,
+    ):
+        ### k_cache/v_cache 为预分配的 [batch, max_len, hidden] 缓冲区，新token原地写入 cache_len 位置
+        q, k, v = self.in_proj(x).chunk(3, dim=-1)
+
+        batch_size = q.shape[0]
+        q_len = q.shape[1]
+        kv_len = cache_len + q_len
+
+        k_cache.narrow(1, cache_len, q_len).copy_(k)
+        v_cache.narrow(1, cache_len, q_len).copy_(v)
+
+        q = q.view(batch_size, q_len, self.num_heads, -1).transpose(1, 2)
+        k = k_cache.narrow(1, 0, kv_len).view(batch_size, kv_len, self.num_heads, -1).transpose(1, 2)
+        v = v_cache.narrow(1, 0, kv_len).view(batch_size, kv_len, self.num_heads, -1).transpose(1, 2)
+
+        if torch_sdpa:
+            attn = F.scaled_dot_product_attention(q, k, v, (~attn_mask) if attn_mask is not None else None)
+        else:
+            attn = scaled_dot_product_attention(q, k, v, attn_mask)
+
+        attn = attn.transpose(1, 2).reshape(batch_size, q_len, -1)
+        attn = self.out_proj(attn)
+
+        x = x + attn
+        x = F.layer_norm(
+            x,
+            [self.hidden_dim],
+            self.norm_w1,
+            self.norm_b1,
+            self.norm_eps1,
+        )
+        x = x + self.mlp.forward(x)
+        x = F.layer_norm(
+            x,
+            [self.hidden_dim],
+            self.norm_w2,
+            self.norm_b2,
+            self.norm_eps2,
+        )
+        return x
+
 
 @torch.jit.script
 class T2STransformer:
@@ -256,6 +343,19 @@ class T2STransformer:
             )
         return x, k_cache, v_cache
 
+    def decode_next_token_static(
+        self,
+        x: torch.Tensor,
+        k_cache: List[torch.Tensor],
+        v_cache: List[torch.Tensor],
+        cache_len: int,
+        attn_mask: Optional[torch.Tensor] = None,
+        torch_sdpa: bool = True,
+    ):
+        for i in range(self.num_blocks):
+            x = self.blocks[i].decode_next_token_static(x, k_cache[i], v_cache[i], cache_len, attn_mask, torch_sdpa)
+        return x
+
 
 class Text2SemanticDecoder(nn.Module):
     def __init__(self, config, norm_first=False, top_k=3):
@@ -661,7 +761,7 @@ class Text2SemanticDecoder(nn.Module):
             value=False,
         )
 
-        causal_mask = torch.concat([x_mask, y_mask], dim=0).view(1, src_len, src_len).repeat(bsz, 1, 1).to(x.device)
+        causal_mask = torch.concat([x_mask, y_mask], dim=0).view(1, src_len, src_len).to(x.device)
         # padding_mask = padding_mask.unsqueeze(1) * padding_mask.unsqueeze(2) ### [b, x+y, x+y]
         ### 上面是错误的，会导致padding的token被"看见"
 
@@ -677,10 +777,11 @@ class Text2SemanticDecoder(nn.Module):
         # [PAD, PAD, PAD, 1, 2, 3, 4, 5, 6],
         # [PAD, PAD, PAD, 1, 2, 3, 4, 5, 6]]
 
-        padding_mask = padding_mask.view(bsz, 1, src_len).repeat(1, src_len, 1)
+        ### 依靠广播得到 [bsz, 1, src_len, src_len]，不再按 head 数 repeat
+        padding_mask = padding_mask.view(bsz, 1, src_len)
 
         attn_mask: torch.Tensor = causal_mask.logical_or(padding_mask)
-        attn_mask = attn_mask.unsqueeze(1).expand(-1, self.num_head, -1, -1).bool()
+        attn_mask = attn_mask.unsqueeze(1)
 
         # 正确的attn_mask应该是这样的：
         # |   pad_len   |  x_len  |  y_len  |
@@ -698,18 +799,29 @@ class Text2SemanticDecoder(nn.Module):
         y_list = [None] * y.shape[0]
         batch_idx_map = list(range(y.shape[0]))
         idx_list = [None] * y.shape[0]
+        ### kv cache 预分配到 prompt + 最大生成长度，之后每步原地写入，不再 torch.cat
+        max_decode_steps = 1499 if early_stop_num == -1 else min(early_stop_num, 1499)
+        cache_len = src_len
+        ### 解码阶段每个query只需屏蔽左侧padding：按每行的padding长度一次性生成 [bsz, 1, 1, max_len] 的mask，
+        ### 之后每步只取 [..., :cache_len + 1] 的视图
+        x_pad_len = max_len - x_lens
+        decode_attn_mask = (
+            torch.arange(src_len + max_decode_steps + 1, device=x.device).unsqueeze(0) < x_pad_len.unsqueeze(1)
+        ).view(bsz, 1, 1, -1)
         for idx in tqdm(range(1500)):
             if idx == 0:
                 xy_dec, k_cache, v_cache = self.t2s_transformer.process_prompt(xy_pos, attn_mask, None)
+                k_cache, v_cache = alloc_static_kv_cache(k_cache, v_cache, src_len + max_decode_steps + 1)
+                attn_mask = None
             else:
-                xy_dec, k_cache, v_cache = self.t2s_transformer.decode_next_token(xy_pos, k_cache, v_cache, attn_mask)
+                xy_dec = self.t2s_transformer.decode_next_token_static(
+                    xy_pos, k_cache, v_cache, cache_len, decode_attn_mask[..., : cache_len + 1]
+                )
+                cache_len += 1
             logits = self.ar_predict_layer(xy_dec[:, -1])
 
             if idx == 0:
-                attn_mask = F.pad(attn_mask[:, :, -1].unsqueeze(-2), (0, 1), value=False)
                 logits = logits[:, :-1]
-            else:
-                attn_mask = F.pad(attn_mask, (0, 1), value=False)
 
             samples = sample(
                 logits, y, top_k=top_k, top_p=top_p, repetition_penalty=repetition_penalty, temperature=temperature
@@ -738,11 +850,11 @@ class Text2SemanticDecoder(nn.Module):
             if reserved_idx_of_batch_for_y is not None:
                 # index = torch.LongTensor(batch_idx_map).to(y.device)
                 y = torch.index_select(y, dim=0, index=reserved_idx_of_batch_for_y)
-                attn_mask = torch.index_select(attn_mask, dim=0, index=reserved_idx_of_batch_for_y)
+                n = reserved_idx_of_batch_for_y.shape[0]
+                decode_attn_mask[:n] = decode_attn_mask[reserved_idx_of_batch_for_y]
+                decode_attn_mask = decode_attn_mask[:n]
                 if k_cache is not None:
-                    for i in range(len(k_cache)):
-                        k_cache[i] = torch.index_select(k_cache[i], dim=0, index=reserved_idx_of_batch_for_y)
-                        v_cache[i] = torch.index_select(v_cache[i], dim=0, index=reserved_idx_of_batch_for_y)
+                    k_cache, v_cache = compact_static_kv_cache(k_cache, v_cache, reserved_idx_of_batch_for_y)
 
             if (early_stop_num != -1 and (y.shape[1] - prefix_len) > early_stop_num) or idx == 1499:
                 print("use early stop num:", early_stop_num)
@@ -917,6 +1029,96 @@ class Text2SemanticDecoder(nn.Module):
             return y[:, :-1], 0
         return y[:, :-1], idx
 
+    def infer_panel_stream(
+        self,
+        x: torch.LongTensor,  #####全部文本token
+        x_lens: torch.LongTensor,
+        prompts: torch.LongTensor,  ####参考音频token
+        bert_feature: torch.LongTensor,
+        top_k: int = -100,
+        top_p: int = 100,
+        early_stop_num: int = -1,
+        temperature: float = 1.0,
+        repetition_penalty: float = 1.35,
+        chunk_steps: int = 24,
+        **kwargs,
+    ):
+        """
+        Streaming version of `infer_panel_naive` for a single sentence (batch size 1).
+        Yields (new_tokens, is_last) every `chunk_steps` decoded tokens, new_tokens is a 1-D LongTensor
+        that never contains the final EOS token; the last yield may be empty.
+        """
+        x = self.ar_text_embedding(x)
+        x = x + self.bert_proj(bert_feature.transpose(1, 2))
+        x = self.ar_text_position(x)
+        x_len = x.shape[1]
+
+        y = prompts
+        if y is not None:
+            y_len = y.shape[1]
+            y_pos = self.ar_audio_position(self.ar_audio_embedding(y))
+            xy_pos = torch.concat([x, y_pos], dim=1)
+        else:
+            y_len = 0
+            xy_pos = x
+            y = torch.zeros(x.shape[0], 0, dtype=torch.long, device=x.device)
+        src_len = x_len + y_len
+
+        x_attn_mask_pad = F.pad(torch.zeros((x_len, x_len), dtype=torch.bool), (0, y_len), value=True)
+        y_attn_mask = F.pad(
+            torch.triu(torch.ones(y_len, y_len, dtype=torch.bool), diagonal=1),
+            (x_len, 0),
+            value=False,
+        )
+        xy_attn_mask = (
+            torch.concat([x_attn_mask_pad, y_attn_mask], dim=0)
+            .view(1, 1, src_len, src_len)
+            .to(device=x.device, dtype=torch.bool)
+        )
+
+        max_decode_steps = 1500 if early_stop_num == -1 else min(early_stop_num + 1, 1500)
+        xy_dec, k_cache, v_cache = self.t2s_transformer.process_prompt(xy_pos, xy_attn_mask, None)
+        k_cache, v_cache = alloc_static_kv_cache(k_cache, v_cache, src_len + max_decode_steps + 1)
+        cache_len = src_len
+
+        tokens = torch.zeros(max_decode_steps + 1, dtype=torch.long, device=x.device)
+        emitted = 0
+        for idx in range(max_decode_steps):
+            if idx > 0:
+                xy_dec = self.t2s_transformer.decode_next_token_static(xy_pos, k_cache, v_cache, cache_len, None)
+                cache_len += 1
+            logits = self.ar_predict_layer(xy_dec[:, -1])
+            if idx < 11:  ###至少预测出10个token不然不给停止（0.4s）
+                logits = logits[:, :-1]
+
+            samples = sample(
+                logits, y, top_k=top_k, top_p=top_p, repetition_penalty=repetition_penalty, temperature=temperature
+            )[0]
+            y = torch.concat([y, samples], dim=1)
+            tokens[idx] = samples[0, 0]
+
+            stop = False
+            if early_stop_num != -1 and idx + 1 > early_stop_num:
+                print("use early stop num:", early_stop_num)
+                stop = True
+            if torch.argmax(logits, dim=-1)[0] == self.EOS or samples[0, 0] == self.EOS:
+                stop = True
+            if stop:
+                print(f"T2S Decoding EOS [{y_len} -> {y.shape[1]}]")
+                ### 最后一个token（EOS）不输出，与 infer_panel_naive 的 y[:, :-1] 一致
+                yield tokens[emitted:idx], True
+                return
+            if idx + 1 - emitted >= chunk_steps:
+                yield tokens[emitted : idx + 1], False
+                emitted = idx + 1
+
+            y_emb = self.ar_audio_embedding(y[:, -1:])
+            xy_pos = y_emb * self.ar_audio_position.x_scale + self.ar_audio_position.alpha * self.ar_audio_position.pe[
+                :, y_len + idx
+            ].to(dtype=y_emb.dtype, device=y_emb.device)
+
+        yield tokens[emitted:max_decode_steps], True
+
     def infer_panel(
         self,
         x: torch.LongTensor,  #####全部文本token
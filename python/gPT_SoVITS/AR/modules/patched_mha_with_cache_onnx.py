@@ -1,3 +1,6 @@
+from typing import Optional, Tuple
+
+from torch import Tensor
 from torch.nn.functional import *
 from torch.nn.functional import (
     _canonical_mask,
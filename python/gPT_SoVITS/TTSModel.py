@@ -1,5 +1,8 @@
 import os
+import time
 import random
+import threading
+from collections import OrderedDict
 import numpy as np
 import soundfile as sf
 from TTS_infer_pack.TTS import TTS, TTS_Config
@@ -29,9 +32,21 @@ class TTSModel:
         print("模型配置为：")
         print(self.tts_config)
         print("正在初始化模型，请稍等...")
+        # bert / hubert / sv / 声码器由 TTS 内部的共享注册表提供，多个角色只各自加载 GPT/SoVITS 权重
         self.pipeline = TTS(self.tts_config)
         print("模型加载完成！")
 
+    def voice_bytes(self):
+        # 本角色独占的显存/内存：GPT + SoVITS 权重
+        total = 0
+        for model in [self.pipeline.t2s_model, self.pipeline.vits_model]:
+            if model is not None:
+                total += sum(p.element_size() * p.nelement() for p in model.parameters())
+        return total
+
+    def release(self):
+        self.pipeline.release()
+
 
     # ----------- 推理内部函数 ----------
     def _infer_once(self, **kwargs):
@@ -109,29 +124,120 @@ class TTSModel:
 
 
 class ModelManager:
-    """管理多个模型，可快速切换"""
-
-    def __init__(self):
-        self.models = {}
+    """管理多个模型，可快速切换
+
+    register 只记录角色配置，第一次使用时才加载（懒加载）；
+    已加载角色的 GPT/SoVITS 权重总量超过 memory_budget_mb 时，按 LRU 卸载空闲的角色，
+    下次使用时再重新加载。共享的 bert / hubert / sv / 声码器只加载一份，按引用计数释放。
+    """
+
+    def __init__(self, memory_budget_mb=None):
+        self.specs = {}  # 角色名 -> (version, gpt_path, sovits_path)
+        self.models = OrderedDict()  # 已加载的角色，按最近使用排序
+        self.in_use = {}  # 正在推理的角色计数，不会被卸载
+        self.retired = {}  # 重新注册时仍在推理的旧模型，推理结束后再卸载
+        self.loading = {}  # 正在加载的角色 -> {"spec", "done", "error"}，同名的并发请求等同一次加载
         self.current = None  # 当前模型名
+        self.memory_budget = int(
+            memory_budget_mb if memory_budget_mb is not None else os.environ.get("voice_memory_budget_mb", 4096)
+        ) * 1024 * 1024
+        self.lock = threading.RLock()
 
     # 注册模型
     def register(self, name, version, gpt_path, sovits_path, ):
-        self.models[name] = TTSModel(
-            version, gpt_path, sovits_path
-        )
+        with self.lock:
+            self.specs[name] = (version, gpt_path, sovits_path)
+            if name in self.models:
+                # 重新注册时卸载旧权重，下次使用时按新配置加载；正在推理的等推理结束再卸载
+                model = self.models.pop(name)
+                if self.in_use.get(name, 0) > 0:
+                    self.retired.setdefault(name, []).append(model)
+                else:
+                    model.release()
         print(f"【模型注册成功】→ {name}")
 
     # 选择模型
     def use(self, name):
-        if name not in self.models:
+        if name not in self.specs:
             raise ValueError(f"模型 '{name}' 未注册")
         self.current = name
         print(f"【切换模型】→ {name}")
 
+    def get(self, name, acquire=False):
+        """
+        取已加载的模型，没有则加载。加载在锁外进行，加载一个角色时其他角色照常推理；
+        acquire=True 时在同一次加锁里把 in_use 加一，返回前不会被卸载（用完需自行减一）
+        """
+        while True:
+            with self.lock:
+                if name not in self.specs:
+                    raise ValueError(f"模型 '{name}' 未注册")
+                if name in self.models:
+                    self.models.move_to_end(name)
+                    self.evict(keep=name)
+                    if acquire:
+                        self.in_use[name] = self.in_use.get(name, 0) + 1
+                    return self.models[name]
+                loading = self.loading.get(name)
+                owner = loading is None
+                if owner:
+                    loading = {"spec": self.specs[name], "done": threading.Event(), "error": None}
+                    self.loading[name] = loading
+
+            if not owner:
+                loading["done"].wait()
+                if loading["error"] is not None:
+                    raise loading["error"]
+                continue
+
+            t0 = time.perf_counter()
+            try:
+                model = TTSModel(*loading["spec"])
+            except BaseException as e:
+                with self.lock:
+                    del self.loading[name]
+                    loading["error"] = e
+                    loading["done"].set()
+                raise
+            with self.lock:
+                del self.loading[name]
+                if self.specs.get(name) == loading["spec"]:
+                    self.models[name] = model
+                else:
+                    model.release()  # 加载期间被重新注册，丢弃旧配置的模型，下一轮按新配置加载
+                loading["done"].set()
+            print(f"【加载模型】→ {name} 用时 {time.perf_counter() - t0:.2f}s")
+
+    def loaded_bytes(self):
+        with self.lock:
+            return sum(model.voice_bytes() for model in self.models.values())
+
+    # 超出显存预算时，按最近最少使用的顺序卸载空闲角色
+    def evict(self, keep=None):
+        with self.lock:
+            total = self.loaded_bytes()
+            for name in list(self.models.keys()):
+                if total <= self.memory_budget:
+                    break
+                if name == keep or self.in_use.get(name, 0) > 0:
+                    continue
+                model = self.models.pop(name)
+                total -= model.voice_bytes()
+                model.release()
+                print(f"【卸载模型】→ {name}")
+
     # 执行推理
     def synthesize(self, save_path, **kwargs):
         if not self.current:
             raise RuntimeError("未选择模型，请先调用 use(name)")
 
-        return self.models[self.current].synthesize(save_path, **kwargs)
\ No newline at end of file
+        name = self.current
+        model = self.get(name, acquire=True)
+        try:
+            return model.synthesize(save_path, **kwargs)
+        finally:
+            with self.lock:
+                self.in_use[name] -= 1
+                if self.in_use[name] == 0:
+                    for retired in self.retired.pop(name, []):
+                        retired.release()
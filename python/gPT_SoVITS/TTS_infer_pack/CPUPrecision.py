@@ -0,0 +1,125 @@
+"""
+Reduced-precision CPU inference for the T2S decoder and BERT.
+
+    int8: dynamic quantization with per-channel int8 weights. Activations are quantized
+        per call, the linears of every T2S block, `ar_predict_layer` and BERT run on the
+        fbgemm/onednn int8 kernels. The fp32 copies are dropped on conversion (including
+        the training-time `h` encoder of the decoder), so those weights shrink 4x.
+    bf16: the weights are cast to bfloat16, only used when the CPU has native bf16
+        instructions (avx512_bf16 / amx). `ar_predict_layer` stays fp32 so the
+        sampling logits are unchanged.
+"""
+
+import copy
+
+import torch
+import torch.nn.functional as F
+from torch import nn
+from torch.ao.quantization import per_channel_dynamic_qconfig, quantize_dynamic
+
+from AR.models.t2s_model import T2SBlock, T2SMLP, T2STransformer
+
+CPU_PRECISIONS = ["fp32", "int8", "bf16"]
+
+
+def bf16_supported() -> bool:
+    for name in ["_is_avx512_bf16_supported", "_is_amx_tile_supported"]:
+        checker = getattr(torch.cpu, name, None)
+        if checker is not None and checker():
+            return True
+    return False
+
+
+def resolve_cpu_precision(precision: str, device) -> str:
+    if str(device) != "cpu" or precision not in CPU_PRECISIONS:
+        return "fp32"
+    if precision == "bf16" and not bf16_supported():
+        print("Warning: this CPU has no native bf16 support, set cpu_precision to fp32.")
+        return "fp32"
+    return precision
+
+
+def int8_linear(weight: torch.Tensor, bias: torch.Tensor = None) -> nn.Module:
+    linear = nn.Linear(weight.shape[1], weight.shape[0], bias=bias is not None)
+    with torch.no_grad():
+        linear.weight.copy_(weight.float())
+        if bias is not None:
+            linear.bias.copy_(bias.float())
+    return quantize_dynamic(nn.Sequential(linear), {nn.Linear: per_channel_dynamic_qconfig}, dtype=torch.qint8)[0]
+
+
+class T2SMLPInt8(T2SMLP):
+    def __init__(self, mlp: T2SMLP):
+        super().__init__(None, None, None, None)
+        self.fc1 = int8_linear(mlp.w1, mlp.b1)
+        self.fc2 = int8_linear(mlp.w2, mlp.b2)
+
+    def forward(self, x):
+        return self.fc2(F.relu(self.fc1(x)))
+
+
+class T2SBlockInt8(T2SBlock):
+    def __init__(self, block: T2SBlock):
+        super().__init__(
+            block.num_heads,
+            block.hidden_dim,
+            T2SMLPInt8(block.mlp),
+            None,
+            None,
+            None,
+            None,
+            block.norm_w1,
+            block.norm_b1,
+            block.norm_eps1,
+            block.norm_w2,
+            block.norm_b2,
+            block.norm_eps2,
+        )
+        self.qkv = int8_linear(block.qkv_w, block.qkv_b)
+        self.out = int8_linear(block.out_w, block.out_b)
+
+    def in_proj(self, x):
+        return self.qkv(x)
+
+    def out_proj(self, x):
+        return self.out(x)
+
+
+class Float32Head(nn.Module):
+    """Runs a linear head in fp32 on top of a reduced-precision model."""
+
+    def __init__(self, linear: nn.Linear):
+        super().__init__()
+        self.linear = linear.float()
+
+    def forward(self, x):
+        return self.linear(x.float())
+
+
+def convert_t2s(model: nn.Module, precision: str) -> nn.Module:
+    """
+    Convert a loaded Text2SemanticDecoder in place.
+    Args:
+        model: the `t2s_model.model` decoder, already in eval mode on CPU.
+        precision: one of CPU_PRECISIONS.
+    """
+    if precision == "int8":
+        blocks = [T2SBlockInt8(block) for block in model.t2s_transformer.blocks]
+        model.t2s_transformer = T2STransformer(model.num_layers, blocks)
+        model.ar_predict_layer = int8_linear(model.ar_predict_layer.weight)
+        ### 推理只走 t2s_transformer，`h` 只剩训练的 forward 在用，留着就还占着一份 fp32 权重
+        model.h = None
+    elif precision == "bf16":
+        head = copy.deepcopy(model.ar_predict_layer)
+        model.to(torch.bfloat16)
+        model.ar_predict_layer = Float32Head(head)
+    return model
+
+
+def convert_bert(model: nn.Module, precision: str) -> nn.Module:
+    if precision == "int8":
+        model = quantize_dynamic(model, {nn.Linear: per_channel_dynamic_qconfig}, dtype=torch.qint8)
+    elif precision == "bf16":
+        model = model.to(torch.bfloat16)
+    model.cpu_precision = precision
+    return model
@@ -0,0 +1,178 @@
+"""
+ONNX Runtime backend for the graphs written by `onnx_export.py`:
+
+    {name}_t2s_encoder.onnx  T2SEncoder (phones + bert -> x)
+    {name}_t2s_fsdec.onnx    T2SFirstStageDecoder (prompt pass, first token)
+    {name}_t2s_sdec.onnx     T2SStageDecoder (one token per call)
+    {name}_vits.onnx         VitsModel (semantic + phones + reference audio -> audio), optional
+
+The exported graphs have batch size 1, so the rows of a batch are decoded one after another
+(no batching across rows). Per step only the last two tokens of y go host -> device (the stage
+graph embeds y[:, -1:]; its own sampling, whose result is not used, squeezes y and needs at
+least two tokens) and the logits come back; the KV caches, y_emb and x_example stay in
+ORT-owned device memory through IO binding, the outputs of one step are bound as the inputs of
+the next. The KV caches are not preallocated: the graph pads them by one position per step and
+writes the new key/value there, so every step still copies the whole cache on the device.
+"""
+
+import os
+from typing import List
+
+import numpy as np
+import torch
+
+from AR.models.utils import sample
+
+ORT_NUMPY_TYPES = {
+    "tensor(int64)": np.int64,
+    "tensor(int32)": np.int32,
+    "tensor(float)": np.float32,
+    "tensor(float16)": np.float16,
+}
+
+
+class OnnxSession:
+    def __init__(self, ort, path: str, providers: list, device_type: str, device_id: int):
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.ort = ort
+        self.session = ort.InferenceSession(path, sess_options=options, providers=providers)
+        self.input_types = {item.name: ORT_NUMPY_TYPES[item.type] for item in self.session.get_inputs()}
+        self.output_names = [item.name for item in self.session.get_outputs()]
+        self.device_type = device_type
+        self.device_id = device_id
+
+    def ortvalue(self, name: str, array):
+        if isinstance(array, torch.Tensor):
+            array = array.detach().cpu().numpy()
+        array = np.ascontiguousarray(array, dtype=self.input_types[name])
+        return self.ort.OrtValue.ortvalue_from_numpy(array, self.device_type, self.device_id)
+
+    def run(self, inputs: dict) -> list:
+        """
+        Run with IO binding, `inputs` maps input names to numpy arrays / tensors or OrtValues
+            returned by an earlier run. The outputs are OrtValues left on the session's device.
+        """
+        binding = self.session.io_binding()
+        for name, value in inputs.items():
+            if not isinstance(value, self.ort.OrtValue):
+                value = self.ortvalue(name, value)
+            binding.bind_ortvalue_input(name, value)
+        for name in self.output_names:
+            binding.bind_output(name, self.device_type, self.device_id)
+        self.session.run_with_iobinding(binding)
+        return binding.get_outputs()
+
+
+class OnnxBackend:
+    def __init__(self, onnx_dir: str, device: torch.device, eos: int, fallback=None):
+        """
+        Args:
+            onnx_dir: str, the `onnx/{name}` directory written by `onnx_export.py`.
+            device: torch.device, CUDA uses the CUDAExecutionProvider when onnxruntime-gpu is installed.
+            eos: int, the EOS token of the T2S model.
+            fallback: the torch Text2SemanticDecoder, used for reference-free prompts.
+        """
+        import onnxruntime as ort
+
+        name = os.path.basename(os.path.normpath(onnx_dir))
+        device = torch.device(device)
+        if device.type == "cuda" and "CUDAExecutionProvider" in ort.get_available_providers():
+            providers = [("CUDAExecutionProvider", {"device_id": device.index or 0}), "CPUExecutionProvider"]
+            device_type, device_id = "cuda", device.index or 0
+        else:
+            providers = ["CPUExecutionProvider"]
+            device_type, device_id = "cpu", 0
+        self.device = device
+        self.eos = eos
+        self.fallback = fallback
+
+        def load(suffix):
+            return OnnxSession(ort, os.path.join(onnx_dir, "%s_%s.onnx" % (name, suffix)), providers, device_type, device_id)
+
+        self.encoder = load("t2s_encoder")
+        self.first_stage_decoder = load("t2s_fsdec")
+        self.stage_decoder = load("t2s_sdec")
+        vits_path = os.path.join(onnx_dir, "%s_vits.onnx" % name)
+        self.vits = load("vits") if os.path.exists(vits_path) else None
+        print(f"Loaded ONNX graphs from {onnx_dir} ({providers[0] if isinstance(providers[0], str) else providers[0][0]})")
+
+    def infer_panel(
+        self,
+        x: List[torch.LongTensor],
+        x_lens: torch.LongTensor,
+        prompts: torch.LongTensor,
+        bert_feature: List[torch.Tensor],
+        top_k: int = -100,
+        top_p: int = 100,
+        early_stop_num: int = -1,
+        temperature: float = 1.0,
+        repetition_penalty: float = 1.35,
+        **kwargs,
+    ):
+        """
+        Same contract as `Text2SemanticDecoder.infer_panel_naive_batched`.
+        """
+        if prompts is None:
+            return self.fallback.infer_panel_naive_batched(
+                x, x_lens, prompts, bert_feature, top_k, top_p, early_stop_num, temperature, repetition_penalty, **kwargs
+            )
+        y_list = []
+        idx_list = []
+        for i in range(len(x)):
+            y, idx = self.infer_one(
+                x[i], prompts[i], bert_feature[i], top_k, top_p, early_stop_num, temperature, repetition_penalty
+            )
+            y_list.append(y)
+            idx_list.append(idx)
+        return y_list, idx_list
+
+    def infer_one(self, phones, prompt, bert_feature, top_k, top_p, early_stop_num, temperature, repetition_penalty):
+        ### 编码图把参考和目标文本拼起来，这里按第一个音素切开再交给它拼回去；
+        ### 参考的 semantic 已由 TTS 算好，图里 extract_latent 那一支只喂占位输入，输出的 prompts 不用
+        phones = phones.unsqueeze(0)
+        bert = bert_feature.float().transpose(0, 1)
+        x = self.encoder.run(
+            {
+                "ref_seq": phones[:, :1],
+                "text_seq": phones[:, 1:],
+                "ref_bert": bert[:1],
+                "text_bert": bert[1:],
+                "ssl_content": np.zeros((1, 768, 2), dtype=np.float32),
+            }
+        )[0]
+
+        prompt = prompt.unsqueeze(0)
+        prefix_len = prompt.shape[1]
+        ### 首步图内按导出时的参数采样出第一个 token，之后的 logits 回到主机按本次请求的参数采样
+        y, k, v, y_emb, x_example = self.first_stage_decoder.run({"x": x, "prompts": prompt})
+        y = torch.from_numpy(y.numpy()).long()
+        idx = 0
+        for idx in range(1, 1500):
+            ### 图里只用 y[:, -1:] 做 embedding，不必每步把整段 y 拷上设备；
+            ### 图内采样（结果不用）做重复惩罚时会 squeeze y，只传一个 token 会变成 0 维，所以传最后两个
+            _, k, v, y_emb, logits, _ = self.stage_decoder.run(
+                {"iy": y[:, -2:], "ik": k, "iv": v, "iy_emb": y_emb, "ix_example": x_example}
+            )
+            logits = torch.from_numpy(logits.numpy()).float()
+            if idx < 10:  ###至少预测出10个token不然不给停止（0.4s），首个token在图里采样，这里从idx=1开始
+                logits = logits[:, :-1]
+            samples = sample(
+                logits, y, top_k=top_k, top_p=top_p, repetition_penalty=repetition_penalty, temperature=temperature
+            )[0]
+            y = torch.concat([y, samples.long()], dim=1)
+            stop = early_stop_num != -1 and (y.shape[1] - prefix_len) > early_stop_num
+            if torch.argmax(logits, dim=-1)[0] == self.eos or samples[0, 0] == self.eos:
+                stop = True
+            if stop:
+                print(f"T2S Decoding EOS [{prefix_len} -> {y.shape[1]}]")
+                break
+        return y[0, :-1].to(self.device), idx
+
+    def decode(self, codes: torch.LongTensor, text: torch.LongTensor, ref_audio: torch.Tensor) -> torch.Tensor:
+        """
+        VITS decoding at speed 1, `ref_audio` is the mono reference at the model's sampling rate.
+            Returns [1, 1, samples] like `SynthesizerTrn.decode`.
+        """
+        audio = self.vits.run({"text_seq": text, "pred_semantic": codes, "ref_audio": ref_audio})[0]
+        return torch.from_numpy(audio.numpy()).float().to(self.device).view(1, 1, -1)
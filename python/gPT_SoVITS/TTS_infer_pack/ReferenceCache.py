@@ -0,0 +1,77 @@
+import os
+import hashlib
+from typing import Any, Dict, Optional
+
+import torch
+
+from tools.lru_cache import ByteLRUCache
+
+
+class ReferenceCache(ByteLRUCache):
+    """
+    Process-wide LRU store for reference audio features, shared by every TTS instance.
+
+    Entries are keyed by the content hash of the reference file plus a model tag, and hold
+    whatever the pipeline extracted from it (prompt_semantic, refer_spec, 16k audio, sv embedding);
+    prompt text features live in the text feature cache. When the byte budget is exceeded the least recently used
+    entries are dropped, or written to `spill_dir` and loaded back on the next hit.
+    """
+
+    def __init__(self, max_bytes: int = 512 * 1024 * 1024, spill_dir: str = None):
+        super().__init__(max_bytes, spill_dir)
+        self.spill_dir = spill_dir
+        self._file_hashes: Dict[tuple, str] = {}
+        ### put 过、还没写到 spill_dir 的 key，淘汰时必须重写，不能沿用旧的 spill 文件
+        self._dirty: set = set()
+        self.spills: int = 0
+
+    def file_hash(self, path: str) -> str:
+        stat = os.stat(path)
+        memo_key = (os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+        with self.lock:
+            if memo_key in self._file_hashes:
+                return self._file_hashes[memo_key]
+        sha1 = hashlib.sha1()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                sha1.update(block)
+        digest = sha1.hexdigest()
+        with self.lock:
+            self._file_hashes[memo_key] = digest
+        return digest
+
+    def get(self, key: str, device: torch.device = None) -> Optional[Dict[str, Any]]:
+        """Returns a shallow copy, callers fill in missing features and `put` it back."""
+        with self.lock:
+            entry = super().get(key, device)
+            return None if entry is None else dict(entry)
+
+    def put(self, key: str, entry: Dict[str, Any]):
+        with self.lock:
+            self._dirty.add(key)
+            super().put(key, dict(entry))
+
+    def clear(self):
+        with self.lock:
+            super().clear()
+            self._dirty.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            stats = super().stats()
+            stats["spills"] = self.spills
+            return stats
+
+    def on_evict(self, key: str, entry: Dict[str, Any]):
+        dirty = key in self._dirty
+        self._dirty.discard(key)
+        if self.spill_dir is None or (not dirty and os.path.exists(self._disk_path(key))):
+            return
+        self._write(key, entry)
+        self.spills += 1
+
+
+reference_cache = ReferenceCache(
+    max_bytes=int(os.environ.get("ref_cache_max_mb", 512)) * 1024 * 1024,
+    spill_dir=os.environ.get("ref_cache_dir", None),
+)
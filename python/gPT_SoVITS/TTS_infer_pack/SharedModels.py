@@ -0,0 +1,49 @@
+import gc
+import threading
+from typing import Any, Callable, Dict, Hashable
+
+import torch
+
+
+class SharedModelRegistry:
+    """
+    Process-wide registry of the frozen components every voice uses in the same way
+    (bert, cnhubert, SV model, vocoder).
+
+    A component is loaded the first time a TTS instance acquires its key and is reference
+    counted from then on; it is freed when the last instance releases it. The key should
+    contain everything that makes two loads differ (path, device, precision).
+    """
+
+    def __init__(self):
+        self.models: Dict[Hashable, Any] = {}
+        self.refcounts: Dict[Hashable, int] = {}
+        self.lock = threading.RLock()
+
+    def acquire(self, key: Hashable, loader: Callable[[], Any]) -> Any:
+        with self.lock:
+            if key not in self.models:
+                self.models[key] = loader()
+                self.refcounts[key] = 0
+            self.refcounts[key] += 1
+            return self.models[key]
+
+    def release(self, key: Hashable):
+        with self.lock:
+            if key not in self.refcounts:
+                return
+            self.refcounts[key] -= 1
+            if self.refcounts[key] > 0:
+                return
+            del self.refcounts[key]
+            del self.models[key]
+        gc.collect()
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+
+    def stats(self) -> Dict[Hashable, int]:
+        with self.lock:
+            return dict(self.refcounts)
+
+
+shared_models = SharedModelRegistry()
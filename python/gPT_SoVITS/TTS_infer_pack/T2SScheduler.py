@@ -0,0 +1,369 @@
+import os
+import sys
+import queue
+import threading
+import traceback
+
+now_dir = os.getcwd()
+sys.path.append(now_dir)
+
+from typing import List, Optional, Tuple
+
+import torch
+import torch.nn.functional as F
+from AR.models.t2s_model import Text2SemanticDecoder, alloc_static_kv_cache, compact_static_kv_cache
+from AR.models.utils import sample
+
+
+class T2SRequest:
+    """
+    One sentence waiting for (or going through) the shared T2S decode loop.
+    Each request carries its own prompt semantic, phones, bert features and sampling settings.
+    """
+
+    def __init__(
+        self,
+        x: torch.LongTensor,
+        bert_feature: torch.Tensor,
+        prompt: Optional[torch.LongTensor],
+        top_k: int = 5,
+        top_p: float = 1.0,
+        temperature: float = 1.0,
+        repetition_penalty: float = 1.35,
+        early_stop_num: int = -1,
+    ):
+        self.x = x
+        self.bert_feature = bert_feature
+        self.prompt = prompt
+        self.top_k = top_k
+        self.top_p = top_p
+        self.temperature = temperature
+        self.repetition_penalty = repetition_penalty
+        self.early_stop_num = early_stop_num
+
+        self.prefix_len: int = 0 if prompt is None else prompt.shape[-1]
+        self.y: torch.LongTensor = None  ### 预分配的 [prefix_len + max_steps] token 缓冲区
+        self.y_len: int = 0
+        self.steps: int = 0
+
+        self.result: Tuple[torch.LongTensor, int] = None
+        self.error: Exception = None
+        self.cancelled: bool = False  ### 调用方等待超时后置位，解码循环把这一行当作已结束
+        self.done = threading.Event()
+
+    def wait(self, timeout: float = None) -> Tuple[torch.LongTensor, int]:
+        if not self.done.wait(timeout):
+            self.cancelled = True
+            raise TimeoutError("T2S request timed out")
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+class T2SScheduler:
+    """
+    Continuous-batching scheduler for Text2SemanticDecoder.
+
+    A single background thread keeps one decode loop alive. Sentences submitted by
+    any number of concurrent `TTS.run` calls are prefilled one by one and then join
+    the running batch between two decode steps; finished rows leave the batch right away.
+
+    Rows are right aligned inside the shared kv cache, every row keeps its own
+    left-padding length, so rows with different prompt lengths can live in one batch.
+    The kv cache is preallocated for the longest possible remaining decode of the batch
+    and only rebuilt when a new row joins.
+
+    `stop` fails every running and pending request, and later submissions raise, so callers
+    never wait on a scheduler that is gone. `infer_panel` waits at most `wait_timeout` seconds.
+    """
+
+    def __init__(
+        self, model: Text2SemanticDecoder, max_batch_size: int = 32, max_steps: int = 1500, wait_timeout: float = 600.0
+    ):
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_steps = max_steps
+        self.wait_timeout = wait_timeout
+
+        self.pending: "queue.Queue[T2SRequest]" = queue.Queue()
+        self.running: List[T2SRequest] = []
+        self.k_cache: List[torch.Tensor] = None
+        self.v_cache: List[torch.Tensor] = None
+        self.cache_len: int = 0  ### kv cache 中已写入的长度（含左侧padding）
+        self.pad_len: torch.LongTensor = None  ### 每一行 kv cache 左侧 padding 的长度
+        self.attn_mask: torch.Tensor = None
+
+        self._stop_event = threading.Event()
+        self._thread: threading.Thread = None
+        self._lock = threading.Lock()  ### submit 与 stop 互斥，stop 之后不会再有请求进入 pending
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._loop, name="T2SScheduler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        with self._lock:
+            self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        ### 解码线程已退出，还在 batch 里和排队的请求都以错误结束
+        error = RuntimeError("T2S scheduler stopped")
+        requests = self.running
+        while True:
+            try:
+                requests.append(self.pending.get_nowait())
+            except queue.Empty:
+                break
+        for request in requests:
+            request.error = error
+            request.done.set()
+        self._reset_cache()
+
+    def submit(self, x: torch.LongTensor, bert_feature: torch.Tensor, prompt: Optional[torch.LongTensor], **kwargs):
+        request = T2SRequest(x, bert_feature, prompt, **kwargs)
+        with self._lock:
+            if self._stop_event.is_set():
+                raise RuntimeError("T2S scheduler stopped")
+            self.pending.put(request)
+            self.start()
+        return request
+
+    def infer_panel(
+        self,
+        x: List[torch.LongTensor],  #####全部文本token
+        x_lens: torch.LongTensor,
+        prompts: torch.LongTensor,  ####参考音频token
+        bert_feature: List[torch.Tensor],
+        top_k: int = -100,
+        top_p: int = 100,
+        early_stop_num: int = -1,
+        temperature: float = 1.0,
+        repetition_penalty: float = 1.35,
+        **kwargs,
+    ):
+        """
+        Drop-in replacement for `Text2SemanticDecoder.infer_panel_batch_infer`,
+        returns (y_list, idx_list) once every sentence of this call has finished.
+        """
+        requests = [
+            self.submit(
+                x[i],
+                bert_feature[i],
+                prompts[i] if prompts is not None else None,
+                top_k=top_k,
+                top_p=top_p,
+                temperature=temperature,
+                repetition_penalty=repetition_penalty,
+                early_stop_num=early_stop_num,
+            )
+            for i in range(len(x))
+        ]
+        y_list = []
+        idx_list = []
+        for request in requests:
+            y, idx = request.wait(self.wait_timeout)
+            y_list.append(y)
+            idx_list.append(idx)
+        return y_list, idx_list
+
+    def _loop(self):
+        with torch.no_grad():
+            while not self._stop_event.is_set():
+                try:
+                    self._admit()
+                    if len(self.running) == 0:
+                        continue
+                    self._step()
+                except Exception as e:
+                    traceback.print_exc()
+                    for request in self.running:
+                        request.error = e
+                        request.done.set()
+                    self._reset_cache()
+
+    def _admit(self):
+        while len(self.running) < self.max_batch_size:
+            try:
+                ### 没有正在解码的序列时阻塞等待，避免空转
+                block = len(self.running) == 0
+                request = self.pending.get(block=block, timeout=0.1 if block else None)
+            except queue.Empty:
+                return
+            if request.cancelled:
+                continue
+            try:
+                self._prefill(request)
+            except Exception as e:
+                traceback.print_exc()
+                request.error = e
+                request.done.set()
+
+    def _prefill(self, request: T2SRequest):
+        model = self.model
+        device = model.ar_predict_layer.weight.device
+
+        x = model.ar_text_embedding(request.x.unsqueeze(0).to(device))
+        x = x + model.bert_proj(request.bert_feature.to(device).transpose(0, 1).unsqueeze(0))
+        x = model.ar_text_position(x)
+        x_len = x.shape[1]
+
+        request.y = torch.zeros(request.prefix_len + self.max_steps + 1, dtype=torch.long, device=device)
+        if request.prompt is not None:
+            y = request.prompt.to(device).unsqueeze(0)
+            request.y[: request.prefix_len] = y[0]
+            y_pos = model.ar_audio_position(model.ar_audio_embedding(y))
+            xy_pos = torch.concat([x, y_pos], dim=1)
+        else:
+            xy_pos = x
+        request.y_len = request.prefix_len
+        y_len = request.prefix_len
+        src_len = x_len + y_len
+
+        x_mask = F.pad(torch.zeros(x_len, x_len, dtype=torch.bool, device=device), (0, y_len), value=True)
+        y_mask = F.pad(
+            torch.triu(torch.ones(y_len, y_len, dtype=torch.bool, device=device), diagonal=1),
+            (x_len, 0),
+            value=False,
+        )
+        attn_mask = torch.concat([x_mask, y_mask], dim=0).view(1, 1, src_len, src_len)
+
+        xy_dec, k_cache, v_cache = model.t2s_transformer.process_prompt(xy_pos, attn_mask, None)
+        logits = model.ar_predict_layer(xy_dec[:, -1])[:, :-1]  ###第一步不允许生成EOS
+        if not self._sample_and_check(request, logits[0]):
+            self._finish(request)
+            return
+
+        ####### 并入正在运行的batch（右对齐，左侧padding）
+        self.running.append(request)
+        if len(self.running) == 1:
+            pad_len = torch.zeros(1, dtype=torch.long, device=device)
+        else:
+            run_k = [k[:, : self.cache_len] for k in self.k_cache]
+            run_v = [v[:, : self.cache_len] for v in self.v_cache]
+            ### 去掉所有行共有的左侧padding，避免kv cache无限增长
+            shift = int(self.pad_len.min())
+            run_len = self.cache_len - shift
+            max_len = max(run_len, src_len)
+            for i in range(len(k_cache)):
+                k_cache[i] = torch.cat(
+                    [
+                        F.pad(run_k[i][:, shift:], (0, 0, max_len - run_len, 0), value=0),
+                        F.pad(k_cache[i], (0, 0, max_len - src_len, 0), value=0),
+                    ],
+                    dim=0,
+                )
+                v_cache[i] = torch.cat(
+                    [
+                        F.pad(run_v[i][:, shift:], (0, 0, max_len - run_len, 0), value=0),
+                        F.pad(v_cache[i], (0, 0, max_len - src_len, 0), value=0),
+                    ],
+                    dim=0,
+                )
+            pad_len = torch.cat(
+                [self.pad_len - shift + (max_len - run_len), self.pad_len.new_tensor([max_len - src_len])]
+            )
+        self.pad_len = pad_len
+        self.cache_len = k_cache[0].shape[1]
+        capacity = self.cache_len + self._max_remaining_steps() + 1
+        self.k_cache, self.v_cache = alloc_static_kv_cache(k_cache, v_cache, capacity)
+        ### 解码阶段只需屏蔽每行左侧的padding，mask 随 kv cache 一起预分配，每步取视图
+        self.attn_mask = (torch.arange(capacity, device=device).unsqueeze(0) < self.pad_len.unsqueeze(1)).view(
+            -1, 1, 1, capacity
+        )
+
+    def _max_remaining_steps(self) -> int:
+        remaining = 0
+        for request in self.running:
+            limit = self.max_steps if request.early_stop_num == -1 else min(request.early_stop_num + 1, self.max_steps)
+            remaining = max(remaining, limit - request.steps)
+        return remaining
+
+    def _reset_cache(self):
+        self.running = []
+        self.k_cache = None
+        self.v_cache = None
+        self.cache_len = 0
+        self.pad_len = None
+        self.attn_mask = None
+
+    def _step(self):
+        model = self.model
+        device = self.pad_len.device
+        bsz = len(self.running)
+
+        last_tokens = torch.stack([request.y[request.y_len - 1] for request in self.running]).view(bsz, 1)
+        positions = torch.tensor([request.y_len - 1 for request in self.running], dtype=torch.long, device=device)
+        y_emb = model.ar_audio_embedding(last_tokens)
+        pe = model.ar_audio_position.pe[0].to(dtype=y_emb.dtype, device=device)
+        xy_pos = y_emb * model.ar_audio_position.x_scale + model.ar_audio_position.alpha * pe[positions].unsqueeze(1)
+
+        xy_dec = model.t2s_transformer.decode_next_token_static(
+            xy_pos, self.k_cache, self.v_cache, self.cache_len, self.attn_mask[..., : self.cache_len + 1]
+        )
+        self.cache_len += 1
+        logits = model.ar_predict_layer(xy_dec[:, -1])
+
+        reserved_idx = []
+        for i, request in enumerate(self.running):
+            if self._sample_and_check(request, logits[i]):
+                reserved_idx.append(i)
+            else:
+                self._finish(request)
+
+        ####### 移除batch中已经生成完毕的序列，在原缓冲区内压缩kv cache
+        if len(reserved_idx) == bsz:
+            return
+        if len(reserved_idx) == 0:
+            self._reset_cache()
+            return
+        self.running = [self.running[i] for i in reserved_idx]
+        index = torch.tensor(reserved_idx, dtype=torch.long, device=device)
+        self.pad_len = torch.index_select(self.pad_len, dim=0, index=index)
+        self.k_cache, self.v_cache = compact_static_kv_cache(self.k_cache, self.v_cache, index)
+        self.attn_mask[: len(reserved_idx)] = self.attn_mask[index]
+        self.attn_mask = self.attn_mask[: len(reserved_idx)]
+
+    def _sample_and_check(self, request: T2SRequest, logits: torch.Tensor) -> bool:
+        """
+        Sample the next token of one row with the row's own settings.
+        Returns False when the row has finished.
+        """
+        logits = logits.unsqueeze(0)
+        previous_tokens = request.y[: request.y_len].unsqueeze(0)
+        samples = sample(
+            logits,
+            previous_tokens,
+            top_k=request.top_k,
+            top_p=request.top_p,
+            repetition_penalty=request.repetition_penalty,
+            temperature=request.temperature,
+        )[0]
+        token = torch.argmax(logits, dim=-1)
+        request.y[request.y_len] = samples[0, 0]
+        request.y_len += 1
+        request.steps += 1
+
+        if request.cancelled:
+            return False
+        if samples[0, 0] == self.model.EOS or token[0] == self.model.EOS:
+            return False
+        if request.early_stop_num != -1 and request.steps > request.early_stop_num:
+            print("use early stop num:", request.early_stop_num)
+            return False
+        if request.steps >= self.max_steps:
+            return False
+        return True
+
+    def _finish(self, request: T2SRequest):
+        idx = request.steps - 1
+        y = request.y[: request.y_len - 1]
+        print(f"T2S Decoding EOS [{request.prefix_len} -> {request.y_len}]")
+        if request.prefix_len == 0:
+            idx = 0
+        request.result = (y, idx)
+        request.y = None
+        request.done.set()
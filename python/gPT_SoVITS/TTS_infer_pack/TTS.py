@@ -1,9 +1,14 @@
+import contextlib
 import gc
 import math
 import os
+import queue
 import random
 import sys
+import threading
 import time
+
+_import_t0 = time.perf_counter()
 import traceback
 from copy import deepcopy
 
@@ -22,20 +27,32 @@ import torch
 import torch.nn.functional as F
 import yaml
 from AR.models.t2s_lightning_module import Text2SemanticLightningModule
-from BigVGAN.bigvgan import BigVGAN
 from feature_extractor.cnhubert import CNHubert
 from module.mel_processing import mel_spectrogram_torch, spectrogram_torch
+from module.infer_prep import prepare_for_inference
 from module.models import SynthesizerTrn, SynthesizerTrnV3, Generator
-from peft import LoraConfig, get_peft_model
-from process_ckpt import get_sovits_version_from_path_fast, load_sovits_new
+from process_ckpt import (
+    get_sovits_version_from_path_fast,
+    is_infer_ckpt,
+    load_infer_ckpt,
+    load_mmap,
+    load_sovits_new,
+)
 from transformers import AutoModelForMaskedLM, AutoTokenizer
 
-from tools.audio_sr import AP_BWE
 from tools.i18n.i18n import I18nAuto, scan_language_list
 from TTS_infer_pack.text_segmentation_method import splits
 from TTS_infer_pack.TextPreprocessor import TextPreprocessor
+from TTS_infer_pack.CPUPrecision import convert_bert, convert_t2s, resolve_cpu_precision
+from TTS_infer_pack.OnnxBackend import OnnxBackend
+from TTS_infer_pack.T2SScheduler import T2SScheduler
+from TTS_infer_pack.ReferenceCache import reference_cache
+from TTS_infer_pack.SharedModels import shared_models
 from sv import SV
 
+### BigVGAN（仅v3）、peft（仅LoRA权重）、AP_BWE（仅超分）在用到时才导入
+import_time = time.perf_counter() - _import_t0
+
 resample_transform_dict = {}
 
 
@@ -191,6 +208,19 @@ v4:
 """
 
 
+def _record_stream(value, stream):
+    ### 张量由 T2S 线程的 stream 分配、在当前 stream 上使用，释放前需要让分配器知道
+    if isinstance(value, torch.Tensor):
+        if value.is_cuda:
+            value.record_stream(stream)
+    elif isinstance(value, (list, tuple)):
+        for v in value:
+            _record_stream(v, stream)
+    elif isinstance(value, dict):
+        for v in value.values():
+            _record_stream(v, stream)
+
+
 def set_seed(seed: int):
     seed = int(seed)
     seed = seed if seed != -1 else random.randint(0, 2**32 - 1)
@@ -330,6 +360,18 @@ class TTS_Config:
         self.bert_base_path = self.configs.get("bert_base_path", None)
         self.cnhuhbert_base_path = self.configs.get("cnhuhbert_base_path", None)
         self.languages = self.v1_languages if self.version == "v1" else self.v2_languages
+        ### 加载SoVITS后的推理整理：去掉enc_q、折叠weight_norm。prepare_infer/compile_vits默认关闭，
+        ### 打开prepare_infer时默认做数值校验，不一致就退回未整理的模型
+        self.prepare_infer: bool = self.configs.get("prepare_infer", False)
+        self.compile_vits: bool = self.configs.get("compile_vits", False)
+        self.verify_prepare: bool = self.configs.get("verify_prepare", True)
+        ### CPU 上 T2S 和 BERT 的精度：fp32 / int8（动态量化）/ bf16，GPU 上不生效
+        self.cpu_precision: str = self.configs.get("cpu_precision", "fp32")
+        ### 推理后端：torch / onnxruntime，onnxruntime 读取 onnx_export.py 导出到 onnx_dir 的图
+        self.backend: str = self.configs.get("backend", "torch")
+        self.onnx_dir: str = self.configs.get("onnx_dir", None)
+        assert self.backend in ["torch", "onnxruntime"], "Invalid backend!"
+        assert self.backend == "torch" or self.onnx_dir, "onnx_dir is required by the onnxruntime backend"
 
         self.use_vocoder: bool = False
 
@@ -387,6 +429,12 @@ class TTS_Config:
             "vits_weights_path": self.vits_weights_path,
             "bert_base_path": self.bert_base_path,
             "cnhuhbert_base_path": self.cnhuhbert_base_path,
+            "prepare_infer": self.prepare_infer,
+            "compile_vits": self.compile_vits,
+            "verify_prepare": self.verify_prepare,
+            "cpu_precision": self.cpu_precision,
+            "backend": self.backend,
+            "onnx_dir": self.onnx_dir,
         }
         return self.config
 
@@ -425,9 +473,13 @@ class TTS:
         self.bert_model: AutoModelForMaskedLM = None
         self.cnhuhbert_model: CNHubert = None
         self.vocoder = None
-        self.sr_model: AP_BWE = None
+        self.sr_model = None
         self.sv_model = None
         self.sr_model_not_exist: bool = False
+        self.t2s_scheduler: T2SScheduler = None
+        self.onnx_backend: OnnxBackend = None
+        self.shared_keys: dict = {}  ### 本实例持有的共享模型 key（bert/cnhubert/sv/vocoder）
+        self.cfm_max_batch: int = int(os.environ.get("cfm_max_batch", 64))  ### 一次 CFM 采样最多的块数
 
         self.vocoder_configs: dict = {
             "sr": None,
@@ -437,16 +489,25 @@ class TTS:
             "overlapped_len": None,
         }
 
+        self.startup_timings: dict = {"imports": import_time}  ### 冷启动各阶段耗时
+        t0 = time.perf_counter()
         self._init_models()
 
         self.text_preprocessor: TextPreprocessor = TextPreprocessor(
             self.bert_model, self.bert_tokenizer, self.configs.device
         )
+        self.startup_timings["total"] = import_time + time.perf_counter() - t0
+        print(
+            "TTS startup: "
+            + ", ".join(["%s %.2fs" % (phase, cost) for phase, cost in self.startup_timings.items()])
+        )
 
         self.prompt_cache: dict = {
             "ref_audio_path": None,
             "prompt_semantic": None,
             "refer_spec": [],
+            "sv_emb": [],
+            "ge": None,
             "prompt_text": None,
             "prompt_lang": None,
             "phones": None,
@@ -456,48 +517,116 @@ class TTS:
         }
 
         self.stop_flag: bool = False
+        self.stream_timings: List[dict] = []  ### 流式模式下每个音频块的耗时
         self.precision: torch.dtype = torch.float16 if self.configs.is_half else torch.float32
 
     def _init_models(
         self,
     ):
-        self.init_t2s_weights(self.configs.t2s_weights_path)
-        self.init_vits_weights(self.configs.vits_weights_path)
-        self.init_bert_weights(self.configs.bert_base_path)
-        self.init_cnhuhbert_weights(self.configs.cnhuhbert_base_path)
+        for phase, init, path in [
+            ("t2s", self.init_t2s_weights, self.configs.t2s_weights_path),
+            ("vits", self.init_vits_weights, self.configs.vits_weights_path),
+            ("bert", self.init_bert_weights, self.configs.bert_base_path),
+            ("cnhubert", self.init_cnhuhbert_weights, self.configs.cnhuhbert_base_path),
+        ] + ([("onnx", self.init_onnx_backend, self.configs.onnx_dir)] if self.configs.backend == "onnxruntime" else []):
+            t0 = time.perf_counter()
+            init(path)
+            self.startup_timings[phase] = time.perf_counter() - t0
         # self.enable_half_precision(self.configs.is_half)
 
+    def _acquire_shared(self, kind: str, key: tuple, loader):
+        """
+        Get a frozen component from the process-wide registry, so every TTS instance
+            (one per voice) shares the same bert / cnhubert / sv / vocoder weights.
+        """
+        key = (kind,) + key
+        old_key = self.shared_keys.get(kind, None)
+        if old_key == key:
+            return shared_models.models[key]
+        model = shared_models.acquire(key, loader)
+        if old_key is not None:
+            shared_models.release(old_key)
+        self.shared_keys[kind] = key
+        return model
+
+    def _release_shared(self, kind: str):
+        key = self.shared_keys.pop(kind, None)
+        if key is not None:
+            shared_models.release(key)
+
+    def release(self):
+        """
+        Drop this instance's models and its references to the shared components.
+        """
+        self.disable_continuous_batching()
+        for kind in list(self.shared_keys.keys()):
+            self._release_shared(kind)
+        self.t2s_model = None
+        self.vits_model = None
+        self.bert_model = None
+        self.bert_tokenizer = None
+        self.cnhuhbert_model = None
+        self.sv_model = None
+        self.vocoder = None
+        self.empty_cache()
+
     def init_cnhuhbert_weights(self, base_path: str):
-        print(f"Loading CNHuBERT weights from {base_path}")
-        self.cnhuhbert_model = CNHubert(base_path)
-        self.cnhuhbert_model = self.cnhuhbert_model.eval()
-        self.cnhuhbert_model = self.cnhuhbert_model.to(self.configs.device)
-        if self.configs.is_half and str(self.configs.device) != "cpu":
-            self.cnhuhbert_model = self.cnhuhbert_model.half()
+        def load():
+            print(f"Loading CNHuBERT weights from {base_path}")
+            cnhuhbert_model = CNHubert(base_path)
+            cnhuhbert_model = cnhuhbert_model.eval()
+            cnhuhbert_model = cnhuhbert_model.to(self.configs.device)
+            if self.configs.is_half and str(self.configs.device) != "cpu":
+                cnhuhbert_model = cnhuhbert_model.half()
+            return cnhuhbert_model
+
+        self.cnhuhbert_model = self._acquire_shared(
+            "cnhubert", (os.path.abspath(base_path), str(self.configs.device), self.configs.is_half), load
+        )
 
     def init_bert_weights(self, base_path: str):
-        print(f"Loading BERT weights from {base_path}")
         # Normalize to absolute path to avoid HF treating it as repo_id
         abs_path = os.path.abspath(base_path)
-        if os.path.isdir(abs_path):
-            try:
-                self.bert_tokenizer = AutoTokenizer.from_pretrained(abs_path, local_files_only=True)
-                self.bert_model = AutoModelForMaskedLM.from_pretrained(abs_path, local_files_only=True)
-            except Exception as e:
-                print(f"Local BERT load failed from {abs_path}: {e}\nTrying remote repo 'hfl/chinese-roberta-wwm-ext-large'.")
-                self.bert_tokenizer = AutoTokenizer.from_pretrained("hfl/chinese-roberta-wwm-ext-large")
-                self.bert_model = AutoModelForMaskedLM.from_pretrained("hfl/chinese-roberta-wwm-ext-large")
-        else:
-            # If path invalid, fall back to known HF repo id.
-            print(f"Path {abs_path} not found. Falling back to remote 'hfl/chinese-roberta-wwm-ext-large'.")
-            self.bert_tokenizer = AutoTokenizer.from_pretrained("hfl/chinese-roberta-wwm-ext-large")
-            self.bert_model = AutoModelForMaskedLM.from_pretrained("hfl/chinese-roberta-wwm-ext-large")
-        self.bert_model = self.bert_model.eval().to(self.configs.device)
-        if self.configs.is_half and str(self.configs.device) != "cpu":
-            self.bert_model = self.bert_model.half()
+
+        def load():
+            print(f"Loading BERT weights from {base_path}")
+            if os.path.isdir(abs_path):
+                try:
+                    bert_tokenizer = AutoTokenizer.from_pretrained(abs_path, local_files_only=True)
+                    bert_model = AutoModelForMaskedLM.from_pretrained(abs_path, local_files_only=True)
+                except Exception as e:
+                    print(f"Local BERT load failed from {abs_path}: {e}\nTrying remote repo 'hfl/chinese-roberta-wwm-ext-large'.")
+                    bert_tokenizer = AutoTokenizer.from_pretrained("hfl/chinese-roberta-wwm-ext-large")
+                    bert_model = AutoModelForMaskedLM.from_pretrained("hfl/chinese-roberta-wwm-ext-large")
+            else:
+                # If path invalid, fall back to known HF repo id.
+                print(f"Path {abs_path} not found. Falling back to remote 'hfl/chinese-roberta-wwm-ext-large'.")
+                bert_tokenizer = AutoTokenizer.from_pretrained("hfl/chinese-roberta-wwm-ext-large")
+                bert_model = AutoModelForMaskedLM.from_pretrained("hfl/chinese-roberta-wwm-ext-large")
+            bert_model = bert_model.eval().to(self.configs.device)
+            if self.configs.is_half and str(self.configs.device) != "cpu":
+                bert_model = bert_model.half()
+            bert_model = convert_bert(bert_model, cpu_precision)
+            return bert_tokenizer, bert_model
+
+        cpu_precision = resolve_cpu_precision(self.configs.cpu_precision, self.configs.device)
+        self.bert_tokenizer, self.bert_model = self._acquire_shared(
+            "bert", (abs_path, str(self.configs.device), self.configs.is_half, cpu_precision), load
+        )
+        if getattr(self, "text_preprocessor", None) is not None:
+            self.text_preprocessor.bert_model = self.bert_model
+            self.text_preprocessor.tokenizer = self.bert_tokenizer
+            self.text_preprocessor.device = self.configs.device
 
     def init_vits_weights(self, weights_path: str):
         self.configs.vits_weights_path = weights_path
+        if (
+            self.onnx_backend is not None
+            and self.onnx_backend.vits is not None
+            and os.path.abspath(weights_path) != self.onnx_backend.vits_weights_path
+        ):
+            print("Warning: the ONNX VITS graph was exported from other SoVITS weights, decoding with torch.")
+            self.onnx_backend.vits = None
         version, model_version, if_lora_v3 = get_sovits_version_from_path_fast(weights_path)
         if "Pro" in model_version:
             self.init_sv_model()
@@ -508,7 +637,9 @@ class TTS:
             raise FileExistsError(info)
 
         # dict_s2 = torch.load(weights_path, map_location=self.configs.device,weights_only=False)
-        dict_s2 = load_sovits_new(weights_path)
+        ###process_ckpt导出的推理权重：fp16、LoRA已合并，直接映射到模型上
+        infer_ckpt = is_infer_ckpt(weights_path)
+        dict_s2 = load_infer_ckpt(weights_path) if infer_ckpt else load_sovits_new(weights_path)
         hps = dict_s2["config"]
         hps["model"]["semantic_frame_rate"] = "25hz"
         if "enc_p.text_embedding.weight" not in dict_s2["weight"]:
@@ -549,6 +680,9 @@ class TTS:
                 **kwargs,
             )
             self.configs.use_vocoder = False
+            ### 从 v3/v4 切回来时不再持有声码器
+            self._release_shared("vocoder")
+            self.vocoder = None
         else:
             kwargs["version"] = model_version
             vits_model = SynthesizerTrnV3(
@@ -563,15 +697,21 @@ class TTS:
                 del vits_model.enc_q
 
         self.is_v2pro = model_version in {"v2Pro", "v2ProPlus"}
+        if getattr(self, "prompt_cache", None) is not None:
+            self.prompt_cache["ge"] = None
 
         if if_lora_v3 == False:
+            ### 半精度推理时fp16权重无需再拷贝进fp32参数
+            assign = infer_ckpt and self.configs.is_half and str(self.configs.device) != "cpu"
             print(
-                f"Loading VITS weights from {weights_path}. {vits_model.load_state_dict(dict_s2['weight'], strict=False)}"
+                f"Loading VITS weights from {weights_path}. {vits_model.load_state_dict(dict_s2['weight'], strict=False, assign=assign)}"
             )
         else:
             print(
                 f"Loading VITS pretrained weights from {weights_path}. {vits_model.load_state_dict(load_sovits_new(path_sovits)['weight'], strict=False)}"
             )
+            from peft import LoraConfig, get_peft_model
+
             lora_rank = dict_s2["lora_rank"]
             lora_config = LoraConfig(
                 target_modules=["to_k", "to_q", "to_v", "to_out.0"],
@@ -592,6 +732,10 @@ class TTS:
         self.vits_model = vits_model
         if self.configs.is_half and str(self.configs.device) != "cpu":
             self.vits_model = self.vits_model.half()
+        if self.configs.prepare_infer:
+            self.vits_model = prepare_for_inference(
+                self.vits_model, compile=self.configs.compile_vits, verify=self.configs.verify_prepare
+            )
 
         self.configs.save_configs()
 
@@ -602,7 +746,7 @@ class TTS:
         self.configs.t2s_weights_path = weights_path
         self.configs.save_configs()
         self.configs.hz = 50
-        dict_s1 = torch.load(weights_path, map_location=self.configs.device, weights_only=False)
+        dict_s1 = load_infer_ckpt(weights_path) if is_infer_ckpt(weights_path) else load_mmap(weights_path)
         config = dict_s1["config"]
         self.configs.max_sec = config["data"]["max_sec"]
         t2s_model = Text2SemanticLightningModule(config, "****", is_train=False)
@@ -612,72 +756,117 @@ class TTS:
         self.t2s_model = t2s_model
         if self.configs.is_half and str(self.configs.device) != "cpu":
             self.t2s_model = self.t2s_model.half()
+        cpu_precision = resolve_cpu_precision(self.configs.cpu_precision, self.configs.device)
+        convert_t2s(self.t2s_model.model, cpu_precision)
+        self.t2s_model.cpu_precision = cpu_precision
+        if self.onnx_backend is not None:
+            self.onnx_backend.fallback = self.t2s_model.model
+            ### 导出的图里是导出时的权重，换了 GPT 权重就不能再用
+            if os.path.abspath(weights_path) != self.onnx_backend.t2s_weights_path:
+                print("Warning: the ONNX graphs were exported from other GPT weights, falling back to the torch backend.")
+                self.onnx_backend = None
+        if self.t2s_scheduler is not None:
+            self.enable_continuous_batching(self.t2s_scheduler.max_batch_size)
+
+    def init_onnx_backend(self, onnx_dir: str):
+        """
+        Run T2S decoding (and v1/v2 VITS decoding when the graph was exported) on ONNX Runtime,
+            text/reference feature extraction stays on PyTorch.
+        Args:
+            onnx_dir: str, the `onnx/{name}` directory written by `onnx_export.py`.
+        """
+        self.onnx_backend = OnnxBackend(onnx_dir, self.configs.device, self.t2s_model.model.EOS, self.t2s_model.model)
+        ### 记下导出图对应的权重，之后换权重时据此停用
+        self.onnx_backend.t2s_weights_path = os.path.abspath(self.configs.t2s_weights_path)
+        self.onnx_backend.vits_weights_path = os.path.abspath(self.configs.vits_weights_path)
+
+    @property
+    def t2s_precision(self) -> torch.dtype:
+        ### bf16 模式下 T2S 权重是 bf16，BERT 特征按 T2S 的精度送入
+        if getattr(self.t2s_model, "cpu_precision", "fp32") == "bf16":
+            return torch.bfloat16
+        return self.precision
+
+    def enable_continuous_batching(self, max_batch_size: int = 32):
+        """
+        Route parallel T2S inference through a shared continuous-batching scheduler,
+            so sentences of concurrent `run` calls are decoded in one batch.
+        Args:
+            max_batch_size: int, the maximum number of rows decoded together.
+        """
+        self.disable_continuous_batching()
+        self.t2s_scheduler = T2SScheduler(self.t2s_model.model, max_batch_size=max_batch_size)
+        self.t2s_scheduler.start()
+
+    def disable_continuous_batching(self):
+        if self.t2s_scheduler is not None:
+            self.t2s_scheduler.stop()
+            self.t2s_scheduler = None
 
     def init_vocoder(self, version: str):
-        if version == "v3":
-            if self.vocoder is not None and self.vocoder.__class__.__name__ == "BigVGAN":
-                return
-            if self.vocoder is not None:
-                self.vocoder.cpu()
-                del self.vocoder
-                self.empty_cache()
-
-            self.vocoder = BigVGAN.from_pretrained(
-                "%s/GPT_SoVITS/pretrained_models/models--nvidia--bigvgan_v2_24khz_100band_256x" % (now_dir,),
-                use_cuda_kernel=False,
-            )  # if True, RuntimeError: Ninja is required to load C++ extensions
-            # remove weight norm in the model and set to eval mode
-            self.vocoder.remove_weight_norm()
-
-            self.vocoder_configs["sr"] = 24000
-            self.vocoder_configs["T_ref"] = 468
-            self.vocoder_configs["T_chunk"] = 934
-            self.vocoder_configs["upsample_rate"] = 256
-            self.vocoder_configs["overlapped_len"] = 12
-
-        elif version == "v4":
-            if self.vocoder is not None and self.vocoder.__class__.__name__ == "Generator":
-                return
-            if self.vocoder is not None:
-                self.vocoder.cpu()
-                del self.vocoder
-                self.empty_cache()
-
-            self.vocoder = Generator(
-                initial_channel=100,
-                resblock="1",
-                resblock_kernel_sizes=[3, 7, 11],
-                resblock_dilation_sizes=[[1, 3, 5], [1, 3, 5], [1, 3, 5]],
-                upsample_rates=[10, 6, 2, 2, 2],
-                upsample_initial_channel=512,
-                upsample_kernel_sizes=[20, 12, 4, 4, 4],
-                gin_channels=0,
-                is_bias=True,
-            )
-            self.vocoder.remove_weight_norm()
-            state_dict_g = torch.load(
-                "%s/pretrained_models/gsv-v4-pretrained/vocoder.pth" % (now_dir,),
-                map_location="cpu",
-                weights_only=False,
-            )
-            print("loading vocoder", self.vocoder.load_state_dict(state_dict_g))
+        def load():
+            vocoder_configs = {}
+            if version == "v3":
+                from BigVGAN.bigvgan import BigVGAN
+
+                vocoder = BigVGAN.from_pretrained(
+                    "%s/GPT_SoVITS/pretrained_models/models--nvidia--bigvgan_v2_24khz_100band_256x" % (now_dir,),
+                    use_cuda_kernel=False,
+                )  # if True, RuntimeError: Ninja is required to load C++ extensions
+                # remove weight norm in the model and set to eval mode
+                vocoder.remove_weight_norm()
+
+                vocoder_configs["sr"] = 24000
+                vocoder_configs["T_ref"] = 468
+                vocoder_configs["T_chunk"] = 934
+                vocoder_configs["upsample_rate"] = 256
+                vocoder_configs["overlapped_len"] = 12
+
+            elif version == "v4":
+                vocoder = Generator(
+                    initial_channel=100,
+                    resblock="1",
+                    resblock_kernel_sizes=[3, 7, 11],
+                    resblock_dilation_sizes=[[1, 3, 5], [1, 3, 5], [1, 3, 5]],
+                    upsample_rates=[10, 6, 2, 2, 2],
+                    upsample_initial_channel=512,
+                    upsample_kernel_sizes=[20, 12, 4, 4, 4],
+                    gin_channels=0,
+                    is_bias=True,
+                )
+                vocoder.remove_weight_norm()
+                state_dict_g = torch.load(
+                    "%s/pretrained_models/gsv-v4-pretrained/vocoder.pth" % (now_dir,),
+                    map_location="cpu",
+                    weights_only=False,
+                )
+                print("loading vocoder", vocoder.load_state_dict(state_dict_g))
 
-            self.vocoder_configs["sr"] = 48000
-            self.vocoder_configs["T_ref"] = 500
-            self.vocoder_configs["T_chunk"] = 1000
-            self.vocoder_configs["upsample_rate"] = 480
-            self.vocoder_configs["overlapped_len"] = 12
+                vocoder_configs["sr"] = 48000
+                vocoder_configs["T_ref"] = 500
+                vocoder_configs["T_chunk"] = 1000
+                vocoder_configs["upsample_rate"] = 480
+                vocoder_configs["overlapped_len"] = 12
 
-        self.vocoder = self.vocoder.eval()
-        if self.configs.is_half == True:
-            self.vocoder = self.vocoder.half().to(self.configs.device)
-        else:
-            self.vocoder = self.vocoder.to(self.configs.device)
+            vocoder = vocoder.eval()
+            if self.configs.is_half == True:
+                vocoder = vocoder.half().to(self.configs.device)
+            else:
+                vocoder = vocoder.to(self.configs.device)
+            return vocoder, vocoder_configs
+
+        ### 同一版本的声码器在所有实例间共享，切换版本时释放旧的引用
+        self.vocoder, vocoder_configs = self._acquire_shared(
+            "vocoder", (version, str(self.configs.device), self.configs.is_half), load
+        )
+        self.vocoder_configs.update(vocoder_configs)
 
     def init_sr_model(self):
         if self.sr_model is not None:
             return
         try:
+            from tools.audio_sr import AP_BWE
+
             self.sr_model: AP_BWE = AP_BWE(self.configs.device, DictToAttrRecursive)
             self.sr_model_not_exist = False
         except FileNotFoundError:
@@ -685,9 +874,9 @@ class TTS:
             self.sr_model_not_exist = True
 
     def init_sv_model(self):
-        if self.sv_model is not None:
-            return
-        self.sv_model = SV(self.configs.device, self.configs.is_half)
+        self.sv_model = self._acquire_shared(
+            "sv", (str(self.configs.device), self.configs.is_half), lambda: SV(self.configs.device, self.configs.is_half)
+        )
 
     def enable_half_precision(self, enable: bool = True, save: bool = True):
         """
@@ -702,6 +891,7 @@ class TTS:
 
         self.configs.is_half = enable
         self.precision = torch.float16 if enable else torch.float32
+        self.prompt_cache["ge"] = None
         if save:
             self.configs.save_configs()
         if enable:
@@ -709,23 +899,16 @@ class TTS:
                 self.t2s_model = self.t2s_model.half()
             if self.vits_model is not None:
                 self.vits_model = self.vits_model.half()
-            if self.bert_model is not None:
-                self.bert_model = self.bert_model.half()
-            if self.cnhuhbert_model is not None:
-                self.cnhuhbert_model = self.cnhuhbert_model.half()
-            if self.vocoder is not None:
-                self.vocoder = self.vocoder.half()
         else:
             if self.t2s_model is not None:
-                self.t2s_model = self.t2s_model.float()
+                ### bf16 的 T2S 直接 .float() 会留下 cpu_precision 标记和 fp32 的头，按配置重新加载
+                if getattr(self.t2s_model, "cpu_precision", "fp32") != "fp32":
+                    self.init_t2s_weights(self.configs.t2s_weights_path)
+                else:
+                    self.t2s_model = self.t2s_model.float()
             if self.vits_model is not None:
                 self.vits_model = self.vits_model.float()
-            if self.bert_model is not None:
-                self.bert_model = self.bert_model.float()
-            if self.cnhuhbert_model is not None:
-                self.cnhuhbert_model = self.cnhuhbert_model.float()
-            if self.vocoder is not None:
-                self.vocoder = self.vocoder.float()
+        self._reload_shared_models()
 
     def set_device(self, device: torch.device, save: bool = True):
         """
@@ -734,20 +917,31 @@ class TTS:
             device: torch.device, the device to use for all models.
         """
         self.configs.device = device
+        self.prompt_cache["ge"] = None
         if save:
             self.configs.save_configs()
         if self.t2s_model is not None:
-            self.t2s_model = self.t2s_model.to(device)
+            ### int8/bf16 的 T2S 不能直接搬设备，按新设备重新加载
+            if self.configs.cpu_precision != "fp32":
+                self.init_t2s_weights(self.configs.t2s_weights_path)
+            else:
+                self.t2s_model = self.t2s_model.to(device)
         if self.vits_model is not None:
             self.vits_model = self.vits_model.to(device)
-        if self.bert_model is not None:
-            self.bert_model = self.bert_model.to(device)
-        if self.cnhuhbert_model is not None:
-            self.cnhuhbert_model = self.cnhuhbert_model.to(device)
-        if self.vocoder is not None:
-            self.vocoder = self.vocoder.to(device)
         if self.sr_model is not None:
             self.sr_model = self.sr_model.to(device)
+        self._reload_shared_models()
+
+    def _reload_shared_models(self):
+        ### 共享模型可能正被其他实例使用，不能原地 .half()/.to()，按新的 device/精度重新获取
+        if self.bert_model is not None:
+            self.init_bert_weights(self.configs.bert_base_path)
+        if self.cnhuhbert_model is not None:
+            self.init_cnhuhbert_weights(self.configs.cnhuhbert_base_path)
+        if self.sv_model is not None:
+            self.init_sv_model()
+        if self.vocoder is not None and self.configs.use_vocoder:
+            self.init_vocoder(self.configs.version)
 
     def set_ref_audio(self, ref_audio_path: str):
         """
@@ -756,26 +950,108 @@ class TTS:
         Args:
             ref_audio_path: str, the path of the reference audio.
         """
-        self._set_prompt_semantic(ref_audio_path)
-        self._set_ref_spec(ref_audio_path)
+        entry = self._get_ref_entry(ref_audio_path, with_semantic=True)
+        self.prompt_cache["prompt_semantic"] = entry["prompt_semantic"]
+        self._set_ref_spec(entry)
         self._set_ref_audio_path(ref_audio_path)
 
     def _set_ref_audio_path(self, ref_audio_path):
         self.prompt_cache["ref_audio_path"] = ref_audio_path
 
-    def _set_ref_spec(self, ref_audio_path):
-        spec_audio = self._get_ref_spec(ref_audio_path)
+    def _set_ref_spec(self, entry: dict):
+        spec_audio = entry["refer_spec"]
+        self.prompt_cache["raw_audio"] = entry["raw_audio"]
+        self.prompt_cache["raw_sr"] = entry["raw_sr"]
         if self.prompt_cache["refer_spec"] in [[], None]:
             self.prompt_cache["refer_spec"] = [spec_audio]
+            self.prompt_cache["sv_emb"] = [entry.get("sv_emb")]
         else:
             self.prompt_cache["refer_spec"][0] = spec_audio
+            self.prompt_cache["sv_emb"][0] = entry.get("sv_emb")
+        self.prompt_cache["ge"] = None
+
+    def _ref_cache_key(self, ref_audio_path: str) -> str:
+        return "%s|%s|%s|%s|%s" % (
+            reference_cache.file_hash(ref_audio_path),
+            self.configs.version,
+            os.path.abspath(self.configs.vits_weights_path),
+            str(self.configs.device),
+            "fp16" if self.configs.is_half else "fp32",
+        )
+
+    def _get_ref_entry(self, ref_audio_path: str, with_semantic: bool = False) -> dict:
+        """
+        Get the features of a reference audio from the shared reference cache,
+            only the missing parts are extracted and written back.
+        """
+        key = self._ref_cache_key(ref_audio_path)
+        entry = reference_cache.get(key, self.configs.device)
+        entry = {} if entry is None else entry
+        updated = False
+        if with_semantic and entry.get("prompt_semantic") is None:
+            entry["prompt_semantic"] = self._extract_prompt_semantic(ref_audio_path)
+            updated = True
+        if entry.get("refer_spec") is None:
+            raw_audio, raw_sr = torchaudio.load(ref_audio_path)
+            entry["raw_audio"] = raw_audio.to(self.configs.device).float()
+            entry["raw_sr"] = raw_sr
+            entry["refer_spec"] = self._extract_ref_spec(entry["raw_audio"], raw_sr)
+            updated = True
+        if self.is_v2pro and entry.get("sv_emb") is None:
+            entry["sv_emb"] = self.sv_model.compute_embedding3(entry["refer_spec"][1])
+            updated = True
+        if updated:
+            reference_cache.put(key, entry)
+        return entry
 
     def _get_ref_spec(self, ref_audio_path):
-        raw_audio, raw_sr = torchaudio.load(ref_audio_path)
-        raw_audio = raw_audio.to(self.configs.device).float()
-        self.prompt_cache["raw_audio"] = raw_audio
-        self.prompt_cache["raw_sr"] = raw_sr
+        entry = self._get_ref_entry(ref_audio_path)
+        self.prompt_cache["raw_audio"] = entry["raw_audio"]
+        self.prompt_cache["raw_sr"] = entry["raw_sr"]
+        return entry["refer_spec"]
 
+    def _get_ref_ge(self) -> torch.Tensor:
+        """
+        The fused global conditioning of the current reference set, computed once and reused by every batch.
+        """
+        ### 精度或设备切换后缓存的 ge 作废
+        ge_key = (self.precision, str(self.configs.device))
+        if self.prompt_cache["ge"] is not None and self.prompt_cache.get("ge_key") == ge_key:
+            return self.prompt_cache["ge"]
+        refer_audio_spec = [
+            spec.to(dtype=self.precision, device=self.configs.device) for spec, _ in self.prompt_cache["refer_spec"]
+        ]
+        if self.configs.use_vocoder:
+            ge = self.vits_model.compute_ge(refer_audio_spec[0])
+        else:
+            sv_emb = None
+            if self.is_v2pro:
+                sv_emb = [
+                    emb.to(dtype=self.precision, device=self.configs.device) if emb is not None else None
+                    for emb in self.prompt_cache["sv_emb"]
+                ]
+            ge = self.vits_model.compute_ge(refer_audio_spec, sv_emb)
+        self.prompt_cache["ge"] = ge
+        self.prompt_cache["ge_key"] = ge_key
+        return ge
+
+    def _vits_decode(self, codes, phones, refer_audio_spec, speed: float = 1.0, ge=None):
+        ### ONNX 的 VITS 图只有 v1/v2、单参考、不带语速，其余情况走 PyTorch
+        if (
+            self.onnx_backend is not None
+            and self.onnx_backend.vits is not None
+            and self.configs.version in ["v1", "v2"]
+            and speed == 1.0
+            and len(self.prompt_cache["refer_spec"]) == 1
+        ):
+            raw_audio = self.prompt_cache["raw_audio"]
+            if self.prompt_cache.get("onnx_ref_src") is not raw_audio:
+                self.prompt_cache["onnx_ref_audio"] = self._prepare_ref_audio(raw_audio, self.prompt_cache["raw_sr"])
+                self.prompt_cache["onnx_ref_src"] = raw_audio
+            return self.onnx_backend.decode(codes, phones, self.prompt_cache["onnx_ref_audio"])
+        return self.vits_model.decode(codes, phones, refer_audio_spec, speed=speed, ge=ge)
+
+    def _prepare_ref_audio(self, raw_audio: torch.Tensor, raw_sr: int):
         if raw_sr != self.configs.sampling_rate:
             audio = raw_audio.to(self.configs.device)
             if audio.shape[0] == 2:
@@ -789,6 +1065,10 @@ class TTS:
         maxx = audio.abs().max()
         if maxx > 1:
             audio /= min(2, maxx)
+        return audio
+
+    def _extract_ref_spec(self, raw_audio: torch.Tensor, raw_sr: int):
+        audio = self._prepare_ref_audio(raw_audio, raw_sr)
         spec = spectrogram_torch(
             audio,
             self.configs.filter_length,
@@ -807,7 +1087,7 @@ class TTS:
             audio = None
         return spec, audio
 
-    def _set_prompt_semantic(self, ref_wav_path: str):
+    def _extract_prompt_semantic(self, ref_wav_path: str):
         zero_wav = np.zeros(
             int(self.configs.sampling_rate * 0.3),
             dtype=np.float16 if self.configs.is_half else np.float32,
@@ -831,7 +1111,14 @@ class TTS:
             codes = self.vits_model.extract_latent(hubert_feature)
 
             prompt_semantic = codes[0, 0].to(self.configs.device)
-            self.prompt_cache["prompt_semantic"] = prompt_semantic
+            return prompt_semantic
+
+    def _get_prompt_text_features(self, prompt_text: str, prompt_lang: str):
+        """
+        Phones / bert features of the prompt text. They go through the sentence-level text feature
+        cache, whose key carries the bert model, device, dtype and cpu precision (`cache_tag`).
+        """
+        return self.text_preprocessor.segment_and_extract_feature_for_text(prompt_text, prompt_lang, self.configs.version)
 
     def batch_sequences(self, sequences: List[torch.Tensor], axis: int = 0, pad_value: int = 0, max_length: int = None):
         seq = sequences[0]
@@ -1023,7 +1310,14 @@ class TTS:
                     "parallel_infer": True,       # bool. whether to use parallel inference.
                     "repetition_penalty": 1.35    # float. repetition penalty for T2S model.
                     "sample_steps": 32,           # int. number of sampling steps for VITS model V3.
+                    "sample_solver": "euler",     # str. CFM solver for VITS model V3/V4: "euler", "midpoint" or "heun" (two DiT passes per step).
                     "super_sampling": False,       # bool. whether to use super-sampling for audio when using VITS model V3.
+                    "streaming_mode": False,      # bool. yield audio chunks while the T2S model is still decoding (implies return_fragment and batch_size 1).
+                    "stream_chunk_steps": 24,     # int. semantic tokens per streamed chunk (25 tokens per second of audio).
+                    "stream_first_chunk_steps": 8, # int. semantic tokens of the first chunk, controls the time to first audio.
+                    "stream_overlap_steps": 4,    # int. semantic tokens crossfaded between two consecutive chunks.
+                    "pipeline_infer": False,      # bool. (opt-in) decode semantics of batch N+1 in a background thread while batch N is synthesized.
+                    "pipeline_depth": 1,          # int. decoded batches allowed to wait for synthesis before the T2S thread blocks.
                 }
         returns:
             Tuple[int, np.ndarray]: sampling rate and audio data.
@@ -1052,11 +1346,30 @@ class TTS:
         parallel_infer = inputs.get("parallel_infer", True)
         repetition_penalty = inputs.get("repetition_penalty", 1.35)
         sample_steps = inputs.get("sample_steps", 32)
+        sample_solver = inputs.get("sample_solver", "euler")
         super_sampling = inputs.get("super_sampling", False)
-
-        if parallel_infer:
+        streaming_mode = inputs.get("streaming_mode", False)
+        stream_chunk_steps = inputs.get("stream_chunk_steps", 24)
+        stream_first_chunk_steps = inputs.get("stream_first_chunk_steps", 8)
+        stream_overlap_steps = inputs.get("stream_overlap_steps", 4)
+        pipeline_infer = inputs.get("pipeline_infer", False)
+        pipeline_depth = max(1, int(inputs.get("pipeline_depth", 1)))
+
+        if streaming_mode:
+            print(i18n("流式合成模式已开启"))
+            return_fragment = True
+            batch_size = 1
+            self.stream_timings = []
+
+        if self.onnx_backend is not None:
+            ### 导出的图 batch 为 1，batch 内逐行解码
+            self.t2s_model.model.infer_panel = self.onnx_backend.infer_panel
+        elif parallel_infer:
             print(i18n("并行推理模式已开启"))
-            self.t2s_model.model.infer_panel = self.t2s_model.model.infer_panel_batch_infer
+            if self.t2s_scheduler is not None:
+                self.t2s_model.model.infer_panel = self.t2s_scheduler.infer_panel
+            else:
+                self.t2s_model.model.infer_panel = self.t2s_model.model.infer_panel_batch_infer
         else:
             print(i18n("并行推理模式已关闭"))
             self.t2s_model.model.infer_panel = self.t2s_model.model.infer_panel_naive_batched
@@ -1078,6 +1391,15 @@ class TTS:
         else:
             print(i18n("分桶处理模式已关闭"))
 
+        if pipeline_infer and streaming_mode:
+            pipeline_infer = False  ### 流式模式下 T2S 与合成已经按块交替进行
+        elif pipeline_infer and seed not in [-1, "", None]:
+            ### 两个线程共用全局随机数发生器，交错顺序不固定，指定 seed 时为保证可复现关闭流水线
+            print(i18n("指定了随机种子，流水线推理已自动关闭"))
+            pipeline_infer = False
+        elif pipeline_infer:
+            print(i18n("流水线推理模式已开启"))
+
         if fragment_interval < 0.01:
             fragment_interval = 0.01
             print(i18n("分段间隔过小，已自动设置为0.01"))
@@ -1115,6 +1437,8 @@ class TTS:
         if not (len(list(paths)) == len(aux_ref_audio_paths) == len(self.prompt_cache["aux_ref_audio_paths"])):
             self.prompt_cache["aux_ref_audio_paths"] = aux_ref_audio_paths
             self.prompt_cache["refer_spec"] = [self.prompt_cache["refer_spec"][0]]
+            self.prompt_cache["sv_emb"] = [self.prompt_cache["sv_emb"][0]]
+            self.prompt_cache["ge"] = None
             for path in aux_ref_audio_paths:
                 if path in [None, ""]:
                     continue
@@ -1122,16 +1446,15 @@ class TTS:
                     print(i18n("音频文件不存在，跳过："), path)
                     continue
                 self.prompt_cache["refer_spec"].append(self._get_ref_spec(path))
+                self.prompt_cache["sv_emb"].append(self._get_ref_entry(path).get("sv_emb"))
 
         if not no_prompt_text:
             prompt_text = prompt_text.strip("\n")
             if prompt_text[-1] not in splits:
                 prompt_text += "。" if prompt_lang != "en" else "."
             print(i18n("实际输入的参考文本:"), prompt_text)
-            if self.prompt_cache["prompt_text"] != prompt_text:
-                phones, bert_features, norm_text = self.text_preprocessor.segment_and_extract_feature_for_text(
-                    prompt_text, prompt_lang, self.configs.version
-                )
+            if self.prompt_cache["prompt_text"] != prompt_text or self.prompt_cache["prompt_lang"] != prompt_lang:
+                phones, bert_features, norm_text = self._get_prompt_text_features(prompt_text, prompt_lang)
                 self.prompt_cache["prompt_text"] = prompt_text
                 self.prompt_cache["prompt_lang"] = prompt_lang
                 self.prompt_cache["phones"] = phones
@@ -1155,7 +1478,7 @@ class TTS:
                 threshold=batch_threshold,
                 split_bucket=split_bucket,
                 device=self.configs.device,
-                precision=self.precision,
+                precision=self.t2s_precision,
             )
         else:
             print(f"############ {i18n('切分文本')} ############")
@@ -1190,7 +1513,7 @@ class TTS:
                     threshold=batch_threshold,
                     split_bucket=False,
                     device=self.configs.device,
-                    precision=self.precision,
+                    precision=self.t2s_precision,
                 )
                 return batch[0]
 
@@ -1200,57 +1523,137 @@ class TTS:
             ###### inference ######
             t_34 = 0.0
             t_45 = 0.0
+            stream_sentence_idx = 0
             audio = []
+            vocoder_pending = []
             output_sr = self.configs.sampling_rate if not self.configs.use_vocoder else self.vocoder_configs["sr"]
-            for item in data:
+            if self.configs.use_vocoder:
+                ### 攒够约 cfm_max_batch 个CFM块（按每个语义token约4帧特征估算）就合成一次，不拖到请求结束
+                vocoder_window = self.cfm_max_batch * max(
+                    1,
+                    self.vocoder_configs["T_chunk"] - self.vocoder_configs["T_ref"] - self.vocoder_configs["overlapped_len"],
+                )
+
+            def flush_vocoder():
+                if len(vocoder_pending) == 0:
+                    return 0.0
+                print(f"{i18n('并行合成中')}...")
+                t_flush = time.perf_counter()
+                audio_fragments = self.using_vocoder_synthesis_batched_infer(
+                    [idx for _, idx_list, _, _ in vocoder_pending for idx in idx_list],
+                    [item for _, _, pred_semantic_list, _ in vocoder_pending for item in pred_semantic_list],
+                    [item for _, _, _, batch_phones in vocoder_pending for item in batch_phones],
+                    speed=speed_factor,
+                    sample_steps=sample_steps,
+                    solver=sample_solver,
+                )
+                for audio_idx, idx_list, _, _ in vocoder_pending:
+                    audio[audio_idx].extend(audio_fragments[: len(idx_list)])
+                    audio_fragments = audio_fragments[len(idx_list) :]
+                vocoder_pending.clear()
+                return time.perf_counter() - t_flush
+
+            def decode_semantic(item):
+                ### T2S 阶段：开启流水线时在后台线程运行，与上一个 batch 的合成重叠
                 t3 = time.perf_counter()
                 if return_fragment:
                     item = make_batch(item)
                     if item is None:
-                        continue
-
-                batch_phones: List[torch.LongTensor] = item["phones"]
-                # batch_phones:torch.LongTensor = item["phones"]
-                batch_phones_len: torch.LongTensor = item["phones_len"]
-                all_phoneme_ids: torch.LongTensor = item["all_phones"]
-                all_phoneme_lens: torch.LongTensor = item["all_phones_len"]
-                all_bert_features: torch.LongTensor = item["all_bert_features"]
-                norm_text: str = item["norm_text"]
-                max_len = item["max_len"]
-
-                print(i18n("前端处理后的文本(每句):"), norm_text)
+                        return None
                 if no_prompt_text:
                     prompt = None
                 else:
                     prompt = (
-                        self.prompt_cache["prompt_semantic"].expand(len(all_phoneme_ids), -1).to(self.configs.device)
+                        self.prompt_cache["prompt_semantic"]
+                        .expand(len(item["all_phones"]), -1)
+                        .to(self.configs.device)
                     )
+                if streaming_mode:
+                    return item, prompt, None, None, t3, None
 
                 print(f"############ {i18n('预测语义Token')} ############")
                 pred_semantic_list, idx_list = self.t2s_model.model.infer_panel(
-                    all_phoneme_ids,
-                    all_phoneme_lens,
+                    item["all_phones"],
+                    item["all_phones_len"],
                     prompt,
-                    all_bert_features,
+                    item["all_bert_features"],
                     # prompt_phone_len=ph_offset,
                     top_k=top_k,
                     top_p=top_p,
                     temperature=temperature,
                     early_stop_num=self.configs.hz * self.configs.max_sec,
-                    max_len=max_len,
+                    max_len=item["max_len"],
                     repetition_penalty=repetition_penalty,
                 )
-                t4 = time.perf_counter()
+                return item, prompt, pred_semantic_list, idx_list, t3, time.perf_counter()
+
+            for result in self.pipelined(decode_semantic, data, pipeline_infer, pipeline_depth):
+                if result is None:
+                    continue
+                item, prompt, pred_semantic_list, idx_list, t3, t4 = result
+
+                batch_phones: List[torch.LongTensor] = item["phones"]
+                # batch_phones:torch.LongTensor = item["phones"]
+                batch_phones_len: torch.LongTensor = item["phones_len"]
+                all_phoneme_ids: torch.LongTensor = item["all_phones"]
+                all_bert_features: torch.LongTensor = item["all_bert_features"]
+                norm_text: str = item["norm_text"]
+
+                print(i18n("前端处理后的文本(每句):"), norm_text)
+
+                if streaming_mode:
+                    print(f"############ {i18n('流式合成')} ############")
+                    for chunk_idx, (audio_chunk, is_last, timing) in enumerate(
+                        self.streaming_synthesis(
+                            batch_phones[0],
+                            all_phoneme_ids[0],
+                            all_bert_features[0],
+                            prompt,
+                            top_k=top_k,
+                            top_p=top_p,
+                            temperature=temperature,
+                            repetition_penalty=repetition_penalty,
+                            speed=speed_factor,
+                            sample_steps=sample_steps,
+                            sample_solver=sample_solver,
+                            chunk_steps=stream_chunk_steps,
+                            first_chunk_steps=stream_first_chunk_steps,
+                            overlap_steps=stream_overlap_steps,
+                        )
+                    ):
+                        timing["sentence"] = stream_sentence_idx
+                        timing["chunk"] = chunk_idx
+                        timing["since_request"] = time.perf_counter() - t0
+                        self.stream_timings.append(timing)
+                        print(
+                            "chunk %d-%d: %d tokens\t%.3f\t%.3f\t%.3f"
+                            % (stream_sentence_idx, chunk_idx, timing["tokens"], timing["t2s"], timing["synthesis"], timing["since_request"])
+                        )
+                        if audio_chunk.shape[0] == 0:
+                            if not is_last:
+                                continue
+                            audio_chunk = torch.zeros(1, dtype=self.precision, device=self.configs.device)
+                        yield self.audio_postprocess(
+                            [[audio_chunk]],
+                            output_sr,
+                            None,
+                            speed_factor,
+                            False,
+                            fragment_interval if is_last else 0,
+                            super_sampling if self.configs.use_vocoder and self.configs.version == "v3" else False,
+                        )
+                        if self.stop_flag:
+                            yield 16000, np.zeros(int(16000), dtype=np.int16)
+                            return
+                    stream_sentence_idx += 1
+                    continue
+
                 t_34 += t4 - t3
+                t_synth = time.perf_counter()
 
-                refer_audio_spec = []
-                if self.is_v2pro:
-                    sv_emb = []
-                for spec, audio_tensor in self.prompt_cache["refer_spec"]:
-                    spec = spec.to(dtype=self.precision, device=self.configs.device)
-                    refer_audio_spec.append(spec)
-                    if self.is_v2pro:
-                        sv_emb.append(self.sv_model.compute_embedding3(audio_tensor))
+                ### 参考音频的全局条件 ge（含 sv embedding）只依赖参考音频，每组参考只计算一次
+                refer_audio_spec = None
+                ge = self._get_ref_ge()
 
                 batch_audio_fragment = []
 
@@ -1282,14 +1685,9 @@ class TTS:
                             torch.cat(pred_semantic_list).unsqueeze(0).unsqueeze(0).to(self.configs.device)
                         )
                         _batch_phones = torch.cat(batch_phones).unsqueeze(0).to(self.configs.device)
-                        if self.is_v2pro != True:
-                            _batch_audio_fragment = self.vits_model.decode(
-                                all_pred_semantic, _batch_phones, refer_audio_spec, speed=speed_factor
-                            ).detach()[0, 0, :]
-                        else:
-                            _batch_audio_fragment = self.vits_model.decode(
-                                all_pred_semantic, _batch_phones, refer_audio_spec, speed=speed_factor, sv_emb=sv_emb
-                            ).detach()[0, 0, :]
+                        _batch_audio_fragment = self._vits_decode(
+                            all_pred_semantic, _batch_phones, refer_audio_spec, speed=speed_factor, ge=ge
+                        ).detach()[0, 0, :]
                         audio_frag_end_idx.insert(0, 0)
                         batch_audio_fragment = [
                             _batch_audio_fragment[audio_frag_end_idx[i - 1] : audio_frag_end_idx[i]]
@@ -1302,20 +1700,23 @@ class TTS:
                             _pred_semantic = (
                                 pred_semantic_list[i][-idx:].unsqueeze(0).unsqueeze(0)
                             )  # .unsqueeze(0)#mq要多unsqueeze一次
-                            if self.is_v2pro != True:
-                                audio_fragment = self.vits_model.decode(
-                                    _pred_semantic, phones, refer_audio_spec, speed=speed_factor
-                                ).detach()[0, 0, :]
-                            else:
-                                audio_fragment = self.vits_model.decode(
-                                    _pred_semantic, phones, refer_audio_spec, speed=speed_factor, sv_emb=sv_emb
-                                ).detach()[0, 0, :]
+                            audio_fragment = self._vits_decode(
+                                _pred_semantic, phones, refer_audio_spec, speed=speed_factor, ge=ge
+                            ).detach()[0, 0, :]
                             batch_audio_fragment.append(audio_fragment)  ###试试重建不带上prompt部分
                 else:
-                    if parallel_infer:
+                    if parallel_infer and not return_fragment:
+                        ### 跨batch攒CFM块一起跑，攒满一个窗口就合成（与后台下一个batch的T2S重叠），剩下的在最后合成
+                        vocoder_pending.append((len(audio), idx_list, pred_semantic_list, batch_phones))
+                    elif parallel_infer:
                         print(f"{i18n('并行合成中')}...")
                         audio_fragments = self.using_vocoder_synthesis_batched_infer(
-                            idx_list, pred_semantic_list, batch_phones, speed=speed_factor, sample_steps=sample_steps
+                            idx_list,
+                            pred_semantic_list,
+                            batch_phones,
+                            speed=speed_factor,
+                            sample_steps=sample_steps,
+                            solver=sample_solver,
                         )
                         batch_audio_fragment.extend(audio_fragments)
                     else:
@@ -1325,14 +1726,14 @@ class TTS:
                                 pred_semantic_list[i][-idx:].unsqueeze(0).unsqueeze(0)
                             )  # .unsqueeze(0)#mq要多unsqueeze一次
                             audio_fragment = self.using_vocoder_synthesis(
-                                _pred_semantic, phones, speed=speed_factor, sample_steps=sample_steps
+                                _pred_semantic, phones, speed=speed_factor, sample_steps=sample_steps, solver=sample_solver
                             )
                             batch_audio_fragment.append(audio_fragment)
 
                 t5 = time.perf_counter()
-                t_45 += t5 - t4
+                t_45 += t5 - t_synth
                 if return_fragment:
-                    print("%.3f\t%.3f\t%.3f\t%.3f" % (t1 - t0, t2 - t1, t4 - t3, t5 - t4))
+                    print("%.3f\t%.3f\t%.3f\t%.3f" % (t1 - t0, t2 - t1, t4 - t3, t5 - t_synth))
                     yield self.audio_postprocess(
                         [batch_audio_fragment],
                         output_sr,
@@ -1344,11 +1745,18 @@ class TTS:
                     )
                 else:
                     audio.append(batch_audio_fragment)
+                    pending_frames = sum(
+                        int(idx * 4 / speed_factor) for _, idx_list, _, _ in vocoder_pending for idx in idx_list
+                    )
+                    if len(vocoder_pending) > 0 and pending_frames >= vocoder_window:
+                        t_45 += flush_vocoder()
 
                 if self.stop_flag:
                     yield 16000, np.zeros(int(16000), dtype=np.int16)
                     return
 
+            t_45 += flush_vocoder()
+
             if not return_fragment:
                 print("%.3f\t%.3f\t%.3f\t%.3f" % (t1 - t0, t2 - t1, t_34, t_45))
                 if len(audio) == 0:
@@ -1379,6 +1787,115 @@ class TTS:
         finally:
             self.empty_cache()
 
+    def pipelined(self, stage, inputs: list, enabled: bool = True, depth: int = 1):
+        """
+        Runs `stage` over `inputs` and yields the results in order.
+
+        When enabled, `stage` runs in a background thread (on its own CUDA stream) and at most `depth`
+        finished results wait in the queue, so the T2S decoder of batch N+1 overlaps with whatever the
+        caller does with batch N (SoVITS / CFM + vocoder) while never running more than `depth` batches ahead.
+        Per-stage busy time, backpressure and starvation are stored in `self.pipeline_stats`.
+        """
+        stats = {"t2s_busy": 0.0, "t2s_blocked": 0.0, "synthesis_busy": 0.0, "synthesis_starved": 0.0, "batches": 0}
+        self.pipeline_stats = stats
+        t_start = time.perf_counter()
+        if not enabled:
+            try:
+                for x in inputs:
+                    t0 = time.perf_counter()
+                    result = stage(x)
+                    t1 = time.perf_counter()
+                    stats["t2s_busy"] += t1 - t0
+                    stats["batches"] += 1
+                    yield result
+                    stats["synthesis_busy"] += time.perf_counter() - t1
+            finally:
+                self._report_pipeline_stats(stats, time.perf_counter() - t_start, False)
+            return
+
+        results = queue.Queue(maxsize=depth)
+        stop = threading.Event()
+        device = self.configs.device
+        use_cuda_stream = "cuda" in str(device) and torch.cuda.is_available()
+
+        def put(value):
+            t0 = time.perf_counter()
+            while not stop.is_set():
+                try:
+                    results.put(value, timeout=0.1)
+                    break
+                except queue.Full:
+                    continue
+            stats["t2s_blocked"] += time.perf_counter() - t0
+
+        ### 调用方所在的流，batch 数据（to_batch、prompt）都排在这条流上
+        caller_stream = torch.cuda.current_stream(device) if use_cuda_stream else None
+
+        def producer():
+            try:
+                stream = torch.cuda.Stream(device) if use_cuda_stream else None
+                if stream is not None:
+                    stream.wait_stream(caller_stream)
+                with torch.no_grad(), (torch.cuda.stream(stream) if stream is not None else contextlib.nullcontext()):
+                    for x in inputs:
+                        if stop.is_set() or self.stop_flag:
+                            break
+                        t0 = time.perf_counter()
+                        result = stage(x)
+                        event = None
+                        if stream is not None:
+                            event = torch.cuda.Event()
+                            event.record(stream)
+                        stats["t2s_busy"] += time.perf_counter() - t0
+                        put(("result", result, event))
+                put(("done", None, None))
+            except BaseException as e:
+                put(("error", e, None))
+
+        worker = threading.Thread(target=producer, name="t2s-pipeline", daemon=True)
+        worker.start()
+        try:
+            while True:
+                t0 = time.perf_counter()
+                kind, value, event = results.get()
+                stats["synthesis_starved"] += time.perf_counter() - t0
+                if kind == "done":
+                    break
+                if kind == "error":
+                    raise value
+                if event is not None:
+                    torch.cuda.current_stream(device).wait_event(event)
+                    _record_stream(value, torch.cuda.current_stream(device))
+                stats["batches"] += 1
+                t1 = time.perf_counter()
+                yield value
+                stats["synthesis_busy"] += time.perf_counter() - t1
+        finally:
+            stop.set()
+            worker.join()
+            self._report_pipeline_stats(stats, time.perf_counter() - t_start, True)
+
+    def _report_pipeline_stats(self, stats: dict, wall: float, enabled: bool):
+        stats["wall"] = wall
+        stats["t2s_utilization"] = stats["t2s_busy"] / max(wall, 1e-9)
+        stats["synthesis_utilization"] = stats["synthesis_busy"] / max(wall, 1e-9)
+        stats["overlap"] = (stats["t2s_busy"] + stats["synthesis_busy"]) / max(wall, 1e-9)
+        print(
+            "pipeline %s: %d batches in %.3fs | t2s busy %.3fs (%.0f%%) blocked %.3fs | synthesis busy %.3fs (%.0f%%) starved %.3fs | overlap %.2fx"
+            % (
+                "on" if enabled else "off",
+                stats["batches"],
+                wall,
+                stats["t2s_busy"],
+                stats["t2s_utilization"] * 100,
+                stats["t2s_blocked"],
+                stats["synthesis_busy"],
+                stats["synthesis_utilization"] * 100,
+                stats["synthesis_starved"],
+                stats["overlap"],
+            )
+        )
+
     def empty_cache(self):
         try:
             gc.collect()  # 触发gc的垃圾回收。避免内存一直增长。
@@ -1443,9 +1960,11 @@ class TTS:
 
         return sr, audio
 
-    def using_vocoder_synthesis(
-        self, semantic_tokens: torch.Tensor, phones: torch.Tensor, speed: float = 1.0, sample_steps: int = 32
-    ):
+    def _prepare_vocoder_reference(self):
+        """
+        Reference side inputs of the v3/v4 CFM: the reference spec, ge, and the (fea_ref, mel2)
+        prompt that every CFM chunk is conditioned on.
+        """
         prompt_semantic_tokens = self.prompt_cache["prompt_semantic"].unsqueeze(0).unsqueeze(0).to(self.configs.device)
         prompt_phones = torch.LongTensor(self.prompt_cache["phones"]).unsqueeze(0).to(self.configs.device)
         raw_entry = self.prompt_cache["refer_spec"][0]
@@ -1453,7 +1972,9 @@ class TTS:
             raw_entry = raw_entry[0]
         refer_audio_spec = raw_entry.to(dtype=self.precision, device=self.configs.device)
 
-        fea_ref, ge = self.vits_model.decode_encp(prompt_semantic_tokens, prompt_phones, refer_audio_spec)
+        fea_ref, ge = self.vits_model.decode_encp(
+            prompt_semantic_tokens, prompt_phones, refer_audio_spec, self._get_ref_ge()
+        )
         ref_audio: torch.Tensor = self.prompt_cache["raw_audio"]
         ref_sr = self.prompt_cache["raw_sr"]
         ref_audio = ref_audio.to(self.configs.device).float()
@@ -1479,6 +2000,17 @@ class TTS:
         chunk_len = T_chunk - T_min
 
         mel2 = mel2.to(self.precision)
+        return refer_audio_spec, ge, fea_ref, mel2, T_min, chunk_len
+
+    def using_vocoder_synthesis(
+        self,
+        semantic_tokens: torch.Tensor,
+        phones: torch.Tensor,
+        speed: float = 1.0,
+        sample_steps: int = 32,
+        solver: str = "euler",
+    ):
+        refer_audio_spec, ge, fea_ref, mel2, T_min, chunk_len = self._prepare_vocoder_reference()
         fea_todo, ge = self.vits_model.decode_encp(semantic_tokens, phones, refer_audio_spec, ge, speed)
 
         cfm_resss = []
@@ -1491,7 +2023,7 @@ class TTS:
             fea = torch.cat([fea_ref, fea_todo_chunk], 2).transpose(2, 1)
 
             cfm_res = self.vits_model.cfm.inference(
-                fea, torch.LongTensor([fea.size(1)]).to(fea.device), mel2, sample_steps, inference_cfg_rate=0
+                fea, torch.LongTensor([fea.size(1)]).to(fea.device), mel2, sample_steps, inference_cfg_rate=0, solver=solver
             )
             cfm_res = cfm_res[:, :, mel2.shape[2] :]
 
@@ -1515,40 +2047,9 @@ class TTS:
         batch_phones: List[torch.Tensor],
         speed: float = 1.0,
         sample_steps: int = 32,
+        solver: str = "euler",
     ) -> List[torch.Tensor]:
-        prompt_semantic_tokens = self.prompt_cache["prompt_semantic"].unsqueeze(0).unsqueeze(0).to(self.configs.device)
-        prompt_phones = torch.LongTensor(self.prompt_cache["phones"]).unsqueeze(0).to(self.configs.device)
-        raw_entry = self.prompt_cache["refer_spec"][0]
-        if isinstance(raw_entry, tuple):
-            raw_entry = raw_entry[0]
-        refer_audio_spec = raw_entry.to(dtype=self.precision, device=self.configs.device)
-
-        fea_ref, ge = self.vits_model.decode_encp(prompt_semantic_tokens, prompt_phones, refer_audio_spec)
-        ref_audio: torch.Tensor = self.prompt_cache["raw_audio"]
-        ref_sr = self.prompt_cache["raw_sr"]
-        ref_audio = ref_audio.to(self.configs.device).float()
-        if ref_audio.shape[0] == 2:
-            ref_audio = ref_audio.mean(0).unsqueeze(0)
-
-        # tgt_sr = self.vocoder_configs["sr"]
-        tgt_sr = 24000 if self.configs.version == "v3" else 32000
-        if ref_sr != tgt_sr:
-            ref_audio = resample(ref_audio, ref_sr, tgt_sr, self.configs.device)
-
-        mel2 = mel_fn(ref_audio) if self.configs.version == "v3" else mel_fn_v4(ref_audio)
-        mel2 = norm_spec(mel2)
-        T_min = min(mel2.shape[2], fea_ref.shape[2])
-        mel2 = mel2[:, :, :T_min]
-        fea_ref = fea_ref[:, :, :T_min]
-        T_ref = self.vocoder_configs["T_ref"]
-        T_chunk = self.vocoder_configs["T_chunk"]
-        if T_min > T_ref:
-            mel2 = mel2[:, :, -T_ref:]
-            fea_ref = fea_ref[:, :, -T_ref:]
-            T_min = T_ref
-        chunk_len = T_chunk - T_min
-
-        mel2 = mel2.to(self.precision)
+        refer_audio_spec, ge, fea_ref, mel2, T_min, chunk_len = self._prepare_vocoder_reference()
 
         # #### batched inference
         overlapped_len = self.vocoder_configs["overlapped_len"]
@@ -1589,8 +2090,20 @@ class TTS:
         bs = feat_chunks.shape[0]
         fea_ref = fea_ref.repeat(bs, 1, 1)
         fea = torch.cat([fea_ref, feat_chunks], 2).transpose(2, 1)
-        pred_spec = self.vits_model.cfm.inference(
-            fea, torch.LongTensor([fea.size(1)]).to(fea.device), mel2, sample_steps, inference_cfg_rate=0
+        ### 所有块一次过DiT，块数超过cfm_max_batch时分组跑以限制显存
+        pred_spec = torch.cat(
+            [
+                self.vits_model.cfm.inference(
+                    fea_group,
+                    torch.LongTensor([fea_group.size(1)]).to(fea_group.device),
+                    mel2,
+                    sample_steps,
+                    inference_cfg_rate=0,
+                    solver=solver,
+                )
+                for fea_group in fea.split(self.cfm_max_batch, 0)
+            ],
+            0,
         )
         pred_spec = pred_spec[:, :, -chunk_len:]
         dd = pred_spec.shape[1]
@@ -1623,6 +2136,142 @@ class TTS:
 
         return audio_fragments
 
+    def streaming_synthesis(
+        self,
+        phones: torch.LongTensor,
+        all_phones: torch.LongTensor,
+        all_bert_features: torch.Tensor,
+        prompt: torch.LongTensor,
+        top_k: int = 5,
+        top_p: float = 1,
+        temperature: float = 1,
+        repetition_penalty: float = 1.35,
+        speed: float = 1.0,
+        sample_steps: int = 32,
+        sample_solver: str = "euler",
+        chunk_steps: int = 24,
+        first_chunk_steps: int = 8,
+        overlap_steps: int = 4,
+    ):
+        """
+        Streaming synthesis of one sentence.
+
+        The T2S decoder yields semantic tokens while it is still decoding. Every time enough new tokens
+        are available, SoVITS (or CFM + vocoder for v3/v4) runs on a window made of the new tokens plus
+        some already synthesized context, and the overlapping part is crossfaded with `sola_algorithm`.
+        The last `overlap_steps` tokens of every chunk are held back until the next chunk has been crossfaded.
+
+        Yields:
+            Tuple[torch.Tensor, bool, dict]: audio chunk, whether it is the last chunk of the sentence, timing of the chunk.
+        """
+        device = self.configs.device
+        phones = phones.unsqueeze(0).to(device)
+        ge = self._get_ref_ge()
+        if self.configs.use_vocoder:
+            refer_audio_spec, ge, fea_ref, mel2, T_min, chunk_len = self._prepare_vocoder_reference()
+            upsample_rate = self.vocoder_configs["upsample_rate"]
+            mel_context = None  ### 上一块的 mel 尾部，作为声码器的左侧上下文
+
+        token_stream = self.t2s_model.model.infer_panel_stream(
+            all_phones.unsqueeze(0).to(device),
+            None,
+            prompt,
+            all_bert_features.unsqueeze(0).to(device),
+            top_k=top_k,
+            top_p=top_p,
+            temperature=temperature,
+            early_stop_num=self.configs.hz * self.configs.max_sec,
+            repetition_penalty=repetition_penalty,
+            chunk_steps=min(first_chunk_steps, chunk_steps),
+        )
+
+        tokens = torch.zeros(0, dtype=torch.long, device=device)
+        decoded_end = 0
+        tail: torch.Tensor = None
+        t_start = time.perf_counter()
+        t_t2s = t_start
+        for new_tokens, is_last in token_stream:
+            tokens = torch.cat([tokens, new_tokens])
+            target = first_chunk_steps if decoded_end == 0 else chunk_steps
+            if not is_last and tokens.shape[0] - decoded_end < target:
+                continue
+            t_decoded = time.perf_counter()
+
+            start = decoded_end
+            end = tokens.shape[0]
+            if end == start:
+                audio = torch.zeros(0, dtype=self.precision, device=device) if tail is None else tail
+                tail = None
+            else:
+                ov = min(overlap_steps, start)
+                win_start = max(0, start - ov - chunk_steps)
+                window = tokens[win_start:end].view(1, 1, -1)
+                if not self.configs.use_vocoder:
+                    wav = self._vits_decode(window, phones, None, speed=speed, ge=ge).detach()[0, 0, :]
+                    ### wav 覆盖 [start - ov, end) 的 token，前 ov 个 token 与上一块保留的尾部重叠
+                    samples_per_step = wav.shape[-1] / (end - win_start)
+                    audio = wav[round((start - ov - win_start) * samples_per_step) :]
+                    overlap_len = round(ov * samples_per_step)
+                    hold = round(min(overlap_steps, end - start) * samples_per_step)
+                else:
+                    fea_todo, _ = self.vits_model.decode_encp(window, phones, refer_audio_spec, ge, speed)
+                    ### 只对新 token 对应的特征帧跑 CFM，mel2/fea_ref 在块之间传递
+                    fea_todo = fea_todo[:, :, round((start - win_start) * fea_todo.shape[2] / (end - win_start)) :]
+                    cfm_resss = []
+                    idx = 0
+                    while idx < fea_todo.shape[2]:
+                        fea_todo_chunk = fea_todo[:, :, idx : idx + chunk_len]
+                        idx += chunk_len
+                        fea = torch.cat([fea_ref, fea_todo_chunk], 2).transpose(2, 1)
+                        cfm_res = self.vits_model.cfm.inference(
+                            fea,
+                            torch.LongTensor([fea.size(1)]).to(fea.device),
+                            mel2,
+                            sample_steps,
+                            inference_cfg_rate=0,
+                            solver=sample_solver,
+                        )
+                        cfm_res = cfm_res[:, :, mel2.shape[2] :]
+                        mel2 = cfm_res[:, :, -T_min:]
+                        fea_ref = fea_todo_chunk[:, :, -T_min:]
+                        cfm_resss.append(cfm_res)
+                    mel_new = torch.cat(cfm_resss, 2)
+                    ### 声码器带上上一块的 mel 尾部作为左侧上下文，输出中重叠的 overlapped_len 帧用于交叉淡化
+                    overlapped_len = self.vocoder_configs["overlapped_len"]
+                    context_len = 0 if mel_context is None else mel_context.shape[2]
+                    mel = mel_new if mel_context is None else torch.cat([mel_context, mel_new], 2)
+                    mel_context = mel[:, :, -overlapped_len * 2 :]
+                    wav = self.vocoder(denorm_spec(mel))[0][0]
+                    overlap_frames = min(overlapped_len, context_len)
+                    audio = wav[(context_len - overlap_frames) * upsample_rate :]
+                    overlap_len = overlap_frames * upsample_rate
+                    hold = min(overlapped_len, mel_new.shape[2]) * upsample_rate
+
+                if tail is not None and overlap_len > 0:
+                    overlap_len = min(overlap_len, tail.shape[0], audio.shape[0])
+                    audio = self.sola_algorithm([tail, audio], overlap_len)
+                elif tail is not None:
+                    audio = torch.cat([tail, audio], 0)
+
+                if is_last:
+                    tail = None
+                else:
+                    tail = audio[audio.shape[0] - hold :]
+                    audio = audio[: audio.shape[0] - hold]
+                decoded_end = end
+
+            t_synth = time.perf_counter()
+            timing = {
+                "tokens": end - start,
+                "t2s": t_decoded - t_t2s,
+                "synthesis": t_synth - t_decoded,
+                "latency": t_synth - t_start,
+            }
+            t_t2s = t_synth
+            yield audio, is_last, timing
+            if is_last:
+                return
+
     def sola_algorithm(
         self,
         audio_fragments: List[torch.Tensor],
@@ -13,6 +13,7 @@ from text.LangSegmenter import LangSegmenter
 from typing import Dict, List, Tuple
 from text.cleaner import clean_text
 from text import cleaned_text_to_sequence
+from text.text_cache import text_feature_cache
 from transformers import AutoModelForMaskedLM, AutoTokenizer
 from TTS_infer_pack.text_segmentation_method import split_big_text, splits, get_method as get_seg_method
 
@@ -49,10 +50,17 @@ def merge_short_text_in_array(texts: str, threshold: int) -> list:
 
 
 class TextPreprocessor:
-    def __init__(self, bert_model: AutoModelForMaskedLM, tokenizer: AutoTokenizer, device: torch.device):
+    def __init__(
+        self,
+        bert_model: AutoModelForMaskedLM,
+        tokenizer: AutoTokenizer,
+        device: torch.device,
+        bert_batch_size: int = int(os.environ.get("bert_batch_size", 16)),
+    ):
         self.bert_model = bert_model
         self.tokenizer = tokenizer
         self.device = device
+        self.bert_batch_size = bert_batch_size
         self.bert_lock = threading.RLock()
 
     def preprocess(self, text: str, lang: str, text_split_method: str, version: str = "v2") -> List[Dict]:
@@ -61,8 +69,7 @@ class TextPreprocessor:
         texts = self.pre_seg_text(text, lang, text_split_method)
         result = []
         print(f"############ {i18n('提取文本Bert特征')} ############")
-        for text in tqdm(texts):
-            phones, bert_features, norm_text = self.segment_and_extract_feature_for_text(text, lang, version)
+        for phones, bert_features, norm_text in self.get_phones_and_bert_batch(texts, lang, version):
             if phones is None or norm_text == "":
                 continue
             res = {
@@ -119,73 +126,153 @@ class TextPreprocessor:
         return self.get_phones_and_bert(text, language, version)
 
     def get_phones_and_bert(self, text: str, language: str, version: str, final: bool = False):
+        if final:
+            with self.bert_lock:
+                segments = self.clean_segments(text, language, version, final)
+                return self.merge_segments(segments, self.get_bert_inf_batch(segments))
+        return self.get_phones_and_bert_batch([text], language, version)[0]
+
+    def get_phones_and_bert_batch(self, texts: List[str], language: str, version: str) -> List[Tuple[list, torch.Tensor, str]]:
+        """
+        (phones, bert_features, norm_text) for every sentence. Sentences seen before come from the
+        text feature cache; the rest go through g2p and share batched Bert forwards.
+        """
+        tag = self.cache_tag()
+        ### 与 clean_segments 同样只合并连续空格，缓存 key 用的就是送去 g2p 的文本
+        texts = [re.sub(r' {2,}', ' ', text) for text in texts]
+        keys = [text_feature_cache.make_key(text, language, version, tag) for text in texts]
+        results = [None] * len(texts)
+        miss_idx = []
+        for i, key in enumerate(keys):
+            entry = text_feature_cache.get(key, self.device)
+            if entry is None:
+                miss_idx.append(i)
+            else:
+                results[i] = (entry["phones"], entry["bert_features"], entry["norm_text"])
+        if len(miss_idx) == 0:
+            return results
+
         with self.bert_lock:
-            text = re.sub(r' {2,}', ' ', text)
-            textlist = []
-            langlist = []
-            if language == "all_zh":
-                for tmp in LangSegmenter.getTexts(text,"zh"):
-                    langlist.append(tmp["lang"])
-                    textlist.append(tmp["text"])
-            elif language == "all_yue":
-                for tmp in LangSegmenter.getTexts(text,"zh"):
-                    if tmp["lang"] == "zh":
-                        tmp["lang"] = "yue"
-                    langlist.append(tmp["lang"])
-                    textlist.append(tmp["text"])
-            elif language == "all_ja":
-                for tmp in LangSegmenter.getTexts(text,"ja"):
-                    langlist.append(tmp["lang"])
-                    textlist.append(tmp["text"])
-            elif language == "all_ko":
-                for tmp in LangSegmenter.getTexts(text,"ko"):
-                    langlist.append(tmp["lang"])
-                    textlist.append(tmp["text"])
-            elif language == "en":
-                langlist.append("en")
-                textlist.append(text)
-            elif language == "auto":
-                for tmp in LangSegmenter.getTexts(text):
-                    langlist.append(tmp["lang"])
-                    textlist.append(tmp["text"])
-            elif language == "auto_yue":
-                for tmp in LangSegmenter.getTexts(text):
-                    if tmp["lang"] == "zh":
-                        tmp["lang"] = "yue"
+            self.prefetch_g2p([texts[i] for i in miss_idx], language, version)
+            segments_list = [self.clean_segments(texts[i], language, version) for i in tqdm(miss_idx)]
+            ### 所有句子的中文片段合并成少数几个 batch 做一次 Bert 前向
+            bert_list = self.get_bert_inf_batch(sum(segments_list, []))
+        offset = 0
+        for i, segments in zip(miss_idx, segments_list):
+            bert_features = bert_list[offset : offset + len(segments)]
+            offset += len(segments)
+            phones, bert_features, norm_text = self.merge_segments(segments, bert_features)
+            results[i] = (phones, bert_features, norm_text)
+            text_feature_cache.put(
+                keys[i],
+                {
+                    "phones": phones,
+                    "word2ph": [segment[1] for segment in segments],
+                    "norm_text": norm_text,
+                    "bert_features": bert_features,
+                },
+            )
+        return results
+
+    def prefetch_g2p(self, texts: List[str], language: str, version: str):
+        """
+        Resolves the polyphones of every zh segment of `texts` in one g2pW batch,
+        so the per-sentence clean_text calls that follow hit its cache.
+        """
+        if version == "v1":
+            return
+        zh_texts = []
+        for text in texts:
+            textlist, langlist = self.split_lang(re.sub(r' {2,}', ' ', text), language)
+            zh_texts += [t for t, lang in zip(textlist, langlist) if lang.replace("all_", "") == "zh"]
+        if len(zh_texts) > 0:
+            from text import chinese2
+
+            chinese2.prefetch(zh_texts)
+
+    def cache_tag(self) -> str:
+        tag = "%s|%s|%s" % (
+            getattr(self.bert_model, "name_or_path", ""),
+            self.device,
+            next(self.bert_model.parameters()).dtype,
+        )
+        ### int8 动态量化后剩下的参数仍是 fp32，单独标记以免和 fp32 特征混用
+        cpu_precision = getattr(self.bert_model, "cpu_precision", "fp32")
+        return tag if cpu_precision == "fp32" else "%s|%s" % (tag, cpu_precision)
+
+    def split_lang(self, text: str, language: str) -> Tuple[List[str], List[str]]:
+        textlist = []
+        langlist = []
+        if language == "all_zh":
+            for tmp in LangSegmenter.getTexts(text,"zh"):
+                langlist.append(tmp["lang"])
+                textlist.append(tmp["text"])
+        elif language == "all_yue":
+            for tmp in LangSegmenter.getTexts(text,"zh"):
+                if tmp["lang"] == "zh":
+                    tmp["lang"] = "yue"
+                langlist.append(tmp["lang"])
+                textlist.append(tmp["text"])
+        elif language == "all_ja":
+            for tmp in LangSegmenter.getTexts(text,"ja"):
+                langlist.append(tmp["lang"])
+                textlist.append(tmp["text"])
+        elif language == "all_ko":
+            for tmp in LangSegmenter.getTexts(text,"ko"):
+                langlist.append(tmp["lang"])
+                textlist.append(tmp["text"])
+        elif language == "en":
+            langlist.append("en")
+            textlist.append(text)
+        elif language == "auto":
+            for tmp in LangSegmenter.getTexts(text):
+                langlist.append(tmp["lang"])
+                textlist.append(tmp["text"])
+        elif language == "auto_yue":
+            for tmp in LangSegmenter.getTexts(text):
+                if tmp["lang"] == "zh":
+                    tmp["lang"] = "yue"
+                langlist.append(tmp["lang"])
+                textlist.append(tmp["text"])
+        else:
+            for tmp in LangSegmenter.getTexts(text):
+                if langlist:
+                    if (tmp["lang"] == "en" and langlist[-1] == "en") or (tmp["lang"] != "en" and langlist[-1] != "en"):
+                        textlist[-1] += tmp["text"]
+                        continue
+                if tmp["lang"] == "en":
                     langlist.append(tmp["lang"])
-                    textlist.append(tmp["text"])
-            else:
-                for tmp in LangSegmenter.getTexts(text):
-                    if langlist:
-                        if (tmp["lang"] == "en" and langlist[-1] == "en") or (tmp["lang"] != "en" and langlist[-1] != "en"):
-                            textlist[-1] += tmp["text"]
-                            continue
-                    if tmp["lang"] == "en":
-                        langlist.append(tmp["lang"])
-                    else:
-                        # 因无法区别中日韩文汉字,以用户输入为准
-                        langlist.append(language)
-                    textlist.append(tmp["text"])
-            # print(textlist)
-            # print(langlist)
-            phones_list = []
-            bert_list = []
-            norm_text_list = []
-            for i in range(len(textlist)):
-                lang = langlist[i]
-                phones, word2ph, norm_text = self.clean_text_inf(textlist[i], lang, version)
-                bert = self.get_bert_inf(phones, word2ph, norm_text, lang)
-                phones_list.append(phones)
-                norm_text_list.append(norm_text)
-                bert_list.append(bert)
-            bert = torch.cat(bert_list, dim=1)
-            phones = sum(phones_list, [])
-            norm_text = "".join(norm_text_list)
-
-            if not final and len(phones) < 6:
-                return self.get_phones_and_bert("." + text, language, version, final=True)
-
-            return phones, bert, norm_text
+                else:
+                    # 因无法区别中日韩文汉字,以用户输入为准
+                    langlist.append(language)
+                textlist.append(tmp["text"])
+        # print(textlist)
+        # print(langlist)
+        return textlist, langlist
+
+    def clean_segments(self, text: str, language: str, version: str, final: bool = False) -> List[Tuple[list, list, str, str]]:
+        """
+        Language segmentation + g2p of one sentence, without Bert.
+        Returns a list of (phones, word2ph, norm_text, lang) for the sentence's segments.
+        """
+        text = re.sub(r' {2,}', ' ', text)
+        textlist, langlist = self.split_lang(text, language)
+        segments = []
+        for i in range(len(textlist)):
+            lang = langlist[i]
+            phones, word2ph, norm_text = self.clean_text_inf(textlist[i], lang, version)
+            segments.append((phones, word2ph, norm_text, lang))
+
+        if not final and len(sum([segment[0] for segment in segments], [])) < 6:
+            return self.clean_segments("." + text, language, version, final=True)
+
+        return segments
+
+    def merge_segments(self, segments: List[Tuple[list, list, str, str]], bert_list: List[torch.Tensor]):
+        bert = torch.cat(bert_list, dim=1)
+        phones = sum([segment[0] for segment in segments], [])
+        norm_text = "".join([segment[2] for segment in segments])
+        return phones, bert, norm_text
 
     def get_bert_feature(self, text: str, word2ph: list) -> torch.Tensor:
         with torch.no_grad():
@@ -202,6 +289,31 @@ class TextPreprocessor:
         phone_level_feature = torch.cat(phone_level_feature, dim=0)
         return phone_level_feature.T
 
+    def get_bert_feature_batch(self, texts: List[str], word2phs: List[list]) -> List[torch.Tensor]:
+        """
+        Runs the Bert model once over a padded batch of zh texts and expands
+        every text's features to phone level with `repeat_interleave`. Texts that
+        do not tokenize to one token per character go through `get_bert_feature`.
+        """
+        with torch.no_grad():
+            inputs = self.tokenizer(texts, return_tensors="pt", padding=True)
+            for i in inputs:
+                inputs[i] = inputs[i].to(self.device)
+            res = self.bert_model(**inputs, output_hidden_states=True)
+            hidden_states = res["hidden_states"][-3]
+        token_lens = inputs["attention_mask"].sum(dim=1).tolist()
+        features = []
+        for i, (text, word2ph) in enumerate(zip(texts, word2phs)):
+            assert len(word2ph) == len(text)
+            ### 字和 token 不是一一对应时（如连续的字母数字合成一个 token），按字符数切片会混入 SEP/pad，退回逐句
+            if token_lens[i] != len(text) + 2:
+                features.append(self.get_bert_feature(text, word2ph).to(hidden_states.device))
+                continue
+            feature = hidden_states[i, 1 : len(text) + 1]
+            repeats = torch.tensor(word2ph, dtype=torch.long, device=feature.device)
+            features.append(torch.repeat_interleave(feature, repeats, dim=0).T)
+        return features
+
     def clean_text_inf(self, text: str, language: str, version: str = "v2"):
         language = language.replace("all_", "")
         phones, word2ph, norm_text = clean_text(text, language, version)
@@ -209,16 +321,30 @@ class TextPreprocessor:
         return phones, word2ph, norm_text
 
     def get_bert_inf(self, phones: list, word2ph: list, norm_text: str, language: str):
-        language = language.replace("all_", "")
-        if language == "zh":
-            feature = self.get_bert_feature(norm_text, word2ph).to(self.device)
-        else:
-            feature = torch.zeros(
-                (1024, len(phones)),
-                dtype=torch.float32,
-            ).to(self.device)
+        return self.get_bert_inf_batch([(phones, word2ph, norm_text, language)])[0]
+
+    def get_bert_inf_batch(self, segments: List[Tuple[list, list, str, str]]) -> List[torch.Tensor]:
+        features = [None] * len(segments)
+        zh_idx = []
+        for i, (phones, word2ph, norm_text, language) in enumerate(segments):
+            if language.replace("all_", "") == "zh":
+                zh_idx.append(i)
+            else:
+                features[i] = torch.zeros(
+                    (1024, len(phones)),
+                    dtype=torch.float32,
+                ).to(self.device)
 
-        return feature
+        ### 按长度排序后分批，减少 padding
+        zh_idx.sort(key=lambda i: len(segments[i][2]))
+        for start in range(0, len(zh_idx), self.bert_batch_size):
+            batch_idx = zh_idx[start : start + self.bert_batch_size]
+            batch_features = self.get_bert_feature_batch(
+                [segments[i][2] for i in batch_idx], [segments[i][1] for i in batch_idx]
+            )
+            for i, feature in zip(batch_idx, batch_features):
+                features[i] = feature.to(self.device)
+        return features
 
     def filter_text(self, texts):
         _text = []
@@ -11,6 +11,7 @@ from __future__ import annotations
 
 import torch
 from torch import nn
+import torch.nn.functional as F
 from torch.utils.checkpoint import checkpoint
 
 from x_transformers.x_transformers import RotaryEmbedding
@@ -192,3 +193,49 @@ class DiT(nn.Module):
             return output, text_embed, dt
         else:
             return output
+
+    def prepare_inference(
+        self,
+        cond0: float["b n d"],  # masked cond audio  # noqa: F722
+        text0,  # condition feature
+        x_lens,
+        seq_len,
+        drop_audio_cond=False,
+        drop_text=False,
+    ):
+        """
+        Step-invariant part of `forward` for sampling: mask, rope, text embedding and the cond/text
+        half of the input projection. `proj(cat(x, cond, text))` is linear, so it is split into
+        `x @ W_x.T` (per step) plus a cached `cat(cond, text) @ W_ct.T + b`.
+        """
+        cond = cond0.transpose(2, 1)
+        text = text0.transpose(2, 1)
+        if drop_audio_cond:
+            cond = torch.zeros_like(cond)
+        text_embed = self.text_embed(text, seq_len, drop_text=drop_text)
+        mel_dim = cond.shape[-1]
+        weight = self.input_embed.proj.weight
+        return {
+            "mask": sequence_mask(x_lens, max_length=seq_len).to(cond.device),
+            "rope": self.rotary_embed.forward_from_seq_len(seq_len),
+            "proj_x": weight[:, :mel_dim],
+            "proj_static": F.linear(torch.cat((cond, text_embed), dim=-1), weight[:, mel_dim:], self.input_embed.proj.bias),
+        }
+
+    def forward_prepared(self, x0: float["b n d"], time: float["b"], dt, cache):  # noqa: F722 F821
+        """`forward(..., infer=True)` with the step-invariant work taken from `prepare_inference`; `dt` is the d_embed output."""
+        x = F.linear(x0.transpose(2, 1), cache["proj_x"]) + cache["proj_static"]
+        x = self.input_embed.conv_pos_embed(x) + x
+        t = self.time_embed(time) + dt
+
+        if self.long_skip_connection is not None:
+            residual = x
+
+        for block in self.transformer_blocks:
+            x = block(x, t, mask=cache["mask"], rope=cache["rope"])
+
+        if self.long_skip_connection is not None:
+            x = self.long_skip_connection(torch.cat((x, residual), dim=-1))
+
+        x = self.norm_out(x, t)
+        return self.proj_out(x)
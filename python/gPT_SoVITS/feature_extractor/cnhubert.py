@@ -96,6 +96,32 @@ def get_content(hmodel, wav_16k_tensor):
     return feats.transpose(1, 2)
 
 
+def get_content_batch(hubert, wav_16k_list, device, dtype=torch.float32):
+    """
+    多条16k波形一次前向，返回与逐条model.model(wav)["last_hidden_state"].transpose(1, 2)一致的[1, 768, T]列表。
+    hubert是HubertModel（CNHubert().model）。卷积特征提取里的GroupNorm在整条时间轴上做归一化，补零会改变结果，
+    所以卷积部分逐条跑，补齐到批内最长后带attention_mask一起过transformer：
+    padding帧在位置卷积前被置零、attention里被屏蔽，有效帧的输出与单条时相同。
+    """
+    with torch.no_grad():
+        feats = [
+            hubert.feature_extractor(torch.from_numpy(wav).to(device, dtype).unsqueeze(0)) for wav in wav_16k_list
+        ]  # [1, 512, T]
+        lengths = [feat.shape[-1] for feat in feats]
+        x = torch.zeros(len(feats), max(lengths), feats[0].shape[1], device=device, dtype=dtype)
+        attention_mask = torch.zeros(len(feats), max(lengths), device=device, dtype=torch.long)
+        for i, feat in enumerate(feats):
+            x[i, : lengths[i]] = feat[0].transpose(0, 1)
+            attention_mask[i, : lengths[i]] = 1
+        hidden_states = hubert.feature_projection(x)
+        if isinstance(hidden_states, tuple):
+            hidden_states = hidden_states[0]
+        if len(feats) == 1:
+            attention_mask = None
+        hidden_states = hubert.encoder(hidden_states, attention_mask=attention_mask)[0]
+    return [hidden_states[i : i + 1, : lengths[i]].transpose(1, 2).cpu() for i in range(len(feats))]
+
+
 if __name__ == "__main__":
     model = get_model()
     src_path = "/Users/Shared/原音频2.wav"
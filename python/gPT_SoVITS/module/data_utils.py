@@ -1,6 +1,8 @@
+import json
 import os
 import random
 import traceback
+import numpy as np
 import torch
 import torch.utils.data
 from tqdm import tqdm
@@ -9,10 +11,29 @@ from module.mel_processing import spectrogram_torch, spec_to_mel_torch
 from text import cleaned_text_to_sequence
 import torch.nn.functional as F
 from tools.my_utils import load_audio
+from tools.feature_store import FeatureStore
 
 version = os.environ.get("version", None)
 
 
+def load_ssl(path4, name, store=None):
+    ###2-get-hubert-wav32k.py默认写进4-cnhubert下的特征库，旧数据是逐条的.pt
+    if store is not None and name in store:
+        return store.get(name)
+    return torch.load("%s/%s.pt" % (path4, name), map_location="cpu")
+
+
+def phonemes_and_size(phoneme_data, path5, audiopath, version, packed=None):
+    """返回(音素id, 音频字节数)，不在phoneme_data里返回None；打包的shard里音素id读取时再取"""
+    if packed is not None:
+        return None, packed.audio_len(audiopath) * 2
+    try:
+        phoneme_ids = cleaned_text_to_sequence(phoneme_data[audiopath][0].split(" "), version)
+    except Exception:
+        return None
+    return phoneme_ids, os.path.getsize("%s/%s" % (path5, audiopath))
+
+
 # ZeroDivisionError fixed by Tybost (https://github.com/RVC-Boss/GPT-SoVITS/issues/79)
 class TextAudioSpeakerLoader(torch.utils.data.Dataset):
     """
@@ -23,33 +44,24 @@ class TextAudioSpeakerLoader(torch.utils.data.Dataset):
 
     def __init__(self, hparams, version=None, val=False):
         exp_dir = hparams.exp_dir
-        self.path2 = "%s/2-name2text.txt" % exp_dir
-        self.path4 = "%s/4-cnhubert" % exp_dir
-        self.path5 = "%s/5-wav32k" % exp_dir
-        assert os.path.exists(self.path2)
-        assert os.path.exists(self.path4)
-        assert os.path.exists(self.path5)
         self.is_v2Pro = version in {"v2Pro", "v2ProPlus"}
-        if self.is_v2Pro:
-            self.path7 = "%s/7-sv_cn" % exp_dir
-            assert os.path.exists(self.path7)
-        names4 = set([name[:-3] for name in list(os.listdir(self.path4))])  # 去除.pt后缀
-        names5 = set(os.listdir(self.path5))
-        if self.is_v2Pro:
-            names6 = set([name[:-3] for name in list(os.listdir(self.path7))])  # 去除.pt后缀
-        self.phoneme_data = {}
-        with open(self.path2, "r", encoding="utf8") as f:
-            lines = f.read().strip("\n").split("\n")
-
-        for line in lines:
-            tmp = line.split("\t")
-            if len(tmp) != 4:
-                continue
-            self.phoneme_data[tmp[0]] = [tmp[1]]
-        if self.is_v2Pro:
-            self.audiopaths_sid_text = list(set(self.phoneme_data) & names4 & names5 & names6)
+        ### 有打包好的shard（prepare_datasets/4-pack-s2.py）就直接读shard
+        packed_dir = "%s/%s" % (exp_dir, PACKED_S2_DIR)
+        self.packed = None
+        if PackedS2Shards.is_fresh(packed_dir, exp_dir, version):
+            self.packed = PackedS2Shards(packed_dir)
+            assert self.packed.meta["sampling_rate"] == hparams.sampling_rate
+            assert self.packed.meta["with_sv"] or not self.is_v2Pro
+            if self.packed.meta["with_spec"]:
+                assert self.packed.meta["filter_length"] == hparams.filter_length
+                assert self.packed.meta["hop_length"] == hparams.hop_length
+                assert self.packed.meta["win_length"] == hparams.win_length
+            print("using packed s2 dataset:", packed_dir)
+            self.phoneme_data = {}
+            self.path5 = None
+            self.audiopaths_sid_text = self.packed.keys()
         else:
-            self.audiopaths_sid_text = list(set(self.phoneme_data) & names4 & names5)
+            self.init_files(exp_dir)
         tmp = self.audiopaths_sid_text
         leng = len(tmp)
         min_num = 100
@@ -76,16 +88,12 @@ class TextAudioSpeakerLoader(torch.utils.data.Dataset):
         skipped_phone = 0
         skipped_dur = 0
         for audiopath in tqdm(self.audiopaths_sid_text):
-            try:
-                phoneme = self.phoneme_data[audiopath][0]
-                phoneme = phoneme.split(" ")
-                phoneme_ids = cleaned_text_to_sequence(phoneme, version)
-            except Exception:
+            item = phonemes_and_size(self.phoneme_data, self.path5, audiopath, version, self.packed)
+            if item is None:
                 print(f"{audiopath} not in self.phoneme_data !")
                 skipped_phone += 1
                 continue
-
-            size = os.path.getsize("%s/%s" % (self.path5, audiopath))
+            phoneme_ids, size = item
             duration = size / self.sampling_rate / 2
 
             if duration == 0:
@@ -106,18 +114,69 @@ class TextAudioSpeakerLoader(torch.utils.data.Dataset):
         self.audiopaths_sid_text = audiopaths_sid_text_new
         self.lengths = lengths
 
+    def init_files(self, exp_dir):
+        self.path2 = "%s/2-name2text.txt" % exp_dir
+        self.path4 = "%s/4-cnhubert" % exp_dir
+        self.path5 = "%s/5-wav32k" % exp_dir
+        assert os.path.exists(self.path2)
+        assert os.path.exists(self.path4)
+        assert os.path.exists(self.path5)
+        if self.is_v2Pro:
+            self.path7 = "%s/7-sv_cn" % exp_dir
+            assert os.path.exists(self.path7)
+        names4 = set([name[:-3] for name in list(os.listdir(self.path4))])  # 去除.pt后缀
+        self.ssl_store = FeatureStore.open_if_exists(self.path4)
+        if self.ssl_store is not None:
+            names4 |= set(self.ssl_store.names())
+        names5 = set(os.listdir(self.path5))
+        if self.is_v2Pro:
+            names6 = set([name[:-3] for name in list(os.listdir(self.path7))])  # 去除.pt后缀
+        self.phoneme_data = {}
+        with open(self.path2, "r", encoding="utf8") as f:
+            lines = f.read().strip("\n").split("\n")
+
+        for line in lines:
+            tmp = line.split("\t")
+            if len(tmp) != 4:
+                continue
+            self.phoneme_data[tmp[0]] = [tmp[1]]
+        if self.is_v2Pro:
+            self.audiopaths_sid_text = list(set(self.phoneme_data) & names4 & names5 & names6)
+        else:
+            self.audiopaths_sid_text = list(set(self.phoneme_data) & names4 & names5)
+
+    def get_packed(self, item):
+        wav = torch.from_numpy(item["audio"].astype(np.float32) / 32768).unsqueeze(0)
+        if "spec" in item:
+            spec = torch.from_numpy(item["spec"].T.astype(np.float32))
+        else:
+            spec = torch.squeeze(
+                spectrogram_torch(wav, self.filter_length, self.sampling_rate, self.hop_length, self.win_length, center=False),
+                0,
+            )
+        ssl = torch.from_numpy(np.ascontiguousarray(item["ssl"].T)).unsqueeze(0)
+        sv_emb = torch.from_numpy(np.array(item["sv"])).unsqueeze(0) if self.is_v2Pro else None
+        return spec, wav, ssl, sv_emb
+
     def get_audio_text_speaker_pair(self, audiopath_sid_text):
         audiopath, phoneme_ids = audiopath_sid_text
+        if self.packed is not None:
+            item = self.packed.get(audiopath)
+            phoneme_ids = item["phones"].tolist()
         text = torch.FloatTensor(phoneme_ids)
         try:
-            spec, wav = self.get_audio("%s/%s" % (self.path5, audiopath))
+            if self.packed is not None:
+                spec, wav, ssl, sv_emb = self.get_packed(item)
+            else:
+                spec, wav = self.get_audio("%s/%s" % (self.path5, audiopath))
             with torch.no_grad():
-                ssl = torch.load("%s/%s.pt" % (self.path4, audiopath), map_location="cpu")
+                if self.packed is None:
+                    ssl = load_ssl(self.path4, audiopath, self.ssl_store)
                 if ssl.shape[-1] != spec.shape[-1]:
                     typee = ssl.dtype
                     ssl = F.pad(ssl.float(), (0, 1), mode="replicate").to(typee)
                 ssl.requires_grad = False
-                if self.is_v2Pro:
+                if self.is_v2Pro and self.packed is None:
                     sv_emb = torch.load("%s/%s.pt" % (self.path7, audiopath), map_location="cpu")
         except:
             traceback.print_exc()
@@ -292,6 +351,9 @@ class TextAudioSpeakerLoaderV3(torch.utils.data.Dataset):
         assert os.path.exists(self.path4)
         assert os.path.exists(self.path5)
         names4 = set([name[:-3] for name in list(os.listdir(self.path4))])  # 去除.pt后缀
+        self.ssl_store = FeatureStore.open_if_exists(self.path4)
+        if self.ssl_store is not None:
+            names4 |= set(self.ssl_store.names())
         names5 = set(os.listdir(self.path5))
         self.phoneme_data = {}
         with open(self.path2, "r", encoding="utf8") as f:
@@ -330,16 +392,12 @@ class TextAudioSpeakerLoaderV3(torch.utils.data.Dataset):
         skipped_phone = 0
         skipped_dur = 0
         for audiopath in tqdm(self.audiopaths_sid_text):
-            try:
-                phoneme = self.phoneme_data[audiopath][0]
-                phoneme = phoneme.split(" ")
-                phoneme_ids = cleaned_text_to_sequence(phoneme, version)
-            except Exception:
+            item = phonemes_and_size(self.phoneme_data, self.path5, audiopath, version)
+            if item is None:
                 print(f"{audiopath} not in self.phoneme_data !")
                 skipped_phone += 1
                 continue
-
-            size = os.path.getsize("%s/%s" % (self.path5, audiopath))
+            phoneme_ids, size = item
             duration = size / self.sampling_rate / 2
 
             if duration == 0:
@@ -378,7 +436,7 @@ class TextAudioSpeakerLoaderV3(torch.utils.data.Dataset):
         try:
             spec, mel = self.get_audio("%s/%s" % (self.path5, audiopath))
             with torch.no_grad():
-                ssl = torch.load("%s/%s.pt" % (self.path4, audiopath), map_location="cpu")
+                ssl = load_ssl(self.path4, audiopath, self.ssl_store)
                 if ssl.shape[-1] != spec.shape[-1]:
                     typee = ssl.dtype
                     ssl = F.pad(ssl.float(), (0, 1), mode="replicate").to(typee)
@@ -530,6 +588,9 @@ class TextAudioSpeakerLoaderV4(torch.utils.data.Dataset):
         assert os.path.exists(self.path4)
         assert os.path.exists(self.path5)
         names4 = set([name[:-3] for name in list(os.listdir(self.path4))])  # 去除.pt后缀
+        self.ssl_store = FeatureStore.open_if_exists(self.path4)
+        if self.ssl_store is not None:
+            names4 |= set(self.ssl_store.names())
         names5 = set(os.listdir(self.path5))
         self.phoneme_data = {}
         with open(self.path2, "r", encoding="utf8") as f:
@@ -568,16 +629,12 @@ class TextAudioSpeakerLoaderV4(torch.utils.data.Dataset):
         skipped_phone = 0
         skipped_dur = 0
         for audiopath in tqdm(self.audiopaths_sid_text):
-            try:
-                phoneme = self.phoneme_data[audiopath][0]
-                phoneme = phoneme.split(" ")
-                phoneme_ids = cleaned_text_to_sequence(phoneme, version)
-            except Exception:
+            item = phonemes_and_size(self.phoneme_data, self.path5, audiopath, version)
+            if item is None:
                 print(f"{audiopath} not in self.phoneme_data !")
                 skipped_phone += 1
                 continue
-
-            size = os.path.getsize("%s/%s" % (self.path5, audiopath))
+            phoneme_ids, size = item
             duration = size / self.sampling_rate / 2
 
             if duration == 0:
@@ -616,7 +673,7 @@ class TextAudioSpeakerLoaderV4(torch.utils.data.Dataset):
         try:
             spec, mel = self.get_audio("%s/%s" % (self.path5, audiopath))
             with torch.no_grad():
-                ssl = torch.load("%s/%s.pt" % (self.path4, audiopath), map_location="cpu")
+                ssl = load_ssl(self.path4, audiopath, self.ssl_store)
                 if ssl.shape[-1] != spec.shape[-1]:
                     typee = ssl.dtype
                     ssl = F.pad(ssl.float(), (0, 1), mode="replicate").to(typee)
@@ -741,6 +798,9 @@ class TextAudioSpeakerLoaderV3b(torch.utils.data.Dataset):
         assert os.path.exists(self.path4)
         assert os.path.exists(self.path5)
         names4 = set([name[:-3] for name in list(os.listdir(self.path4))])  # 去除.pt后缀
+        self.ssl_store = FeatureStore.open_if_exists(self.path4)
+        if self.ssl_store is not None:
+            names4 |= set(self.ssl_store.names())
         names5 = set(os.listdir(self.path5))
         self.phoneme_data = {}
         with open(self.path2, "r", encoding="utf8") as f:
@@ -779,16 +839,12 @@ class TextAudioSpeakerLoaderV3b(torch.utils.data.Dataset):
         skipped_phone = 0
         skipped_dur = 0
         for audiopath in tqdm(self.audiopaths_sid_text):
-            try:
-                phoneme = self.phoneme_data[audiopath][0]
-                phoneme = phoneme.split(" ")
-                phoneme_ids = cleaned_text_to_sequence(phoneme, version)
-            except Exception:
+            item = phonemes_and_size(self.phoneme_data, self.path5, audiopath, version)
+            if item is None:
                 print(f"{audiopath} not in self.phoneme_data !")
                 skipped_phone += 1
                 continue
-
-            size = os.path.getsize("%s/%s" % (self.path5, audiopath))
+            phoneme_ids, size = item
             duration = size / self.sampling_rate / 2
 
             if duration == 0:
@@ -827,7 +883,7 @@ class TextAudioSpeakerLoaderV3b(torch.utils.data.Dataset):
         try:
             spec, mel, wav = self.get_audio("%s/%s" % (self.path5, audiopath))
             with torch.no_grad():
-                ssl = torch.load("%s/%s.pt" % (self.path4, audiopath), map_location="cpu")
+                ssl = load_ssl(self.path4, audiopath, self.ssl_store)
                 if ssl.shape[-1] != spec.shape[-1]:
                     typee = ssl.dtype
                     ssl = F.pad(ssl.float(), (0, 1), mode="replicate").to(typee)
@@ -1069,3 +1125,218 @@ class DistributedBucketSampler(torch.utils.data.distributed.DistributedSampler):
 
     def __len__(self):
         return self.num_samples // self.batch_size
+
+
+PACKED_S2_DIR = "8-s2-packed"
+PACKED_S2_FORMAT = 1
+# index每行：audio起点、audio长度、ssl起点、ssl帧数、phones起点、phones长度、spec起点、spec帧数
+PACKED_S2_INDEX_COLS = 8
+
+
+def s2_source_stamps(exp_dir, is_v2Pro):
+    """打包所用的源数据的戳：文件记大小和mtime，目录记条目数和其中最新的mtime（特征库的.idx追加写入也会体现）"""
+    stamps = {}
+    sources = ["2-name2text.txt", "4-cnhubert", "5-wav32k"] + (["7-sv_cn"] if is_v2Pro else [])
+    for name in sources:
+        path = "%s/%s" % (exp_dir, name)
+        if not os.path.exists(path):
+            stamps[name] = None
+        elif os.path.isdir(path):
+            entries = list(os.scandir(path))
+            mtime = max([os.stat(path).st_mtime] + [entry.stat().st_mtime for entry in entries])
+            stamps[name] = [len(entries), int(mtime)]
+        else:
+            stat = os.stat(path)
+            stamps[name] = [stat.st_size, int(stat.st_mtime)]
+    return stamps
+
+
+class PackedS2Shards:
+    """
+    s2训练集的打包格式（prepare_datasets/4-pack-s2.py生成），按音频长度排序后分成若干shard，
+    每个shard是几块连续的二进制数据加一个index：
+        audio.bin  int16 波形
+        ssl.bin    fp16 (帧, 768)
+        phones.bin int16 音素id
+        sv.bin     fp16 (条, 20480)，仅v2Pro
+        spec.bin   fp16 (帧, filter_length//2+1)，可选
+    读取时用np.memmap按index切片，不再逐条打开文件。memmap在每个进程第一次读取时才打开，
+    DataLoader的worker不会把整块数据pickle过去。
+    """
+
+    def __init__(self, packed_dir):
+        self.packed_dir = packed_dir
+        with open("%s/meta.json" % packed_dir, "r", encoding="utf8") as f:
+            self.meta = json.load(f)
+        if self.meta["format"] != PACKED_S2_FORMAT:
+            raise ValueError("unsupported packed s2 format %s in %s" % (self.meta["format"], packed_dir))
+        self.indexes = [np.load("%s/%s/index.npy" % (packed_dir, shard["dir"])) for shard in self.meta["shards"]]
+        self.maps = {}
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["maps"] = {}
+        return state
+
+    @staticmethod
+    def is_fresh(packed_dir, exp_dir, version=None):
+        meta_path = "%s/meta.json" % packed_dir
+        if not os.path.exists(meta_path):
+            return False
+        with open(meta_path, "r", encoding="utf8") as f:
+            meta = json.load(f)
+        if meta.get("format") != PACKED_S2_FORMAT or meta.get("version") != version:
+            return False
+        if meta.get("source_stamps") != s2_source_stamps(exp_dir, meta["with_sv"]):
+            print("packed s2 dataset is older than the files in %s, ignored" % exp_dir)
+            return False
+        return True
+
+    def keys(self):
+        return [(k, row) for k, index in enumerate(self.indexes) for row in range(len(index))]
+
+    def audio_len(self, key):
+        return int(self.indexes[key[0]][key[1], 1])
+
+    def _open(self, k):
+        if k not in self.maps:
+            shard_dir = "%s/%s" % (self.packed_dir, self.meta["shards"][k]["dir"])
+            maps = {
+                "audio": np.memmap("%s/audio.bin" % shard_dir, dtype=np.int16, mode="r"),
+                "phones": np.memmap("%s/phones.bin" % shard_dir, dtype=np.int16, mode="r"),
+                "ssl": np.memmap("%s/ssl.bin" % shard_dir, dtype=np.float16, mode="r").reshape(-1, self.meta["ssl_dim"]),
+            }
+            if self.meta["with_sv"]:
+                maps["sv"] = np.memmap("%s/sv.bin" % shard_dir, dtype=np.float16, mode="r").reshape(-1, self.meta["sv_dim"])
+            if self.meta["with_spec"]:
+                maps["spec"] = np.memmap("%s/spec.bin" % shard_dir, dtype=np.float16, mode="r").reshape(
+                    -1, self.meta["spec_dim"]
+                )
+            self.maps[k] = maps
+        return self.maps[k]
+
+    def get(self, key):
+        k, row = key
+        maps = self._open(k)
+        a0, a1, s0, s1, p0, p1, f0, f1 = self.indexes[k][row].tolist()
+        item = {
+            "audio": maps["audio"][a0 : a0 + a1],
+            "ssl": maps["ssl"][s0 : s0 + s1],
+            "phones": maps["phones"][p0 : p0 + p1],
+        }
+        if "sv" in maps:
+            item["sv"] = maps["sv"][row]
+        if "spec" in maps:
+            item["spec"] = maps["spec"][f0 : f0 + f1]
+        return item
+
+
+def pack_s2_dataset(exp_dir, hparams, version=None, with_spec=False, shard_size=1000):
+    """
+    把2-name2text.txt、4-cnhubert、5-wav32k（v2Pro还有7-sv_cn）打包成PackedS2Shards。
+    hparams是s2配置里的data部分。数据逐条追加写入，内存占用只有单条样本大小。
+    """
+    import soundfile
+
+    is_v2Pro = version in {"v2Pro", "v2ProPlus"}
+    path2 = "%s/2-name2text.txt" % exp_dir
+    path4 = "%s/4-cnhubert" % exp_dir
+    path5 = "%s/5-wav32k" % exp_dir
+    path7 = "%s/7-sv_cn" % exp_dir
+    packed_dir = "%s/%s" % (exp_dir, PACKED_S2_DIR)
+    ### shard 会被原地覆盖，先删掉旧的 meta.json，打包中途失败时旧的打包不会再被加载
+    os.makedirs(packed_dir, exist_ok=True)
+    if os.path.exists("%s/meta.json" % packed_dir):
+        os.remove("%s/meta.json" % packed_dir)
+    source_stamps = s2_source_stamps(exp_dir, is_v2Pro)
+    with open(path2, "r", encoding="utf8") as f:
+        lines = f.read().strip("\n").split("\n")
+    phoneme_data = {}
+    for line in lines:
+        tmp = line.split("\t")
+        if len(tmp) == 4:
+            phoneme_data[tmp[0]] = tmp[1]
+    ssl_store = FeatureStore.open_if_exists(path4)
+    names4 = set([name[:-3] for name in os.listdir(path4)])
+    if ssl_store is not None:
+        names4 |= set(ssl_store.names())
+    names = set(phoneme_data) & names4 & set(os.listdir(path5))
+    if is_v2Pro:
+        names &= set([name[:-3] for name in os.listdir(path7)])
+    ### 按音频长度排序，长度相近的样本落在同一个shard里，分桶采样时读取更集中
+    names = sorted(names, key=lambda name: os.path.getsize("%s/%s" % (path5, name)))
+    print("packing %d samples into %s" % (len(names), packed_dir))
+
+    shards = []
+    ssl_dim = sv_dim = None
+    spec_dim = hparams["filter_length"] // 2 + 1
+    for start in range(0, len(names), shard_size):
+        shard_name = "shard_%04d" % len(shards)
+        shard_dir = "%s/%s" % (packed_dir, shard_name)
+        os.makedirs(shard_dir, exist_ok=True)
+        files = {key: open("%s/%s.bin" % (shard_dir, key), "wb") for key in ["audio", "ssl", "phones", "sv", "spec"]}
+        offsets = {key: 0 for key in ["audio", "ssl", "phones", "spec"]}
+        index = []
+        shard_names = []
+        for name in tqdm(names[start : start + shard_size], desc=shard_name):
+            try:
+                audio, sr = soundfile.read("%s/%s" % (path5, name), dtype="int16")
+                if sr != hparams["sampling_rate"] or len(audio.shape) > 1:
+                    audio = load_audio("%s/%s" % (path5, name), hparams["sampling_rate"])
+                    audio = np.clip(np.round(audio * 32768), -32768, 32767).astype(np.int16)
+                ssl = load_ssl(path4, name, ssl_store)[0].T.half().numpy()
+                phones = np.asarray(cleaned_text_to_sequence(phoneme_data[name].split(" "), version), dtype=np.int16)
+                ssl_dim = ssl.shape[1]
+                if is_v2Pro:
+                    sv = torch.load("%s/%s.pt" % (path7, name), map_location="cpu").reshape(-1).half().numpy()
+                    sv_dim = sv.shape[0]
+                if with_spec:
+                    wav = torch.from_numpy(audio.astype(np.float32) / 32768).unsqueeze(0)
+                    spec = spectrogram_torch(
+                        wav, hparams["filter_length"], hparams["sampling_rate"], hparams["hop_length"], hparams["win_length"], center=False
+                    )[0].T.half().numpy()
+            except Exception:
+                print(name, "->skipped->", traceback.format_exc())
+                continue
+            row = [offsets["audio"], len(audio), offsets["ssl"], len(ssl), offsets["phones"], len(phones), 0, 0]
+            files["audio"].write(audio.tobytes())
+            files["ssl"].write(np.ascontiguousarray(ssl).tobytes())
+            files["phones"].write(phones.tobytes())
+            offsets["audio"] += len(audio)
+            offsets["ssl"] += len(ssl)
+            offsets["phones"] += len(phones)
+            if is_v2Pro:
+                files["sv"].write(sv.tobytes())
+            if with_spec:
+                row[6:] = [offsets["spec"], len(spec)]
+                files["spec"].write(np.ascontiguousarray(spec).tobytes())
+                offsets["spec"] += len(spec)
+            index.append(row)
+            shard_names.append(name)
+        for f in files.values():
+            f.close()
+        np.save("%s/index.npy" % shard_dir, np.asarray(index, dtype=np.int64).reshape(-1, PACKED_S2_INDEX_COLS))
+        with open("%s/names.txt" % shard_dir, "w", encoding="utf8") as f:
+            f.write("\n".join(shard_names))
+        if len(index) > 0:
+            shards.append({"dir": shard_name, "count": len(index)})
+
+    meta = {
+        "format": PACKED_S2_FORMAT,
+        "version": version,
+        "sampling_rate": hparams["sampling_rate"],
+        "filter_length": hparams["filter_length"],
+        "hop_length": hparams["hop_length"],
+        "win_length": hparams["win_length"],
+        "ssl_dim": ssl_dim or 768,
+        "sv_dim": sv_dim or 20480,
+        "spec_dim": spec_dim,
+        "with_sv": is_v2Pro,
+        "with_spec": with_spec,
+        "shards": shards,
+        "source_stamps": source_stamps,
+    }
+    ### meta.json最后写，中途失败的打包不会被加载
+    with open("%s/meta.json" % packed_dir, "w", encoding="utf8") as f:
+        json.dump(meta, f, indent=2)
+    return meta
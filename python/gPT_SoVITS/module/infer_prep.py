@@ -0,0 +1,148 @@
+"""
+SoVITS推理前的整理，TTS.init_vits_weights加载权重后调用：
+    去掉只在训练时用到的子模块（enc_q、判别器）；
+    把weight_norm/spectral_norm折叠进普通权重，推理时不再每次forward重算；
+    可选torch.compile（dynamic=True，不同长度不重复编译）；
+    可选数值校验：整理前后在同一组随机输入、同一随机种子下对比decode输出，超出容差就退回未整理的模型。
+"""
+
+import copy
+import time
+
+import torch
+from torch.nn.utils import parametrize
+from torch.nn.utils.spectral_norm import SpectralNorm
+from torch.nn.utils.weight_norm import WeightNorm
+
+TRAINING_ONLY_MODULES = ["enc_q"]
+
+
+def drop_training_modules(model):
+    dropped = []
+    for name in TRAINING_ONLY_MODULES:
+        if hasattr(model, name):
+            delattr(model, name)
+            dropped.append(name)
+    for name, child in list(model.named_children()):
+        if "Discriminator" in type(child).__name__:
+            delattr(model, name)
+            dropped.append(name)
+    return dropped
+
+
+def _norm_hooks(model):
+    for module in model.modules():
+        for hook in module._forward_pre_hooks.values():
+            if isinstance(hook, (WeightNorm, SpectralNorm)):
+                yield module, hook
+
+
+def copy_model(model):
+    """旧接口weight_norm/spectral_norm的weight是算出来的非叶子张量，deepcopy会报错：复制前先摘掉，复制后两边按g/v重新算"""
+    hooked = list(_norm_hooks(model))
+    for module, hook in hooked:
+        delattr(module, hook.name)
+    try:
+        reference = copy.deepcopy(model)
+    finally:
+        for module, hook in hooked:
+            setattr(module, hook.name, _compute_weight(module, hook))
+    for module, hook in _norm_hooks(reference):
+        setattr(module, hook.name, _compute_weight(module, hook))
+    return reference
+
+
+def _compute_weight(module, hook):
+    if isinstance(hook, SpectralNorm):
+        return hook.compute_weight(module, do_power_iteration=False)
+    return hook.compute_weight(module)
+
+
+def fold_weight_norm(model):
+    """折叠旧接口（forward pre hook）和parametrizations两种写法的weight_norm/spectral_norm，返回折叠的个数"""
+    folded = 0
+    for module in model.modules():
+        for hook in list(module._forward_pre_hooks.values()):
+            if isinstance(hook, WeightNorm):
+                torch.nn.utils.remove_weight_norm(module, hook.name)
+                folded += 1
+            elif isinstance(hook, SpectralNorm):
+                torch.nn.utils.remove_spectral_norm(module, hook.name)
+                folded += 1
+        if parametrize.is_parametrized(module):
+            for name in list(module.parametrizations.keys()):
+                parametrize.remove_parametrizations(module, name, leave_parametrized=True)
+                folded += 1
+    return folded
+
+
+def compile_decoders(model):
+    """编译耗时最多的部分：v1/v2的HiFi-GAN dec和flow，v3/v4的DiT单步。只替换bound method，state_dict不变"""
+    compiled = []
+    targets = [("dec", "forward"), ("flow", "forward")]
+    if hasattr(model, "cfm"):
+        targets = [("cfm.estimator", "forward_prepared")]
+    for path, method in targets:
+        module = model
+        for attr in path.split("."):
+            module = getattr(module, attr, None)
+        if module is None:
+            continue
+        setattr(module, method, torch.compile(getattr(module, method), dynamic=True))
+        compiled.append("%s.%s" % (path, method))
+    return compiled
+
+
+def _dummy_inputs(model, device, dtype, n_codes=50, n_phones=30, n_refer=150):
+    g = torch.Generator().manual_seed(0)
+    codes = torch.randint(0, model.quantizer.bins, (1, 1, n_codes), generator=g).to(device)
+    text = torch.randint(1, model.enc_p.text_embedding.num_embeddings, (1, n_phones), generator=g).to(device)
+    refer = torch.rand(1, model.spec_channels, n_refer, generator=g).to(device, dtype)
+    sv_emb = torch.randn(1, 20480, generator=g).to(device, dtype) if getattr(model, "is_v2pro", False) else None
+    return codes, text, refer, sv_emb
+
+
+@torch.no_grad()
+def _run(model, inputs):
+    codes, text, refer, sv_emb = inputs
+    with torch.random.fork_rng(devices=[refer.device] if refer.is_cuda else []):
+        torch.manual_seed(0)
+        if not hasattr(model, "cfm"):
+            return model.decode(codes, text, refer, sv_emb=sv_emb)
+        ### v3/v4：enc_p到wns1，再用空prompt跑几步CFM
+        fea = model.decode_encp(codes, text, refer)[0].transpose(2, 1)
+        x_lens = torch.LongTensor([fea.size(1)]).to(fea.device)
+        prompt = torch.zeros(1, model.cfm.in_channels, 0, device=fea.device, dtype=fea.dtype)
+        return model.cfm.inference(fea, x_lens, prompt, 4)
+
+
+def check_equivalence(reference, model, tol=None):
+    """返回(是否通过, 最大绝对误差, 相对误差)，相对误差以参考输出的最大绝对值为分母"""
+    param = next(model.parameters())
+    inputs = _dummy_inputs(model, param.device, param.dtype)
+    expected = _run(reference, inputs).float()
+    actual = _run(model, inputs).float()
+    max_err = (expected - actual).abs().max().item()
+    rel_err = max_err / max(expected.abs().max().item(), 1e-9)
+    if tol is None:
+        tol = 1e-2 if param.dtype == torch.float16 else 1e-4
+    return rel_err <= tol, max_err, rel_err
+
+
+def prepare_for_inference(model, compile=False, verify=False):
+    t0 = time.perf_counter()
+    reference = copy_model(model) if verify else None
+    dropped = drop_training_modules(model)
+    folded = fold_weight_norm(model)
+    compiled = compile_decoders(model) if compile else []
+    print(
+        "prepare SoVITS for inference: dropped %s, folded %d weight norms, compiled %s (%.2fs)"
+        % (dropped or "nothing", folded, compiled or "nothing", time.perf_counter() - t0)
+    )
+    if verify:
+        ok, max_err, rel_err = check_equivalence(reference, model)
+        print("prepare SoVITS check: max abs err %.3e, rel err %.3e -> %s" % (max_err, rel_err, "ok" if ok else "mismatch"))
+        if not ok:
+            print("prepared SoVITS model does not match, falling back to the unprepared model")
+            return reference
+    return model
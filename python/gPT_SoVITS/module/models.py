@@ -958,7 +958,12 @@ class SynthesizerTrn(nn.Module):
         return o, y_mask, (z, z_p, m_p, logs_p)
 
     @torch.no_grad()
-    def decode(self, codes, text, refer, noise_scale=0.5, speed=1, sv_emb=None):
+    def compute_ge(self, refer, sv_emb=None):
+        """
+        Global speaker conditioning of the reference spec(s), fused with the sv embedding for v2Pro.
+        Only depends on the reference audio, so callers can compute it once and pass it to decode.
+        """
+
         def get_ge(refer, sv_emb):
             ge = None
             if refer is not None:
@@ -982,6 +987,12 @@ class SynthesizerTrn(nn.Module):
             ge = torch.stack(ges, 0).mean(0)
         else:
             ge = get_ge(refer, sv_emb)
+        return ge
+
+    @torch.no_grad()
+    def decode(self, codes, text, refer, noise_scale=0.5, speed=1, sv_emb=None, ge=None):
+        if ge is None:
+            ge = self.compute_ge(refer, sv_emb)
 
         y_lengths = torch.LongTensor([codes.size(2) * 2]).to(codes.device)
         text_lengths = torch.LongTensor([text.size(-1)]).to(text.device)
@@ -1021,11 +1032,12 @@ class CFM(torch.nn.Module):
 
         self.criterion = torch.nn.MSELoss()
 
-        self.use_conditioner_cache = True
-
     @torch.inference_mode()
-    def inference(self, mu, x_lens, prompt, n_timesteps, temperature=1.0, inference_cfg_rate=0):
-        """Forward diffusion"""
+    def inference(self, mu, x_lens, prompt, n_timesteps, temperature=1.0, inference_cfg_rate=0, solver="euler"):
+        """Forward diffusion
+        solver: euler每步1次DiT；midpoint/heun每步2次，步数减半时质量一般好于同样次数的euler。
+        shortcut模型以步长d为条件，midpoint的半步用d/2作条件。
+        """
         B, T = mu.size(0), mu.size(1)
         x = torch.randn([B, self.in_channels, T], device=mu.device, dtype=mu.dtype) * temperature
         prompt_len = prompt.size(-1)
@@ -1033,52 +1045,38 @@ class CFM(torch.nn.Module):
         prompt_x[..., :prompt_len] = prompt[..., :prompt_len]
         x[..., :prompt_len] = 0
         mu = mu.transpose(2, 1)
+        ###mask、rope、文本和参考的输入投影与步数无关，循环外只算一次；dt嵌入按步长缓存
+        cache = self.estimator.prepare_inference(prompt_x, mu, x_lens, T)
+        if inference_cfg_rate > 1e-5:
+            cfg_cache = self.estimator.prepare_inference(prompt_x, mu, x_lens, T, drop_audio_cond=True, drop_text=True)
+        dt_cache = {}
+
+        def velocity(x, t, d):
+            if d not in dt_cache:
+                dt_cache[d] = self.estimator.d_embed(torch.full((B,), d, device=x.device, dtype=mu.dtype))
+            t_tensor = torch.full((B,), t, device=x.device, dtype=mu.dtype)
+            v_pred = self.estimator.forward_prepared(x, t_tensor, dt_cache[d], cache).transpose(2, 1)
+            if inference_cfg_rate > 1e-5:
+                neg = self.estimator.forward_prepared(x, t_tensor, dt_cache[d], cfg_cache).transpose(2, 1)
+                v_pred = v_pred + (v_pred - neg) * inference_cfg_rate
+            return v_pred
+
         t = 0
         d = 1 / n_timesteps
-        text_cache = None
-        text_cfg_cache = None
-        dt_cache = None
-        d_tensor = torch.ones(x.shape[0], device=x.device, dtype=mu.dtype) * d
         for j in range(n_timesteps):
-            t_tensor = torch.ones(x.shape[0], device=x.device, dtype=mu.dtype) * t
-            # v_pred = model(x, t_tensor, d_tensor, **extra_args)
-            v_pred, text_emb, dt = self.estimator(
-                x,
-                prompt_x,
-                x_lens,
-                t_tensor,
-                d_tensor,
-                mu,
-                use_grad_ckpt=False,
-                drop_audio_cond=False,
-                drop_text=False,
-                infer=True,
-                text_cache=text_cache,
-                dt_cache=dt_cache,
-            )
-            v_pred = v_pred.transpose(2, 1)
-            if self.use_conditioner_cache:
-                text_cache = text_emb
-                dt_cache = dt
-            if inference_cfg_rate > 1e-5:
-                neg, text_cfg_emb, _ = self.estimator(
-                    x,
-                    prompt_x,
-                    x_lens,
-                    t_tensor,
-                    d_tensor,
-                    mu,
-                    use_grad_ckpt=False,
-                    drop_audio_cond=True,
-                    drop_text=True,
-                    infer=True,
-                    text_cache=text_cfg_cache,
-                    dt_cache=dt_cache,
-                )
-                neg = neg.transpose(2, 1)
-                if self.use_conditioner_cache:
-                    text_cfg_cache = text_cfg_emb
-                v_pred = v_pred + (v_pred - neg) * inference_cfg_rate
+            if solver == "euler":
+                v_pred = velocity(x, t, d)
+            elif solver == "midpoint":
+                x_mid = x + d / 2 * velocity(x, t, d / 2)
+                x_mid[:, :, :prompt_len] = 0
+                v_pred = velocity(x_mid, t + d / 2, d)
+            elif solver == "heun":
+                v_1 = velocity(x, t, d)
+                x_pred = x + d * v_1
+                x_pred[:, :, :prompt_len] = 0
+                v_pred = (v_1 + velocity(x_pred, t + d, d)) / 2
+            else:
+                raise ValueError("unknown cfm solver: %s" % solver)
             x = x + d * v_pred
             t = t + d
             x[:, :, :prompt_len] = 0
@@ -1125,6 +1123,21 @@ def set_no_grad(net_g):
         param.requires_grad = False
 
 
+def extract_latent_batch(vq_model, ssl_list):
+    """
+    多条ssl（[1, 768, T]，已在模型的device/dtype上）补齐后一次extract_latent，返回每条的第一层codes（对应逐条时的codes[0, 0]）。
+    ssl_proj是kernel=stride的卷积、量化逐帧独立，末尾补零只影响补出来的帧，截回各自长度即与逐条结果一致。
+    """
+    lengths = [ssl.shape[-1] for ssl in ssl_list]
+    x = torch.zeros(len(ssl_list), ssl_list[0].shape[1], max(lengths), device=ssl_list[0].device, dtype=ssl_list[0].dtype)
+    for i, ssl in enumerate(ssl_list):
+        x[i, :, : lengths[i]] = ssl[0]
+    codes = vq_model.extract_latent(x)  # [B, n_q, T']
+    kernel_size = vq_model.ssl_proj.kernel_size[0]
+    stride = vq_model.ssl_proj.stride[0]
+    return [codes[i, 0, : (length - kernel_size) // stride + 1] for i, length in enumerate(lengths)]
+
+
 class SynthesizerTrnV3(nn.Module):
     """
     Synthesizer for Training
@@ -1241,14 +1254,18 @@ class SynthesizerTrnV3(nn.Module):
         cfm_loss = self.cfm(mel, mel_lengths, prompt_len, fea, use_grad_ckpt)
         return cfm_loss
 
+    @torch.no_grad()
+    def compute_ge(self, refer):
+        refer_lengths = torch.LongTensor([refer.size(2)]).to(refer.device)
+        refer_mask = torch.unsqueeze(commons.sequence_mask(refer_lengths, refer.size(2)), 1).to(refer.dtype)
+        return self.ref_enc(refer[:, :704] * refer_mask, refer_mask)
+
     @torch.no_grad()
     def decode_encp(self, codes, text, refer, ge=None, speed=1):
         # print(2333333,refer.shape)
         # ge=None
         if ge == None:
-            refer_lengths = torch.LongTensor([refer.size(2)]).to(refer.device)
-            refer_mask = torch.unsqueeze(commons.sequence_mask(refer_lengths, refer.size(2)), 1).to(refer.dtype)
-            ge = self.ref_enc(refer[:, :704] * refer_mask, refer_mask)
+            ge = self.compute_ge(refer)
         y_lengths = torch.LongTensor([int(codes.size(2) * 2)]).to(codes.device)
         if speed == 1:
             sizee = int(codes.size(2) * (3.875 if self.version == "v3" else 4))
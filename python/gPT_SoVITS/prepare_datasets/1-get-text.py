@@ -18,6 +18,7 @@ version = os.environ.get("version", None)
 import traceback
 import os.path
 from text.cleaner import clean_text
+from text.text_cache import text_feature_cache
 from transformers import AutoModelForMaskedLM, AutoTokenizer
 from tools.my_utils import clean_path
 
@@ -83,16 +84,55 @@ if os.path.exists(txt_path) == False:
 
         return phone_level_feature.T
 
+    ### 同一句文本（口头禅、数字读法等）只做一次 g2p 和 Bert
+    cache_tag = "prepare|%s|%s" % (os.path.abspath(bert_pretrained_dir), "half" if is_half else "float")
+
+    def prefetch_g2p(data):
+        ### 一批行里所有中文句子的多音字一次性送进g2pw
+        if version == "v1":
+            return
+        from text import chinese2
+
+        zh_texts = []
+        for name, text, lan in data:
+            text = text.replace("%", "-").replace("￥", ",")
+            ### 只判断在不在缓存里，不计入命中统计
+            if lan == "zh" and text_feature_cache.make_key(text, lan, version, cache_tag) not in text_feature_cache:
+                zh_texts.append(text)
+        if len(zh_texts) > 0:
+            chinese2.prefetch(zh_texts)
+
+    g2p_batch_lines = int(os.environ.get("g2p_batch_lines", 256))
+
     def process(data, res):
+        for start in range(0, len(data), g2p_batch_lines):
+            try:
+                prefetch_g2p(data[start : start + g2p_batch_lines])
+            except:
+                ###预取失败不影响逐行处理
+                print(traceback.format_exc())
+            process_lines(data[start : start + g2p_batch_lines], res)
+
+    def process_lines(data, res):
         for name, text, lan in data:
             try:
                 name = clean_path(name)
                 name = os.path.basename(name)
                 print(name)
-                phones, word2ph, norm_text = clean_text(text.replace("%", "-").replace("￥", ","), lan, version)
+                text = text.replace("%", "-").replace("￥", ",")
+                cache_key = text_feature_cache.make_key(text, lan, version, cache_tag)
+                entry = text_feature_cache.get(cache_key)
+                if entry is None:
+                    phones, word2ph, norm_text = clean_text(text, lan, version)
+                    entry = {"phones": phones, "word2ph": word2ph, "norm_text": norm_text, "bert_features": None}
+                    text_feature_cache.put(cache_key, entry)
+                phones, word2ph, norm_text = entry["phones"], entry["word2ph"], entry["norm_text"]
                 path_bert = "%s/%s.pt" % (bert_dir, name)
                 if os.path.exists(path_bert) == False and lan == "zh":
-                    bert_feature = get_bert_feature(norm_text, word2ph)
+                    if entry["bert_features"] is None:
+                        entry["bert_features"] = get_bert_feature(norm_text, word2ph)
+                        text_feature_cache.put(cache_key, entry)
+                    bert_feature = entry["bert_features"]
                     assert bert_feature.shape[-1] == len(phones)
                     # torch.save(bert_feature, path_bert)
                     my_save(bert_feature, path_bert)
@@ -136,6 +176,7 @@ if os.path.exists(txt_path) == False:
             print(line, traceback.format_exc())
 
     process(todo, res)
+    print("text feature cache:", text_feature_cache.stats())
     opt = []
     for name, phones, word2ph, norm_text in res:
         opt.append("%s\t%s\t%s\t%s" % (name, phones, word2ph, norm_text))
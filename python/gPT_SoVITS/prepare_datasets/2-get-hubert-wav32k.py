@@ -25,7 +25,8 @@ import librosa
 
 now_dir = os.getcwd()
 sys.path.append(now_dir)
-from tools.my_utils import load_audio, clean_path
+from tools.my_utils import load_many, clean_path, report_decode_stats
+from tools.feature_store import FeatureStore, length_buckets
 
 # from config import cnhubert_base_path
 # cnhubert.cnhubert_base_path=cnhubert_base_path
@@ -73,41 +74,66 @@ else:
     model = model.to(device)
 
 nan_fails = []
+###按长度分桶成批过HuBERT，特征追加写进4-cnhubert下的feats-{i_part}.bin/.idx（hubert_store=False时仍逐条存.pt）
+batch_size = int(os.environ.get("hubert_batch_size", 16))
+max_batch_samples = int(float(os.environ.get("hubert_batch_seconds", 200)) * 16000)
+chunk_size = int(os.environ.get("hubert_chunk", 256))
+use_store = eval(os.environ.get("hubert_store", "True"))
+store = FeatureStore(hubert_dir, part=i_part) if use_store else None
 
 
-def name2go(wav_name, wav_path):
-    hubert_path = "%s/%s.pt" % (hubert_dir, wav_name)
-    if os.path.exists(hubert_path):
-        return
-    tmp_audio = load_audio(wav_path, 32000)
+def prepare(wav_name, tmp_audio):
     tmp_max = np.abs(tmp_audio).max()
     if tmp_max > 2.2:
         print("%s-filtered,%s" % (wav_name, tmp_max))
-        return
+        return None
     tmp_audio32 = (tmp_audio / tmp_max * (maxx * alpha * 32768)) + ((1 - alpha) * 32768) * tmp_audio
     tmp_audio32b = (tmp_audio / tmp_max * (maxx * alpha * 1145.14)) + ((1 - alpha) * 1145.14) * tmp_audio
     tmp_audio = librosa.resample(tmp_audio32b, orig_sr=32000, target_sr=16000)  # 不是重采样问题
-    tensor_wav16 = torch.from_numpy(tmp_audio)
-    if is_half == True:
-        tensor_wav16 = tensor_wav16.half().to(device)
-    else:
-        tensor_wav16 = tensor_wav16.to(device)
-    ssl = model.model(tensor_wav16.unsqueeze(0))["last_hidden_state"].transpose(1, 2).cpu()  # torch.Size([1, 768, 215])
-    if np.isnan(ssl.detach().numpy()).sum() != 0:
-        nan_fails.append((wav_name, wav_path))
-        print("nan filtered:%s" % wav_name)
-        return
-    wavfile.write(
-        "%s/%s" % (wav32dir, wav_name),
-        32000,
-        tmp_audio32.astype("int16"),
-    )
-    my_save(ssl, hubert_path)
+    return tmp_audio32.astype("int16"), tmp_audio
+
+
+def is_done(wav_name):
+    if store is not None and wav_name in store:
+        return True
+    return os.path.exists("%s/%s.pt" % (hubert_dir, wav_name))
+
+
+def names2go(todo):
+    audios = load_many([wav_path for wav_name, wav_path in todo], 32000)
+    items = []
+    for (wav_name, wav_path), tmp_audio in zip(todo, audios):
+        if tmp_audio is None:
+            continue
+        try:
+            prepared = prepare(wav_name, tmp_audio)
+        except:
+            print(wav_name, traceback.format_exc())
+            continue
+        if prepared is not None:
+            items.append((wav_name, wav_path) + prepared)
+    dtype = torch.float16 if is_half == True else torch.float32
+    for batch in length_buckets([len(item[3]) for item in items], batch_size, max_batch_samples):
+        batch = [items[i] for i in batch]
+        ssl_list = cnhubert.get_content_batch(model.model, [item[3] for item in batch], device, dtype)
+        for (wav_name, wav_path, tmp_audio32, _), ssl in zip(batch, ssl_list):  # torch.Size([1, 768, 215])
+            if torch.isnan(ssl).any():
+                nan_fails.append((wav_name, wav_path))
+                print("nan filtered:%s" % wav_name)
+                continue
+            wavfile.write("%s/%s" % (wav32dir, wav_name), 32000, tmp_audio32)
+            if store is not None:
+                store.add(wav_name, ssl)
+            else:
+                my_save(ssl, "%s/%s.pt" % (hubert_dir, wav_name))
+        if store is not None:
+            store.flush()
 
 
 with open(inp_text, "r", encoding="utf8") as f:
     lines = f.read().strip("\n").split("\n")
 
+todo = []
 for line in lines[int(i_part) :: int(all_parts)]:
     try:
         # wav_name,text=line.split("\t")
@@ -120,15 +146,28 @@ for line in lines[int(i_part) :: int(all_parts)]:
         else:
             wav_path = wav_name
             wav_name = os.path.basename(wav_name)
-        name2go(wav_name, wav_path)
+        if not is_done(wav_name):
+            todo.append((wav_name, wav_path))
     except:
         print(line, traceback.format_exc())
 
+t0 = ttime()
+for start in range(0, len(todo), chunk_size):
+    try:
+        with torch.no_grad():
+            names2go(todo[start : start + chunk_size])
+    except:
+        print(traceback.format_exc())
+print("hubert: %d items in %.1fs" % (len(todo), ttime() - t0))
+
 if len(nan_fails) > 0 and is_half == True:
     is_half = False
     model = model.float()
-    for wav in nan_fails:
-        try:
-            name2go(wav[0], wav[1])
-        except:
-            print(wav_name, traceback.format_exc())
+    try:
+        names2go(list(nan_fails))
+    except:
+        print(traceback.format_exc())
+
+if store is not None:
+    store.close()
+report_decode_stats()
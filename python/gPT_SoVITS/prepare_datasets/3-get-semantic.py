@@ -41,6 +41,8 @@ if version != "v3":
     from module.models import SynthesizerTrn
 else:
     from module.models import SynthesizerTrnV3 as SynthesizerTrn
+from module.models import extract_latent_batch
+from tools.feature_store import FeatureStore, length_buckets
 from tools.my_utils import clean_path
 
 logging.getLogger("numba").setLevel(logging.WARNING)
@@ -86,23 +88,44 @@ if os.path.exists(semantic_path) == False:
         )
     )
 
-    def name2go(wav_name, lines):
+    ###4-cnhubert下的特征库（2-get-hubert-wav32k.py写入）与逐条.pt都支持
+    store = FeatureStore.open_if_exists(hubert_dir)
+    batch_size = int(os.environ.get("semantic_batch_size", 32))
+    max_batch_frames = int(os.environ.get("semantic_batch_frames", 32 * 1000))
+
+    def load_ssl(wav_name):
+        if store is not None and wav_name in store:
+            return store.get(wav_name)
         hubert_path = "%s/%s.pt" % (hubert_dir, wav_name)
         if os.path.exists(hubert_path) == False:
-            return
-        ssl_content = torch.load(hubert_path, map_location="cpu")
-        if is_half == True:
-            ssl_content = ssl_content.half().to(device)
-        else:
-            ssl_content = ssl_content.to(device)
-        codes = vq_model.extract_latent(ssl_content)
-        semantic = " ".join([str(i) for i in codes[0, 0, :].tolist()])
-        lines.append("%s\t%s" % (wav_name, semantic))
+            return None
+        return torch.load(hubert_path, map_location="cpu")
+
+    def names2go(wav_names, lines):
+        ssl_list = []
+        names = []
+        for wav_name in wav_names:
+            try:
+                ssl_content = load_ssl(wav_name)
+            except:
+                print(wav_name, traceback.format_exc())
+                continue
+            if ssl_content is not None:
+                ssl_list.append(ssl_content.to(device, torch.float16 if is_half == True else torch.float32))
+                names.append(wav_name)
+        semantics = {}
+        for batch in length_buckets([ssl.shape[-1] for ssl in ssl_list], batch_size, max_batch_frames):
+            with torch.no_grad():
+                codes_list = extract_latent_batch(vq_model, [ssl_list[i] for i in batch])
+            for i, codes in zip(batch, codes_list):
+                semantics[names[i]] = " ".join([str(code) for code in codes.tolist()])
+        for wav_name in names:
+            lines.append("%s\t%s" % (wav_name, semantics[wav_name]))
 
     with open(inp_text, "r", encoding="utf8") as f:
         lines = f.read().strip("\n").split("\n")
 
-    lines1 = []
+    wav_names = []
     for line in lines[int(i_part) :: int(all_parts)]:
         # print(line)
         try:
@@ -110,9 +133,12 @@ if os.path.exists(semantic_path) == False:
             wav_name, spk_name, language, text = line.split("|")
             wav_name = clean_path(wav_name)
             wav_name = os.path.basename(wav_name)
-            # name2go(name,lines1)
-            name2go(wav_name, lines1)
+            wav_names.append(wav_name)
         except:
             print(line, traceback.format_exc())
+    lines1 = []
+    chunk_size = batch_size * 8
+    for start in range(0, len(wav_names), chunk_size):
+        names2go(wav_names[start : start + chunk_size], lines1)
     with open(semantic_path, "w", encoding="utf8") as f:
         f.write("\n".join(lines1))
@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+"""
+把1~3步的产物打包成s2训练用的shard（module/data_utils.PackedS2Shards），
+TextAudioSpeakerLoader检测到opt_dir/8-s2-packed/meta.json后直接按memmap读取。
+
+opt_dir=logs/xxx version=v2 python prepare_datasets/4-pack-s2.py
+"""
+
+import os
+import sys
+
+opt_dir = os.environ.get("opt_dir")
+version = os.environ.get("version", None)
+s2_config_path = os.environ.get("s2_config_path", "configs/s2.json")
+pack_spec = eval(os.environ.get("pack_spec", "False"))
+shard_size = int(os.environ.get("shard_size", 1000))
+
+now_dir = os.getcwd()
+sys.path.append(now_dir)
+
+import json
+from time import time as ttime
+
+from module.data_utils import pack_s2_dataset
+
+with open(s2_config_path, "r", encoding="utf8") as f:
+    hparams = json.load(f)["data"]
+
+t0 = ttime()
+meta = pack_s2_dataset(opt_dir, hparams, version=version, with_spec=pack_spec, shard_size=shard_size)
+print(
+    "packed %d samples into %d shards in %.1fs"
+    % (sum(shard["count"] for shard in meta["shards"]), len(meta["shards"]), ttime() - t0)
+)
@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+"""
+把2-name2text.txt、6-name2semantic.tsv和3-bert编译成s1训练用的memmap格式（AR/data/dataset.CompiledS1Data），
+Text2SemanticDataset检测到opt_dir/9-s1-compiled且与源文件对得上时直接读取。
+
+opt_dir=logs/xxx version=v2 python prepare_datasets/5-compile-s1.py
+"""
+
+import os
+import sys
+
+opt_dir = os.environ.get("opt_dir")
+
+now_dir = os.getcwd()
+sys.path.append(now_dir)
+
+from time import time as ttime
+
+from AR.data.dataset import compile_s1_dataset
+
+t0 = ttime()
+meta = compile_s1_dataset("%s/2-name2text.txt" % opt_dir, "%s/6-name2semantic.tsv" % opt_dir)
+print(
+    "compiled %d samples (%d skipped, %d bert rows) in %.1fs"
+    % (meta["count"], meta["num_not_in"], meta["bert_rows"], ttime() - t0)
+)
@@ -0,0 +1,567 @@
+# -*- coding: utf-8 -*-
+"""
+数据集准备流水线，替代依次手动跑1-get-text、2-get-hubert-wav32k、2-get-sv、3-get-semantic：
+    每个设备（或CPU核组）一个worker进程，模型只加载一次；
+    条目按batch流过 文本→BERT、音频→HuBERT/32k、SV、semantic 四个阶段，下一批音频在后台线程解码；
+    每处理完一批就把结果追加进 opt_dir/.pipeline/worker-*.jsonl，中断后重跑会跳过已完成的条目；
+    定期输出各阶段吞吐，结束后合并成 2-name2text.txt 和 6-name2semantic.tsv。
+产物与单独跑四个脚本相同。
+
+python prepare_datasets/pipeline.py --inp_text xxx.list --opt_dir logs/xxx --version v2Pro \
+    --bert_dir pretrained_models/chinese-roberta-wwm-ext-large --cnhubert_dir pretrained_models/chinese-hubert-base \
+    --pretrained_s2G pretrained_models/v2Pro/s2Gv2Pro.pth --s2config_path configs/s2v2Pro.json \
+    --sv_path pretrained_models/sv/pretrained_eres2netv2w24s4ep4.ckpt --devices cuda:0,cuda:1
+"""
+
+import json
+import os
+import sys
+import time
+import traceback
+from argparse import ArgumentParser
+from concurrent.futures import ThreadPoolExecutor
+
+now_dir = os.getcwd()
+sys.path.append(now_dir)
+import librosa
+import numpy as np
+import torch
+import torchaudio
+from scipy.io import wavfile
+
+from feature_extractor.cnhubert import get_content_batch
+from module.data_utils import load_ssl
+from module.models import extract_latent_batch
+from tools.feature_store import FeatureStore, length_buckets
+from tools.my_utils import load_many
+
+STAGES = ["text", "hubert", "sv", "semantic"]
+maxx = 0.95
+alpha = 0.5
+
+
+def save_tensor(fea, path):
+    ###通过文件对象保存，torch.save不支持中文路径的问题不再需要先存到cwd再move
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        torch.save(fea, f)
+    os.replace(tmp_path, path)
+
+
+class Throughput:
+    def __init__(self):
+        self.items = {}
+        self.seconds = {}
+
+    def add(self, stage, n, seconds):
+        self.items[stage] = self.items.get(stage, 0) + n
+        self.seconds[stage] = self.seconds.get(stage, 0.0) + seconds
+
+    def report(self, prefix=""):
+        parts = [
+            "%s %d items %.1f/s" % (stage, self.items[stage], self.items[stage] / max(self.seconds[stage], 1e-9))
+            for stage in self.items
+        ]
+        print("%s%s" % (prefix, " | ".join(parts)))
+
+    def to_dict(self):
+        return {stage: {"items": self.items[stage], "seconds": self.seconds[stage]} for stage in self.items}
+
+
+class TextStage:
+    """g2p + BERT，BERT对一批中文句子做一次补齐的前向"""
+
+    def __init__(self, args, device, is_half):
+        from transformers import AutoModelForMaskedLM, AutoTokenizer
+
+        self.version = args.version
+        self.device = device
+        self.bert_dir = "%s/3-bert" % args.opt_dir
+        os.makedirs(self.bert_dir, exist_ok=True)
+        self.tokenizer = AutoTokenizer.from_pretrained(args.bert_dir)
+        self.bert_model = AutoModelForMaskedLM.from_pretrained(args.bert_dir)
+        self.bert_model = (self.bert_model.half() if is_half else self.bert_model).to(device).eval()
+
+    def __call__(self, items):
+        from text.cleaner import clean_text
+
+        if self.version != "v1":
+            from text import chinese2
+
+            try:
+                chinese2.prefetch([item["text"] for item in items if item["lang"] == "zh"])
+            except:
+                print(traceback.format_exc())
+        bert_items = []
+        for item in items:
+            try:
+                phones, word2ph, norm_text = clean_text(item["text"], item["lang"], self.version)
+            except:
+                print(item["name"], item["text"], traceback.format_exc())
+                continue
+            item["text_line"] = "%s\t%s\t%s\t%s" % (item["name"], " ".join(phones), word2ph, norm_text)
+            path_bert = "%s/%s.pt" % (self.bert_dir, item["name"])
+            if item["lang"] == "zh" and os.path.exists(path_bert) == False:
+                item["phones_len"] = len(phones)
+                item["word2ph"] = word2ph
+                item["norm_text"] = norm_text
+                bert_items.append(item)
+        if len(bert_items) > 0:
+            texts = [item["norm_text"] for item in bert_items]
+            with torch.no_grad():
+                inputs = self.tokenizer(texts, return_tensors="pt", padding=True)
+                for i in inputs:
+                    inputs[i] = inputs[i].to(self.device)
+                hidden_states = self.bert_model(**inputs, output_hidden_states=True)["hidden_states"][-3].cpu()
+            token_lens = inputs["attention_mask"].sum(dim=1).tolist()
+            for i, item in enumerate(bert_items):
+                try:
+                    if token_lens[i] == len(item["norm_text"]) + 2:
+                        feature = hidden_states[i, 1 : len(item["norm_text"]) + 1]
+                    else:
+                        ### 字和 token 不是一一对应，批内切片会混入 SEP/pad，单句重新过 Bert
+                        feature = self.bert_feature(item["norm_text"])[: len(item["norm_text"])]
+                    bert_feature = torch.repeat_interleave(feature, torch.tensor(item["word2ph"]), dim=0).T
+                    assert bert_feature.shape[-1] == item["phones_len"]
+                    save_tensor(bert_feature, "%s/%s.pt" % (self.bert_dir, item["name"]))
+                except:
+                    ### 没有 BERT 特征的条目 done() 不通过，不会记入 journal
+                    print(item["name"], item["norm_text"], traceback.format_exc())
+
+    def bert_feature(self, text):
+        with torch.no_grad():
+            inputs = self.tokenizer(text, return_tensors="pt")
+            for i in inputs:
+                inputs[i] = inputs[i].to(self.device)
+            hidden_states = self.bert_model(**inputs, output_hidden_states=True)["hidden_states"][-3]
+        return hidden_states[0].cpu()[1:-1]
+
+    def done(self, item):
+        if "text_line" not in item:
+            return False
+        return item["lang"] != "zh" or os.path.exists("%s/%s.pt" % (self.bert_dir, item["name"]))
+
+
+class HubertStage:
+    """32k波形写入5-wav32k，16k波形按长度分桶成批过CNHubert，ssl写入4-cnhubert的特征库"""
+
+    def __init__(self, args, device, is_half):
+        from feature_extractor import cnhubert
+
+        cnhubert.cnhubert_base_path = args.cnhubert_dir
+        self.device = device
+        self.is_half = is_half
+        self.hubert_dir = "%s/4-cnhubert" % args.opt_dir
+        self.wav32dir = "%s/5-wav32k" % args.opt_dir
+        os.makedirs(self.hubert_dir, exist_ok=True)
+        os.makedirs(self.wav32dir, exist_ok=True)
+        self.model = cnhubert.get_model()
+        self.model = (self.model.half() if is_half else self.model).to(device)
+        self.nan_items = []
+        self.max_batch_samples = int(args.hubert_batch_seconds * 16000)
+        ###特征追加写入4-cnhubert下本worker自己的一段
+        self.store = FeatureStore(self.hubert_dir, part="pipeline-%d" % args.rank)
+
+    def to_float(self):
+        self.is_half = False
+        self.model = self.model.float()
+
+    def prepare(self, item):
+        ###与2-get-hubert-wav32k.py相同的响度处理
+        tmp_audio = item["audio"]
+        tmp_max = np.abs(tmp_audio).max()
+        if tmp_max > 2.2:
+            print("%s-filtered,%s" % (item["name"], tmp_max))
+            return None
+        tmp_audio32 = (tmp_audio / tmp_max * (maxx * alpha * 32768)) + ((1 - alpha) * 32768) * tmp_audio
+        tmp_audio32b = (tmp_audio / tmp_max * (maxx * alpha * 1145.14)) + ((1 - alpha) * 1145.14) * tmp_audio
+        item["wav32"] = tmp_audio32.astype("int16")
+        return librosa.resample(tmp_audio32b, orig_sr=32000, target_sr=16000)
+
+    def __call__(self, items):
+        todo = []
+        wav16_list = []
+        for item in items:
+            if item.get("audio") is None:
+                continue
+            if item["name"] in self.store or os.path.exists("%s/%s.pt" % (self.hubert_dir, item["name"])):
+                continue
+            wav16 = self.prepare(item)
+            if wav16 is not None:
+                todo.append(item)
+                wav16_list.append(wav16)
+        dtype = torch.float16 if self.is_half else torch.float32
+        for batch in length_buckets([len(wav16) for wav16 in wav16_list], len(wav16_list), self.max_batch_samples):
+            ssl_list = get_content_batch(self.model.model, [wav16_list[i] for i in batch], self.device, dtype)
+            for i, ssl in zip(batch, ssl_list):
+                item = todo[i]
+                if torch.isnan(ssl.float()).any():
+                    item["failed"] = True
+                    self.nan_items.append(item)
+                    print("nan filtered:%s" % item["name"])
+                    continue
+                wavfile.write("%s/%s" % (self.wav32dir, item["name"]), 32000, item["wav32"])
+                self.store.add(item["name"], ssl)
+                item["ssl"] = ssl
+        self.store.flush()
+
+    def done(self, item):
+        if item.get("ssl") is not None or item["name"] in self.store:
+            return True
+        return os.path.exists("%s/%s.pt" % (self.hubert_dir, item["name"]))
+
+    def close(self):
+        self.store.close()
+
+
+class SVStage:
+    def __init__(self, args, device, is_half):
+        import sv as sv_module
+
+        if args.sv_path:
+            sv_module.sv_path = args.sv_path
+        self.sv_cn_dir = "%s/7-sv_cn" % args.opt_dir
+        self.wav32dir = "%s/5-wav32k" % args.opt_dir
+        os.makedirs(self.sv_cn_dir, exist_ok=True)
+        self.device = device
+        self.sv = sv_module.SV(device, is_half)
+        self.res = torchaudio.transforms.Resample(32000, 16000).to(device)
+
+    def __call__(self, items):
+        for item in items:
+            sv_cn_path = "%s/%s.pt" % (self.sv_cn_dir, item["name"])
+            if os.path.exists(sv_cn_path) or item.get("failed"):
+                continue
+            if "wav32" in item:
+                wav32k = torch.from_numpy(item["wav32"].astype(np.float32) / 32768).unsqueeze(0)
+            else:
+                wav_path = "%s/%s" % (self.wav32dir, item["name"])
+                if not os.path.exists(wav_path):
+                    continue
+                wav32k, sr0 = torchaudio.load(wav_path)
+                assert sr0 == 32000
+            with torch.no_grad():
+                emb = self.sv.compute_embedding3(self.res(wav32k.to(self.device))).cpu()  # torch.Size([1, 20480])
+            save_tensor(emb, sv_cn_path)
+
+    def done(self, item):
+        return os.path.exists("%s/%s.pt" % (self.sv_cn_dir, item["name"]))
+
+
+class SemanticStage:
+    def __init__(self, args, device, is_half):
+        import utils
+        from process_ckpt import load_sovits_new
+
+        size = os.path.getsize(args.pretrained_s2G)
+        if size < 82978 * 1024:
+            version = "v1"
+        elif size < 100 * 1024 * 1024:
+            version = "v2"
+        elif size < 103520 * 1024:
+            version = "v1"
+        elif size < 700 * 1024 * 1024:
+            version = "v2"
+        else:
+            version = "v3"
+        if version != "v3":
+            from module.models import SynthesizerTrn
+        else:
+            from module.models import SynthesizerTrnV3 as SynthesizerTrn
+        hps = utils.get_hparams_from_file(args.s2config_path)
+        self.vq_model = SynthesizerTrn(
+            hps.data.filter_length // 2 + 1,
+            hps.train.segment_size // hps.data.hop_length,
+            n_speakers=hps.data.n_speakers,
+            version=version,
+            **hps.model,
+        )
+        self.vq_model = (self.vq_model.half() if is_half else self.vq_model).to(device).eval()
+        print(self.vq_model.load_state_dict(load_sovits_new(args.pretrained_s2G)["weight"], strict=False))
+        self.device = device
+        self.dtype = torch.float16 if is_half else torch.float32
+        self.hubert_dir = "%s/4-cnhubert" % args.opt_dir
+        self.store = FeatureStore.open_if_exists(self.hubert_dir)
+        self.max_batch_frames = args.semantic_batch_frames
+
+    def __call__(self, items):
+        todo = []
+        for item in items:
+            if item.get("failed"):
+                continue
+            ssl = item.get("ssl")
+            if ssl is None:
+                try:
+                    ssl = load_ssl(self.hubert_dir, item["name"], self.store)
+                except FileNotFoundError:
+                    continue
+            todo.append((item, ssl.to(self.device, self.dtype)))
+        lengths = [ssl.shape[-1] for item, ssl in todo]
+        for batch in length_buckets(lengths, len(todo), self.max_batch_frames):
+            with torch.no_grad():
+                codes_list = extract_latent_batch(self.vq_model, [todo[i][1] for i in batch])
+            for i, codes in zip(batch, codes_list):
+                todo[i][0]["semantic"] = " ".join([str(code) for code in codes.tolist()])
+
+    def done(self, item):
+        return "semantic" in item
+
+
+class Journal:
+    """
+    每个worker一份jsonl，一行记录一个条目这次跑完的阶段（stages）和产出（text_line、semantic）。
+    同一条目可以分几次用不同的--stages跑，读取时按阶段合并；没有stages的旧记录视为什么都没做。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.done = {}
+        self.load(path, self.done)
+        self.f = open(path, "a", encoding="utf8")
+        if self.f.tell() > 0:
+            with open(path, "rb") as f:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    self.f.write("\n")  # 中断时写了一半的行，新记录另起一行
+
+    @staticmethod
+    def load(path, done):
+        if not os.path.exists(path):
+            return done
+        with open(path, "r", encoding="utf8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue  # 中断时写了一半的行
+                Journal.merge_record(done, record)
+        return done
+
+    @staticmethod
+    def merge_record(done, record):
+        merged = done.setdefault(record["name"], {"name": record["name"], "stages": []})
+        for stage in record.get("stages", []):
+            if stage not in merged["stages"]:
+                merged["stages"].append(stage)
+        for key in ["text_line", "semantic"]:
+            if record.get(key):
+                merged[key] = record[key]
+
+    def write(self, records):
+        for record in records:
+            self.f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            self.merge_record(self.done, record)
+        self.f.flush()
+        os.fsync(self.f.fileno())
+
+    def close(self):
+        self.f.close()
+
+
+def load_journals(opt_dir):
+    """合并所有worker的journal，worker数与上次不同时条目分到别的worker上也能认出来"""
+    done = {}
+    journal_dir = "%s/.pipeline" % opt_dir
+    if not os.path.isdir(journal_dir):
+        return done
+    for name in sorted(os.listdir(journal_dir)):
+        if name.startswith("worker-") and name.endswith(".jsonl"):
+            Journal.load("%s/%s" % (journal_dir, name), done)
+    return done
+
+
+def read_items(args):
+    language_v1_to_language_v2 = {
+        "ZH": "zh", "zh": "zh", "JP": "ja", "jp": "ja", "JA": "ja", "ja": "ja",
+        "EN": "en", "en": "en", "En": "en", "KO": "ko", "Ko": "ko", "ko": "ko",
+        "yue": "yue", "YUE": "yue", "Yue": "yue",
+    }  # fmt: skip
+    from tools.my_utils import clean_path
+
+    with open(args.inp_text, "r", encoding="utf8") as f:
+        lines = f.read().strip("\n").split("\n")
+    items = []
+    for line in lines:
+        try:
+            wav_name, spk_name, language, text = line.split("|")
+            wav_name = clean_path(wav_name)
+            if args.inp_wav_dir:
+                wav_path = "%s/%s" % (args.inp_wav_dir, os.path.basename(wav_name))
+            else:
+                wav_path = wav_name
+            if language not in language_v1_to_language_v2:
+                print(f"\033[33m[Waring] The {language = } of {wav_name} is not supported for training.\033[0m")
+                continue
+            items.append(
+                {
+                    "name": os.path.basename(wav_name),
+                    "wav_path": wav_path,
+                    "lang": language_v1_to_language_v2[language],
+                    "text": text.replace("%", "-").replace("￥", ","),
+                }
+            )
+        except:
+            print(line, traceback.format_exc())
+    return items
+
+
+def worker(rank, world_size, device, args):
+    os.environ["version"] = args.version
+    if device == "cpu" and world_size > 1:
+        torch.set_num_threads(max(1, (os.cpu_count() or 1) // world_size))
+    is_half = args.is_half and "cuda" in device
+    stage_names = [stage for stage in STAGES if stage in args.stages.split(",")]
+    if args.version not in {"v2Pro", "v2ProPlus"} and "sv" in stage_names:
+        stage_names.remove("sv")
+    stage_classes = {"text": TextStage, "hubert": HubertStage, "sv": SVStage, "semantic": SemanticStage}
+    args.rank = rank
+    stages = {name: stage_classes[name](args, device, is_half) for name in stage_names}
+
+    done = load_journals(args.opt_dir)
+    journal = Journal("%s/.pipeline/worker-%d.jsonl" % (args.opt_dir, rank))
+    ### 只有本次要求的阶段都已记入journal的条目才跳过
+    my_items = read_items(args)[rank::world_size]
+    items = [item for item in my_items if not set(stage_names) <= set(done.get(item["name"], {}).get("stages", []))]
+    print("[worker %d/%s] %d items to do, %d already done" % (rank, device, len(items), len(my_items) - len(items)))
+    stats = Throughput()
+    need_audio = "hubert" in stages
+
+    def decode(batch):
+        t0 = time.perf_counter()
+        audios = load_many([item["wav_path"] for item in batch], 32000, args.decode_workers) if need_audio else []
+        return audios, time.perf_counter() - t0
+
+    def run_batch(batch):
+        for name, stage in stages.items():
+            t0 = time.perf_counter()
+            stage(batch)
+            stats.add(name, len(batch), time.perf_counter() - t0)
+        records = []
+        for item in batch:
+            ### 解码失败、缺ssl等没产出的条目不记入journal，下次运行重做
+            if not item.get("failed") and not all(stage.done(item) for stage in stages.values()):
+                print("[worker %d] incomplete, not journaled: %s" % (rank, item["name"]))
+                item["failed"] = True
+            if item.get("failed"):
+                continue
+            record = {"name": item["name"], "stages": list(stages)}
+            for key in ["text_line", "semantic"]:
+                if item.get(key):
+                    record[key] = item[key]
+            records.append(record)
+        journal.write(records)
+
+    batches = [items[i : i + args.batch_size] for i in range(0, len(items), args.batch_size)]
+    ### 下一批的音频在后台线程解码，与当前批的模型计算重叠
+    with ThreadPoolExecutor(max_workers=1) as prefetcher:
+        future = prefetcher.submit(decode, batches[0]) if len(batches) > 0 else None
+        for i, batch in enumerate(batches):
+            audios, decode_seconds = future.result()
+            if i + 1 < len(batches):
+                future = prefetcher.submit(decode, batches[i + 1])
+            for item, audio in zip(batch, audios):
+                item["audio"] = audio
+            if need_audio:
+                stats.add("decode", len(batch), decode_seconds)
+            try:
+                run_batch(batch)
+            except:
+                print("[worker %d] batch failed" % rank, traceback.format_exc())
+            for item in batch:
+                item.pop("audio", None)
+                item.pop("ssl", None)
+            if (i + 1) % args.report_every == 0:
+                stats.report("[worker %d] %d/%d batches: " % (rank, i + 1, len(batches)))
+
+    hubert = stages.get("hubert")
+    if hubert is not None and len(hubert.nan_items) > 0 and hubert.is_half:
+        ### 半精度出nan的条目用fp32重跑
+        hubert.to_float()
+        retry = hubert.nan_items
+        hubert.nan_items = []
+        for item, audio in zip(retry, load_many([item["wav_path"] for item in retry], 32000, args.decode_workers)):
+            item.pop("failed", None)
+            item["audio"] = audio
+        run_batch(retry)
+    if hubert is not None:
+        hubert.close()
+
+    stats.report("[worker %d] done: " % rank)
+    with open("%s/.pipeline/stats-%d.json" % (args.opt_dir, rank), "w", encoding="utf8") as f:
+        json.dump(stats.to_dict(), f, indent=2)
+    journal.close()
+
+
+def merge(args):
+    ### 按阶段合并所有worker、所有轮次的记录：text_line和semantic可以来自不同--stages的运行
+    done = load_journals(args.opt_dir)
+    text_lines = []
+    semantic_lines = ["item_name\tsemantic_audio"]
+    for item in read_items(args):
+        record = done.get(item["name"])
+        if record is None:
+            continue
+        if record.get("text_line"):
+            text_lines.append(record["text_line"])
+        if record.get("semantic"):
+            semantic_lines.append("%s\t%s" % (item["name"], record["semantic"]))
+    stage_names = args.stages.split(",")
+    if "text" in stage_names:
+        with open("%s/2-name2text.txt" % args.opt_dir, "w", encoding="utf8") as f:
+            f.write("\n".join(text_lines) + "\n")
+    if "semantic" in stage_names:
+        with open("%s/6-name2semantic.tsv" % args.opt_dir, "w", encoding="utf8") as f:
+            f.write("\n".join(semantic_lines))
+    print("merged %d items into %s" % (len(done), args.opt_dir))
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument("--inp_text", required=True)
+    parser.add_argument("--inp_wav_dir", default="")
+    parser.add_argument("--opt_dir", required=True)
+    parser.add_argument("--version", default="v2")
+    parser.add_argument("--bert_dir", default="GPT_SoVITS/pretrained_models/chinese-roberta-wwm-ext-large")
+    parser.add_argument("--cnhubert_dir", default="GPT_SoVITS/pretrained_models/chinese-hubert-base")
+    parser.add_argument("--pretrained_s2G", default="GPT_SoVITS/pretrained_models/gsv-v2final-pretrained/s2G2333k.pth")
+    parser.add_argument("--s2config_path", default="configs/s2.json")
+    parser.add_argument("--sv_path", default=None)
+    parser.add_argument("--stages", default=",".join(STAGES), help="comma separated subset of %s" % ",".join(STAGES))
+    parser.add_argument("--devices", default=None, help="e.g. cuda:0,cuda:1 or cpu; all visible gpus by default")
+    parser.add_argument("--cpu_workers", type=int, default=1, help="number of processes when running on cpu")
+    parser.add_argument("--batch_size", type=int, default=16)
+    parser.add_argument("--decode_workers", type=int, default=4)
+    parser.add_argument("--hubert_batch_seconds", type=float, default=200, help="padded 16k audio per hubert forward")
+    parser.add_argument("--semantic_batch_frames", type=int, default=32000, help="padded ssl frames per extract_latent")
+    parser.add_argument("--report_every", type=int, default=20)
+    parser.add_argument("--no_half", action="store_true")
+    args = parser.parse_args()
+    args.is_half = not args.no_half
+
+    import torch.multiprocessing as mp
+
+    if args.devices is None:
+        n_gpu = torch.cuda.device_count()
+        devices = ["cuda:%d" % i for i in range(n_gpu)] if n_gpu > 0 else ["cpu"]
+    else:
+        devices = args.devices.split(",")
+    if devices == ["cpu"]:
+        devices = ["cpu"] * args.cpu_workers
+    os.makedirs("%s/.pipeline" % args.opt_dir, exist_ok=True)
+
+    t0 = time.perf_counter()
+    if len(devices) == 1:
+        worker(0, 1, devices[0], args)
+    else:
+        ctx = mp.get_context("spawn")
+        procs = [ctx.Process(target=worker, args=(rank, len(devices), device, args)) for rank, device in enumerate(devices)]
+        for p in procs:
+            p.start()
+        for p in procs:
+            p.join()
+    merge(args)
+    print("pipeline finished in %.1fs" % (time.perf_counter() - t0))
+
+
+if __name__ == "__main__":
+    main()
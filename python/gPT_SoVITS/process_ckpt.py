@@ -1,3 +1,4 @@
+import json
 import traceback
 from collections import OrderedDict
 from time import time as ttime
@@ -98,6 +99,12 @@ def get_hash_from_file(sovits_path):
 
 
 def get_sovits_version_from_path_fast(sovits_path):
+    ###0-exported inference weights, by metadata
+    if sovits_path.endswith(".safetensors"):
+        meta = read_infer_meta(sovits_path)
+        if meta.get("format") != INFER_FORMAT or meta.get("kind") != "sovits" or "version" not in meta:
+            raise ValueError("%s is not an exported SoVITS inference checkpoint" % sovits_path)
+        return meta["version"], meta["model_version"], False
     ###1-if it is pretrained sovits models, by hash
     hash = get_hash_from_file(sovits_path)
     if hash in hash_pretrained_dict:
@@ -126,13 +133,183 @@ def get_sovits_version_from_path_fast(sovits_path):
     return version, model_version, if_lora_v3
 
 
+def load_mmap(path, map_location="cpu"):
+    ###zip格式的权重用mmap加载，张量按需从文件读取，不会先把整个文件读进内存；旧格式回退到普通加载
+    try:
+        return torch.load(path, map_location=map_location, mmap=True, weights_only=False)
+    except (RuntimeError, TypeError):
+        return torch.load(path, map_location=map_location, weights_only=False)
+
+
 def load_sovits_new(sovits_path):
-    f = open(sovits_path, "rb")
-    meta = f.read(2)
-    if meta != b"PK":
-        data = b"PK" + f.read()
-        bio = BytesIO()
-        bio.write(data)
-        bio.seek(0)
-        return torch.load(bio, map_location="cpu", weights_only=False)
-    return torch.load(sovits_path, map_location="cpu", weights_only=False)
+    with open(sovits_path, "rb") as f:
+        meta = f.read(2)
+        if meta != b"PK":
+            ###头两个字节被改写成版本号的权重不是合法zip，只能读进内存
+            data = b"PK" + f.read()
+            bio = BytesIO()
+            bio.write(data)
+            bio.seek(0)
+            return torch.load(bio, map_location="cpu", weights_only=False)
+    return load_mmap(sovits_path)
+
+
+"""
+推理权重：safetensors格式（JSON头+连续存放的张量数据，可mmap），
+权重为fp16、LoRA已合并、去掉enc_q，hparams以JSON放在头部的metadata里。
+加载时不再需要反序列化训练用的dict，也不用判断版本、合并LoRA。
+"""
+INFER_FORMAT = "gpt-sovits-infer"
+INFER_FORMAT_VERSION = "1"
+
+
+def _to_plain(obj):
+    if hasattr(obj, "items"):
+        return {k: _to_plain(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [_to_plain(v) for v in obj]
+    return obj
+
+
+def is_infer_ckpt(path):
+    if not path.endswith(".safetensors"):
+        return False
+    return read_infer_meta(path).get("format") == INFER_FORMAT
+
+
+def read_infer_meta(path):
+    from safetensors import safe_open
+
+    with safe_open(path, framework="pt") as f:
+        return f.metadata() or {}
+
+
+def load_infer_ckpt(path, device="cpu"):
+    ###返回与训练权重相同结构的dict：{"weight","config",...}，张量直接从文件映射
+    from safetensors.torch import load_file
+
+    meta = read_infer_meta(path)
+    if meta.get("format") != INFER_FORMAT:
+        raise ValueError("%s is not an exported inference checkpoint" % path)
+    if meta.get("format_version") != INFER_FORMAT_VERSION:
+        raise ValueError(
+            "%s: unsupported inference checkpoint version %s" % (path, meta.get("format_version"))
+        )
+    return {
+        "weight": load_file(path, device=str(device)),
+        "config": json.loads(meta["config"]),
+        "kind": meta["kind"],
+        "version": meta.get("version"),
+        "model_version": meta.get("model_version"),
+        "info": meta.get("info", ""),
+    }
+
+
+def save_infer_ckpt(weight, config, path, kind, version=None, model_version=None, info=""):
+    from safetensors.torch import save_file
+
+    tensors = {}
+    for key, value in weight.items():
+        if "enc_q" in key:
+            continue
+        if value.is_floating_point():
+            value = value.half()
+        tensors[key] = value.detach().cpu().contiguous()
+    meta = {
+        "format": INFER_FORMAT,
+        "format_version": INFER_FORMAT_VERSION,
+        "kind": kind,
+        "config": json.dumps(_to_plain(config), ensure_ascii=False),
+        "info": str(info),
+    }
+    if version is not None:
+        meta["version"] = version
+        meta["model_version"] = model_version
+    tmp_path = "%s.%s.tmp" % (path, ttime())
+    save_file(tensors, tmp_path, metadata=meta)
+    shutil.move(tmp_path, path)
+    return path
+
+
+def build_sovits_for_export(sovits_path, base_path=None):
+    """按TTS.init_vits_weights的逻辑构建模型并合并LoRA，返回(state_dict, hps, version, model_version)"""
+    from module.models import SynthesizerTrnV3
+
+    version, model_version, if_lora_v3 = get_sovits_version_from_path_fast(sovits_path)
+    dict_s2 = load_sovits_new(sovits_path)
+    hps = _to_plain(dict_s2["config"])
+    hps["model"]["semantic_frame_rate"] = "25hz"
+    if "enc_p.text_embedding.weight" not in dict_s2["weight"]:
+        hps["model"]["version"] = "v2"
+    elif dict_s2["weight"]["enc_p.text_embedding.weight"].shape[0] == 322:
+        hps["model"]["version"] = "v1"
+    else:
+        hps["model"]["version"] = "v2"
+    version = hps["model"]["version"]
+    if model_version in {"v3", "v4"} or "Pro" in model_version:
+        hps["model"]["version"] = model_version
+    else:
+        model_version = version
+
+    if not if_lora_v3:
+        ###非LoRA权重不用建模型，直接转存
+        return dict_s2["weight"], hps, version, model_version
+
+    if base_path is None or not os.path.exists(base_path):
+        raise FileExistsError("SoVITS %s base model is required to merge LoRA weights: %s" % (model_version, base_path))
+    from peft import LoraConfig, get_peft_model
+
+    vits_model = SynthesizerTrnV3(
+        hps["data"]["filter_length"] // 2 + 1,
+        hps["train"]["segment_size"] // hps["data"]["hop_length"],
+        n_speakers=hps["data"]["n_speakers"],
+        **hps["model"],
+    )
+    if hasattr(vits_model, "enc_q"):
+        del vits_model.enc_q
+    print("base:", vits_model.load_state_dict(load_sovits_new(base_path)["weight"], strict=False))
+    lora_rank = dict_s2["lora_rank"]
+    lora_config = LoraConfig(
+        target_modules=["to_k", "to_q", "to_v", "to_out.0"],
+        r=lora_rank,
+        lora_alpha=lora_rank,
+        init_lora_weights=True,
+    )
+    vits_model.cfm = get_peft_model(vits_model.cfm, lora_config)
+    print("lora:", vits_model.load_state_dict(dict_s2["weight"], strict=False))
+    vits_model.cfm = vits_model.cfm.merge_and_unload()
+    return vits_model.state_dict(), hps, version, model_version
+
+
+def export_sovits(sovits_path, out_path, base_path=None):
+    t0 = ttime()
+    weight, hps, version, model_version = build_sovits_for_export(sovits_path, base_path)
+    info = load_sovits_new(sovits_path).get("info", "")
+    save_infer_ckpt(weight, hps, out_path, "sovits", version, model_version, info)
+    print("exported %s (%s) -> %s in %.2fs" % (sovits_path, model_version, out_path, ttime() - t0))
+    return out_path
+
+
+def export_gpt(gpt_path, out_path):
+    t0 = ttime()
+    dict_s1 = load_mmap(gpt_path)
+    save_infer_ckpt(dict_s1["weight"], dict_s1["config"], out_path, "gpt", info=dict_s1.get("info", ""))
+    print("exported %s -> %s in %.2fs" % (gpt_path, out_path, ttime() - t0))
+    return out_path
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="export GPT/SoVITS weights to memory-mappable inference checkpoints")
+    parser.add_argument("kind", choices=["sovits", "gpt"])
+    parser.add_argument("input", help="training weights (.pth/.ckpt)")
+    parser.add_argument("output", help="output path, should end with .safetensors")
+    parser.add_argument("--base", default=None, help="pretrained SoVITS v3/v4 weights, needed for LoRA weights")
+    args = parser.parse_args()
+    if not args.output.endswith(".safetensors"):
+        parser.error("output must end with .safetensors")
+    if args.kind == "sovits":
+        export_sovits(args.input, args.output, args.base)
+    else:
+        export_gpt(args.input, args.output)
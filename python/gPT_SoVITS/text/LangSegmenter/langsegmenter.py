@@ -1,17 +1,26 @@
 import logging
 import re
 
-# jieba静音
-import jieba
-jieba.setLogLevel(logging.CRITICAL)
-
-# 更改fast_langdetect大模型位置
 from pathlib import Path
-import fast_langdetect
-fast_langdetect.infer._default_detector = fast_langdetect.infer.LangDetector(fast_langdetect.infer.LangDetectConfig(cache_dir=Path(__file__).parent.parent.parent / "pretrained_models" / "fast_langdetect"))
 
+LangSplitter = None
+
+
+def _load_backends():
+    # jieba / fast_langdetect / split_lang 导入较慢，第一次分语种时再加载
+    global LangSplitter
+    if LangSplitter is not None:
+        return
+    # jieba静音
+    import jieba
+    jieba.setLogLevel(logging.CRITICAL)
+
+    # 更改fast_langdetect大模型位置
+    import fast_langdetect
+    fast_langdetect.infer._default_detector = fast_langdetect.infer.LangDetector(fast_langdetect.infer.LangDetectConfig(cache_dir=Path(__file__).parent.parent.parent / "pretrained_models" / "fast_langdetect"))
 
-from split_lang import LangSplitter
+    from split_lang import LangSplitter as _LangSplitter
+    LangSplitter = _LangSplitter
 
 
 def full_en(text):
@@ -88,6 +97,7 @@ class LangSegmenter():
     }
 
     def getTexts(text,default_lang = ""):
+        _load_backends()
         lang_splitter = LangSplitter(lang_map=LangSegmenter.DEFAULT_LANG_MAP)
         lang_splitter.merge_across_digit = False
         substr = lang_splitter.split_by_lang(text=text)
@@ -1,5 +1,6 @@
 import os
 import re
+from functools import lru_cache
 
 import cn2an
 from pypinyin import lazy_pinyin, Style
@@ -71,8 +72,7 @@ def replace_punctuation(text):
 
 
 def g2p(text):
-    pattern = r"(?<=[{0}])\s*".format("".join(punctuation))
-    sentences = [i for i in re.split(pattern, text) if i.strip() != ""]
+    sentences = _split_sentences(text)
     phones, word2ph = _g2p(sentences)
     return phones, word2ph
 
@@ -177,9 +177,31 @@ def _merge_erhua(initials: list[str], finals: list[str], word: str, pos: str) ->
     return new_initials, new_finals
 
 
+def _split_sentences(text):
+    pattern = r"(?<=[{0}])\s*".format("".join(punctuation))
+    return [i for i in re.split(pattern, text) if i.strip() != ""]
+
+
+def prefetch(texts):
+    """
+    对一批未规范化的中文文本（一个请求的所有句子、一个数据分片的所有行）
+    只做一次g2pw推理，随后的g2p调用直接命中缓存。
+    """
+    if not is_g2pw:
+        return
+    segments = []
+    for text in texts:
+        for seg in _split_sentences(text_normalize(text)):
+            segments.append(re.sub("[a-zA-Z]+", "", seg))
+    g2pw.prefetch(segments)
+
+
 def _g2p(segments):
     phones_list = []
     word2ph = []
+    if is_g2pw:
+        ### 本次调用所有分句的多音字合并成一个batch
+        g2pw.prefetch([re.sub("[a-zA-Z]+", "", seg) for seg in segments])
     for seg in segments:
         pinyins = []
         # Replace all English words in the sentence
@@ -313,6 +335,7 @@ def replace_consecutive_punctuation(text):
     return result
 
 
+@lru_cache(maxsize=4096)
 def text_normalize(text):
     # https://github.com/PaddlePaddle/PaddleSpeech/tree/develop/paddlespeech/t2s/frontend/zh_normalization
     tx = TextNormalizer()
@@ -37,7 +37,14 @@ def prepare_onnx_input(
     use_mask: bool = False,
     window_size: int = None,
     max_len: int = 512,
+    token_cache=None,
+    char2id: Dict[str, int] = None,
 ) -> Dict[str, np.array]:
+    """
+    token_cache: optional dict-like text -> tokenize_and_map output, shared between the
+        queries of one sentence and across calls.
+    Queries of different sentences are right-padded to the longest one in the batch.
+    """
     if window_size is not None:
         truncated_texts, truncated_query_ids = _truncate_texts(
             window_size=window_size, texts=texts, query_ids=query_ids
@@ -53,11 +60,16 @@ def prepare_onnx_input(
         text = (truncated_texts if window_size else texts)[idx].lower()
         query_id = (truncated_query_ids if window_size else query_ids)[idx]
 
-        try:
-            tokens, text2token, token2text = tokenize_and_map(tokenizer=tokenizer, text=text)
-        except Exception:
-            print(f'warning: text "{text}" is invalid')
-            return {}
+        cached = token_cache.get(text) if token_cache is not None else None
+        if cached is None:
+            try:
+                cached = tokenize_and_map(tokenizer=tokenizer, text=text)
+            except Exception:
+                print(f'warning: text "{text}" is invalid')
+                return {}
+            if token_cache is not None:
+                token_cache[text] = cached
+        tokens, text2token, token2text = cached
 
         text, query_id, tokens, text2token, token2text = _truncate(
             max_len=max_len, text=text, query_id=query_id, tokens=tokens, text2token=text2token, token2text=token2text
@@ -73,7 +85,7 @@ def prepare_onnx_input(
         phoneme_mask = (
             [1 if i in char2phonemes[query_char] else 0 for i in range(len(labels))] if use_mask else [1] * len(labels)
         )
-        char_id = chars.index(query_char)
+        char_id = char2id[query_char] if char2id is not None else chars.index(query_char)
         position_id = text2token[query_id] + 1  # [CLS] token locate at first place
 
         input_ids.append(input_id)
@@ -84,9 +96,9 @@ def prepare_onnx_input(
         position_ids.append(position_id)
 
     outputs = {
-        "input_ids": np.array(input_ids).astype(np.int64),
-        "token_type_ids": np.array(token_type_ids).astype(np.int64),
-        "attention_masks": np.array(attention_masks).astype(np.int64),
+        "input_ids": _pad(input_ids),
+        "token_type_ids": _pad(token_type_ids),
+        "attention_masks": _pad(attention_masks),
         "phoneme_masks": np.array(phoneme_masks).astype(np.float32),
         "char_ids": np.array(char_ids).astype(np.int64),
         "position_ids": np.array(position_ids).astype(np.int64),
@@ -94,6 +106,13 @@ def prepare_onnx_input(
     return outputs
 
 
+def _pad(seqs: List[List[int]]) -> np.array:
+    out = np.zeros((len(seqs), max(len(seq) for seq in seqs)), dtype=np.int64)
+    for i, seq in enumerate(seqs):
+        out[i, : len(seq)] = seq
+    return out
+
+
 def _truncate_texts(window_size: int, texts: List[str], query_ids: List[int]) -> Tuple[List[str], List[int]]:
     truncated_texts = []
     truncated_query_ids = []
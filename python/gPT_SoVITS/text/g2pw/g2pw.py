@@ -2,6 +2,8 @@
 
 import pickle
 import os
+import threading
+from collections import OrderedDict
 
 from pypinyin.constants import RE_HANS
 from pypinyin.core import Pinyin, Style
@@ -43,6 +45,13 @@ class G2PWPinyin(Pinyin):
     def get_seg(self, **kwargs):
         return simple_seg
 
+    def prefetch(self, sentences):
+        """
+        Runs g2pW once for the han runs of all `sentences` (one padded onnx batch instead of one
+        run per run of han characters); the following lazy_pinyin calls on them hit the cache.
+        """
+        self._converter.prefetch(sentences)
+
 
 class Converter(UltimateConverter):
     def __init__(self, g2pw_instance, v_to_u=False, neutral_tone_with_five=False, tone_sandhi=False, **kwargs):
@@ -51,6 +60,45 @@ class Converter(UltimateConverter):
         )
 
         self._g2pw = g2pw_instance
+        ### han串 -> g2pw结果，LRU
+        self._results = OrderedDict()
+        self._results_size = int(os.environ.get("g2pw_result_cache_size", 8192))
+        self._lock = threading.Lock()
+
+    def prefetch(self, sentences):
+        hans = []
+        with self._lock:
+            for sent in sentences:
+                for words in simple_seg(sent):
+                    if RE_HANS.match(words) and words not in self._results:
+                        hans.append(words)
+        hans = list(dict.fromkeys(hans))
+        if len(hans) == 0:
+            return
+        results = self._g2pw(hans)
+        with self._lock:
+            for han, result in zip(hans, results):
+                self._put(han, result)
+
+    def _put(self, han, result):
+        self._results[han] = result
+        self._results.move_to_end(han)
+        while len(self._results) > self._results_size:
+            self._results.popitem(last=False)
+
+    def _g2pw_one(self, han):
+        with self._lock:
+            result = self._results.get(han)
+            if result is not None:
+                self._results.move_to_end(han)
+                return result
+        result = self._g2pw(han)
+        if not result:
+            return None
+        result = result[0]
+        with self._lock:
+            self._put(han, result)
+        return result
 
     def convert(self, words, style, heteronym, errors, strict, **kwargs):
         pys = []
@@ -72,12 +120,12 @@ class Converter(UltimateConverter):
     def _to_pinyin(self, han, style, heteronym, errors, strict, **kwargs):
         pinyins = []
 
-        g2pw_pinyin = self._g2pw(han)
+        g2pw_pinyin = self._g2pw_one(han)
 
         if not g2pw_pinyin:  # g2pw 不支持的汉字改为使用 pypinyin 原有逻辑
             return super(Converter, self).convert(han, Style.TONE, heteronym, errors, strict, **kwargs)
 
-        for i, item in enumerate(g2pw_pinyin[0]):
+        for i, item in enumerate(g2pw_pinyin):
             if item is None:  # g2pw 不支持的汉字改为使用 pypinyin 原有逻辑
                 py = super(Converter, self).convert(han[i], Style.TONE, heteronym, errors, strict, **kwargs)
                 pinyins.extend(py)
@@ -3,8 +3,10 @@
 
 import json
 import os
+import threading
 import warnings
 import zipfile
+from collections import OrderedDict
 from typing import Any, Dict, List, Tuple
 
 import numpy as np
@@ -55,6 +57,29 @@ def predict(session, onnx_input: Dict[str, Any], labels: List[str]) -> Tuple[Lis
     return all_preds, all_confidences
 
 
+class TokenCache:
+    """LRU cache of tokenize_and_map outputs, keyed by the lowercased sentence."""
+
+    def __init__(self, max_entries: int = 4096):
+        self.max_entries = max_entries
+        self.data = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, text):
+        with self.lock:
+            item = self.data.get(text)
+            if item is not None:
+                self.data.move_to_end(text)
+            return item
+
+    def __setitem__(self, text, value):
+        with self.lock:
+            self.data[text] = value
+            self.data.move_to_end(text)
+            while len(self.data) > self.max_entries:
+                self.data.popitem(last=False)
+
+
 def download_and_decompress(model_dir: str = "G2PWModel/"):
     if not os.path.exists(model_dir):
         parent_directory = os.path.dirname(model_dir)
@@ -150,6 +175,10 @@ class G2PWOnnxConverter:
         )
 
         self.chars = sorted(list(self.char2phonemes.keys()))
+        self.char2id = {char: i for i, char in enumerate(self.chars)}
+        ### 一句里的多个多音字共用一次分词，跨请求也能复用
+        self.token_cache = TokenCache(int(os.environ.get("g2pw_token_cache_size", 4096)))
+        self.batch_size = int(os.environ.get("g2pw_batch_size", 128))
 
         self.polyphonic_chars_new = set(self.chars)
         for char in self.non_polyphonic:
@@ -203,18 +232,26 @@ class G2PWOnnxConverter:
             # sentences no polyphonic words
             return partial_results
 
-        onnx_input = prepare_onnx_input(
-            tokenizer=self.tokenizer,
-            labels=self.labels,
-            char2phonemes=self.char2phonemes,
-            chars=self.chars,
-            texts=texts,
-            query_ids=query_ids,
-            use_mask=self.config.use_mask,
-            window_size=None,
-        )
-
-        preds, confidences = predict(session=self.session_g2pW, onnx_input=onnx_input, labels=self.labels)
+        ### 所有句子的多音字查询按长度排序后分批，每批只补齐到批内最长的句子
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        preds = [None] * len(texts)
+        for start in range(0, len(order), self.batch_size):
+            batch = order[start : start + self.batch_size]
+            onnx_input = prepare_onnx_input(
+                tokenizer=self.tokenizer,
+                labels=self.labels,
+                char2phonemes=self.char2phonemes,
+                chars=self.chars,
+                texts=[texts[i] for i in batch],
+                query_ids=[query_ids[i] for i in batch],
+                use_mask=self.config.use_mask,
+                window_size=None,
+                token_cache=self.token_cache,
+                char2id=self.char2id,
+            )
+            batch_preds, _ = predict(session=self.session_g2pW, onnx_input=onnx_input, labels=self.labels)
+            for i, pred in zip(batch, batch_preds):
+                preds[i] = pred
         if self.config.use_char_phoneme:
             preds = [pred.split(" ")[1] for pred in preds]
 
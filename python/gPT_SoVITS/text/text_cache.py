@@ -0,0 +1,36 @@
+import os
+from typing import Any, Dict
+
+from tools.lru_cache import ByteLRUCache
+
+
+class TextFeatureCache(ByteLRUCache):
+    """
+    Sentence-level cache for text frontend results (phones, word2ph, norm_text, bert features).
+
+    Entries are keyed on (sentence, language, version, tag), where `tag` identifies whatever else
+    the entry depends on (e.g. the bert model / device / dtype). The in-memory part is an LRU
+    bounded by `max_bytes`; when `cache_dir` is set every entry is also written there, so the
+    cache survives restarts and can be shared between inference and dataset preparation.
+    """
+
+    def __init__(self, max_bytes: int = 256 * 1024 * 1024, cache_dir: str = None):
+        super().__init__(max_bytes, cache_dir)
+        self.cache_dir = cache_dir
+
+    @staticmethod
+    def make_key(text: str, language: str, version: str, tag: str = "") -> str:
+        ### 不做归一化：调用方传入的就是实际送去 g2p 的文本，否则不同输入会共用一条结果
+        return "%s|%s|%s|%s" % (version, language, tag, text)
+
+    def put(self, key: str, entry: Dict[str, Any]):
+        with self.lock:
+            super().put(key, entry)
+            if self.cache_dir is not None:
+                self._write(key, entry)
+
+
+text_feature_cache = TextFeatureCache(
+    max_bytes=int(os.environ.get("text_cache_max_mb", 256)) * 1024 * 1024,
+    cache_dir=os.environ.get("text_cache_dir", None),
+)
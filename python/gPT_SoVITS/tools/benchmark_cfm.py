@@ -0,0 +1,138 @@
+"""
+v3/v4 CFM 采样测试：
+1. 单步：DiT 完整 forward 与 prepare_inference + forward_prepared（步间不变部分提到循环外）的耗时和最大误差；
+2. 质量-步数：固定 seed 跑同一段文本，不同 solver/步数 的输出与 euler 32 步的 log-mel L1 距离、CFM 耗时和 DiT 调用次数。
+
+python tools/benchmark_cfm.py --config infer_config.yml --ref_audio ref.wav --prompt_text "..." --prompt_lang zh \
+    --text "..." --text_lang zh --configs euler:32,euler:16,euler:8,midpoint:8,heun:8,midpoint:4,euler:4
+"""
+
+import os
+import sys
+
+now_dir = os.getcwd()
+sys.path.append(now_dir)
+
+import time
+from argparse import ArgumentParser
+
+import numpy as np
+import torch
+import torchaudio
+
+from TTS_infer_pack.TTS import TTS, TTS_Config
+
+
+def sync(device):
+    if "cuda" in str(device):
+        torch.cuda.synchronize()
+
+
+@torch.inference_mode()
+def bench_step(cfm, device, dtype, batch_size, frames, repeat):
+    dit = cfm.estimator
+    mel_dim = cfm.in_channels
+    text_dim = dit.input_embed.proj.in_features - mel_dim * 2
+    x = torch.randn(batch_size, mel_dim, frames, device=device, dtype=dtype)
+    prompt_x = torch.randn(batch_size, mel_dim, frames, device=device, dtype=dtype)
+    prompt_x[..., frames // 3 :] = 0
+    mu = torch.randn(batch_size, text_dim, frames, device=device, dtype=dtype)
+    x_lens = torch.LongTensor([frames]).to(device)
+    t = torch.full((batch_size,), 0.5, device=device, dtype=dtype)
+    d = torch.full((batch_size,), 1 / 32, device=device, dtype=dtype)
+
+    def full():
+        return dit(x, prompt_x, x_lens, t, d, mu, infer=True)[0]
+
+    cache = dit.prepare_inference(prompt_x, mu, x_lens, frames)
+    dt = dit.d_embed(d)
+
+    def prepared():
+        return dit.forward_prepared(x, t, dt, cache)
+
+    err = (full().float() - prepared().float()).abs().max().item()
+    costs = []
+    for fn in [full, prepared]:
+        fn()
+        sync(device)
+        t0 = time.perf_counter()
+        for _ in range(repeat):
+            fn()
+        sync(device)
+        costs.append((time.perf_counter() - t0) / repeat)
+    print("DiT step (B=%d, T=%d): full %.1fms  prepared %.1fms  max abs diff %.2e" % (batch_size, frames, costs[0] * 1000, costs[1] * 1000, err))
+
+
+def log_mel(wav, sr):
+    mel = torchaudio.transforms.MelSpectrogram(sr, n_fft=1024, hop_length=256, n_mels=80)(torch.from_numpy(wav.astype(np.float32) / 32768))
+    return torch.log(mel.clamp(min=1e-5))
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument("--config", default="infer_config.yml")
+    parser.add_argument("--ref_audio", required=True)
+    parser.add_argument("--prompt_text", required=True)
+    parser.add_argument("--prompt_lang", default="zh")
+    parser.add_argument("--text", required=True)
+    parser.add_argument("--text_lang", default="zh")
+    parser.add_argument("--configs", default="euler:32,euler:16,euler:8,midpoint:8,heun:8,midpoint:4,euler:4")
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--step_frames", type=int, default=1400)
+    parser.add_argument("--step_repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    tts = TTS(TTS_Config(args.config))
+    assert tts.configs.use_vocoder, "the CFM benchmark needs a v3/v4 SoVITS model"
+    cfm = tts.vits_model.cfm
+    device = tts.configs.device
+    bench_step(cfm, device, tts.precision, 1, args.step_frames, args.step_repeat)
+
+    ### 统计 CFM 采样耗时和 DiT 调用次数
+    stats = {"cfm": 0.0, "nfe": 0}
+    inference = cfm.inference
+    forward_prepared = cfm.estimator.forward_prepared
+
+    def timed_inference(*a, **k):
+        sync(device)
+        t0 = time.perf_counter()
+        res = inference(*a, **k)
+        sync(device)
+        stats["cfm"] += time.perf_counter() - t0
+        return res
+
+    def counted_forward(*a, **k):
+        stats["nfe"] += 1
+        return forward_prepared(*a, **k)
+
+    cfm.inference = timed_inference
+    cfm.estimator.forward_prepared = counted_forward
+
+    reference = None
+    print("%10s%7s%8s%10s%12s" % ("solver", "steps", "nfe", "cfm s", "mel L1"))
+    for item in args.configs.split(","):
+        solver, steps = item.split(":")
+        stats["cfm"] = 0.0
+        stats["nfe"] = 0
+        inputs = {
+            "text": args.text,
+            "text_lang": args.text_lang,
+            "ref_audio_path": args.ref_audio,
+            "prompt_text": args.prompt_text,
+            "prompt_lang": args.prompt_lang,
+            "seed": args.seed,
+            "sample_steps": int(steps),
+            "sample_solver": solver,
+            "parallel_infer": True,
+        }
+        sr, wav = next(tts.run(inputs))
+        mel = log_mel(wav, sr)
+        if reference is None:
+            reference = mel
+        n = min(mel.shape[-1], reference.shape[-1])
+        dist = (mel[..., :n] - reference[..., :n]).abs().mean().item()
+        print("%10s%7d%8d%10.2f%12.4f" % (solver, int(steps), stats["nfe"], stats["cfm"], dist))
+
+
+if __name__ == "__main__":
+    main()
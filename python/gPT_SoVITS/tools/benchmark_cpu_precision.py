@@ -0,0 +1,135 @@
+"""
+CPU 精度模式（int8 动态量化 / bf16）与 fp32 的对比：同一批句子、固定 seed、top_k=1 贪心解码，
+统计每句 semantic token 的一致率（逐位置相同的比例、首个分歧位置、长度差）、
+输出音频与 fp32 的 log-mel L1 和时长比，以及 BERT、T2S 的耗时。
+
+python tools/benchmark_cpu_precision.py --config infer_config.yml --ref_audio ref.wav --prompt_text "..." --prompt_lang zh \
+    --text_file sentences.txt --text_lang zh --modes fp32,int8,bf16
+"""
+
+import os
+import sys
+
+now_dir = os.getcwd()
+sys.path.append(now_dir)
+
+import time
+from argparse import ArgumentParser
+
+import numpy as np
+import torch
+import torchaudio
+
+from TTS_infer_pack.TTS import TTS, TTS_Config
+
+
+def log_mel(wav, sr):
+    mel = torchaudio.transforms.MelSpectrogram(sr, n_fft=1024, hop_length=256, n_mels=80)(torch.from_numpy(wav.astype(np.float32) / 32768))
+    return torch.log(mel.clamp(min=1e-5))
+
+
+def token_agreement(ref, tokens):
+    n = min(len(ref), len(tokens))
+    same = (ref[:n] == tokens[:n]).numpy()
+    first_diff = int(np.argmin(same)) if not same.all() else n
+    return same.sum() / max(len(ref), len(tokens), 1), first_diff, len(tokens) - len(ref)
+
+
+def run_mode(args, mode, texts):
+    configs = TTS_Config(args.config)
+    configs.device = torch.device("cpu")
+    configs.is_half = False
+    configs.cpu_precision = mode
+    tts = TTS(configs)
+
+    stats = {"bert": 0.0, "t2s": 0.0}
+    tokens = []
+    get_bert_feature_batch = tts.text_preprocessor.get_bert_feature_batch
+    infer_panel = tts.t2s_model.model.infer_panel_batch_infer
+
+    def timed_bert(*a, **k):
+        t0 = time.perf_counter()
+        res = get_bert_feature_batch(*a, **k)
+        stats["bert"] += time.perf_counter() - t0
+        return res
+
+    def timed_t2s(*a, **k):
+        t0 = time.perf_counter()
+        pred_semantic_list, idx_list = infer_panel(*a, **k)
+        stats["t2s"] += time.perf_counter() - t0
+        tokens.extend(pred.cpu() for pred in pred_semantic_list)
+        return pred_semantic_list, idx_list
+
+    tts.text_preprocessor.get_bert_feature_batch = timed_bert
+    tts.t2s_model.model.infer_panel_batch_infer = timed_t2s
+
+    audios = []
+    for text in texts:
+        inputs = {
+            "text": text,
+            "text_lang": args.text_lang,
+            "ref_audio_path": args.ref_audio,
+            "prompt_text": args.prompt_text,
+            "prompt_lang": args.prompt_lang,
+            "text_split_method": "cut0",
+            "batch_size": 1,
+            "top_k": 1,
+            "seed": args.seed,
+            "parallel_infer": True,
+            "split_bucket": False,
+            "pipeline_infer": False,
+        }
+        sr, wav = next(tts.run(inputs))
+        audios.append((sr, wav))
+    tts.release()
+    return tokens, audios, stats
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument("--config", default="infer_config.yml")
+    parser.add_argument("--ref_audio", required=True)
+    parser.add_argument("--prompt_text", required=True)
+    parser.add_argument("--prompt_lang", default="zh")
+    parser.add_argument("--text_file", required=True, help="one sentence per line")
+    parser.add_argument("--text_lang", default="zh")
+    parser.add_argument("--modes", default="fp32,int8,bf16")
+    parser.add_argument("--seed", type=int, default=1234)
+    args = parser.parse_args()
+
+    with open(args.text_file, "r", encoding="utf8") as f:
+        texts = [line.strip() for line in f if line.strip()]
+
+    modes = args.modes.split(",")
+    if modes[0] != "fp32":
+        modes = ["fp32"] + modes
+    results = {mode: run_mode(args, mode, texts) for mode in modes}
+    ref_tokens, ref_audios, _ = results["fp32"]
+
+    print("%6s%9s%9s%10s%10s%10s%9s%9s" % ("mode", "bert s", "t2s s", "tok agr", "1st diff", "len diff", "mel L1", "dur"))
+    for mode in modes:
+        tokens, audios, stats = results[mode]
+        agreement = [token_agreement(a, b) for a, b in zip(ref_tokens, tokens)]
+        mel_l1, dur = [], []
+        for (sr, ref_wav), (_, wav) in zip(ref_audios, audios):
+            ref_mel, mel = log_mel(ref_wav, sr), log_mel(wav, sr)
+            n = min(ref_mel.shape[-1], mel.shape[-1])
+            mel_l1.append((ref_mel[..., :n] - mel[..., :n]).abs().mean().item())
+            dur.append(len(wav) / max(len(ref_wav), 1))
+        print(
+            "%6s%9.2f%9.2f%10.3f%10.1f%10.1f%9.4f%9.3f"
+            % (
+                mode,
+                stats["bert"],
+                stats["t2s"],
+                np.mean([a[0] for a in agreement]),
+                np.mean([a[1] for a in agreement]),
+                np.mean([abs(a[2]) for a in agreement]),
+                np.mean(mel_l1),
+                np.mean(dur),
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
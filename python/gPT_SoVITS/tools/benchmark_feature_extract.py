@@ -0,0 +1,112 @@
+"""
+HuBERT/semantic特征提取的逐条与分桶批量对比：在一个.list（或音频目录）上分别跑逐条前向和get_content_batch，
+输出ssl最大误差、semantic token不一致的条数和两种方式的耗时。
+
+python tools/benchmark_feature_extract.py --inp_text xxx.list --cnhubert_dir GPT_SoVITS/pretrained_models/chinese-hubert-base \
+    --pretrained_s2G GPT_SoVITS/pretrained_models/gsv-v2final-pretrained/s2G2333k.pth --s2config_path GPT_SoVITS/configs/s2.json
+"""
+
+import os
+import sys
+import time
+from argparse import ArgumentParser
+
+sys.path.append(os.getcwd())
+
+import librosa
+import torch
+
+import utils
+from feature_extractor import cnhubert
+from module.models import SynthesizerTrn, extract_latent_batch
+from tools.feature_store import length_buckets
+from tools.my_utils import clean_path, load_many
+
+
+def sync(device):
+    if "cuda" in device:
+        torch.cuda.synchronize()
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument("--inp_text", required=True)
+    parser.add_argument("--cnhubert_dir", required=True)
+    parser.add_argument("--pretrained_s2G", default=None)
+    parser.add_argument("--s2config_path", default="configs/s2.json")
+    parser.add_argument("--limit", type=int, default=256)
+    parser.add_argument("--batch_size", type=int, default=16)
+    parser.add_argument("--batch_seconds", type=float, default=200)
+    parser.add_argument("--device", default="cuda:0" if torch.cuda.is_available() else "cpu")
+    parser.add_argument("--no_half", action="store_true")
+    args = parser.parse_args()
+    dtype = torch.float16 if "cuda" in args.device and not args.no_half else torch.float32
+
+    if os.path.isdir(args.inp_text):
+        paths = [os.path.join(args.inp_text, name) for name in sorted(os.listdir(args.inp_text))]
+    else:
+        with open(args.inp_text, "r", encoding="utf8") as f:
+            paths = [clean_path(line.split("|")[0]) for line in f.read().strip("\n").split("\n")]
+    paths = paths[: args.limit]
+    wavs = [librosa.resample(audio, orig_sr=32000, target_sr=16000) for audio in load_many(paths, 32000) if audio is not None]
+    print("%d utterances, %.1fs audio" % (len(wavs), sum(len(wav) for wav in wavs) / 16000))
+
+    cnhubert.cnhubert_base_path = args.cnhubert_dir
+    model = cnhubert.get_model().to(args.device, dtype)
+
+    sync(args.device)
+    t0 = time.perf_counter()
+    ssl_single = []
+    with torch.no_grad():
+        for wav in wavs:
+            tensor_wav16 = torch.from_numpy(wav).to(args.device, dtype).unsqueeze(0)
+            ssl_single.append(model.model(tensor_wav16)["last_hidden_state"].transpose(1, 2).cpu())
+    sync(args.device)
+    t_single = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    ssl_batch = [None] * len(wavs)
+    for batch in length_buckets([len(wav) for wav in wavs], args.batch_size, int(args.batch_seconds * 16000)):
+        for i, ssl in zip(batch, cnhubert.get_content_batch(model.model, [wavs[i] for i in batch], args.device, dtype)):
+            ssl_batch[i] = ssl
+    sync(args.device)
+    t_batch = time.perf_counter() - t0
+
+    max_err = max((a.float() - b.float()).abs().max().item() for a, b in zip(ssl_single, ssl_batch))
+    print("hubert single: %7.2fs  batched: %7.2fs  speedup %.1fx  max abs err %.2e" % (t_single, t_batch, t_single / t_batch, max_err))
+
+    if args.pretrained_s2G is None:
+        return
+    hps = utils.get_hparams_from_file(args.s2config_path)
+    vq_model = SynthesizerTrn(
+        hps.data.filter_length // 2 + 1,
+        hps.train.segment_size // hps.data.hop_length,
+        n_speakers=hps.data.n_speakers,
+        **hps.model,
+    )
+    vq_model.load_state_dict(torch.load(args.pretrained_s2G, map_location="cpu", weights_only=False)["weight"], strict=False)
+    vq_model = vq_model.to(args.device, dtype).eval()
+    ssl_list = [ssl.to(args.device) for ssl in ssl_single]
+
+    sync(args.device)
+    t0 = time.perf_counter()
+    with torch.no_grad():
+        codes_single = [vq_model.extract_latent(ssl)[0, 0].cpu() for ssl in ssl_list]
+    sync(args.device)
+    t_single = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    codes_batch = [None] * len(ssl_list)
+    for batch in length_buckets([ssl.shape[-1] for ssl in ssl_list], args.batch_size * 2, 32000):
+        with torch.no_grad():
+            for i, codes in zip(batch, extract_latent_batch(vq_model, [ssl_list[i] for i in batch])):
+                codes_batch[i] = codes.cpu()
+    sync(args.device)
+    t_batch = time.perf_counter() - t0
+
+    mismatch = sum(int(not torch.equal(a, b)) for a, b in zip(codes_single, codes_batch))
+    print("semantic single: %7.2fs  batched: %7.2fs  speedup %.1fx  mismatched utterances %d/%d" % (t_single, t_batch, t_single / t_batch, mismatch, len(ssl_list)))
+
+
+if __name__ == "__main__":
+    main()
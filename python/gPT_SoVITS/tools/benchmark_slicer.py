@@ -0,0 +1,133 @@
+"""
+切分速度测试：在合成的长音频（随机长度的有声段+静音段）上对比逐帧循环与向量化的静音检测，
+校验切割点完全一致，并测试流式切分（soundfile分块读取）的吞吐。
+
+python tools/benchmark_slicer.py --seconds 3600 --sr 32000
+"""
+
+import os
+import sys
+import tempfile
+import time
+from argparse import ArgumentParser
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np
+from slicer2 import Slicer, get_rms
+
+
+def sil_tags_loop(slicer: Slicer, rms_list):
+    ###原来的逐帧实现，作为对照
+    sil_tags = []
+    silence_start = None
+    clip_start = 0
+    for i, rms in enumerate(rms_list):
+        if rms < slicer.threshold:
+            if silence_start is None:
+                silence_start = i
+            continue
+        if silence_start is None:
+            continue
+        is_leading_silence = silence_start == 0 and i > slicer.max_sil_kept
+        need_slice_middle = i - silence_start >= slicer.min_interval and i - clip_start >= slicer.min_length
+        if not is_leading_silence and not need_slice_middle:
+            silence_start = None
+            continue
+        if i - silence_start <= slicer.max_sil_kept:
+            pos = rms_list[silence_start : i + 1].argmin() + silence_start
+            if silence_start == 0:
+                sil_tags.append((0, pos))
+            else:
+                sil_tags.append((pos, pos))
+            clip_start = pos
+        elif i - silence_start <= slicer.max_sil_kept * 2:
+            pos = rms_list[i - slicer.max_sil_kept : silence_start + slicer.max_sil_kept + 1].argmin()
+            pos += i - slicer.max_sil_kept
+            pos_l = rms_list[silence_start : silence_start + slicer.max_sil_kept + 1].argmin() + silence_start
+            pos_r = rms_list[i - slicer.max_sil_kept : i + 1].argmin() + i - slicer.max_sil_kept
+            if silence_start == 0:
+                sil_tags.append((0, pos_r))
+                clip_start = pos_r
+            else:
+                sil_tags.append((min(pos_l, pos), max(pos_r, pos)))
+                clip_start = max(pos_r, pos)
+        else:
+            pos_l = rms_list[silence_start : silence_start + slicer.max_sil_kept + 1].argmin() + silence_start
+            pos_r = rms_list[i - slicer.max_sil_kept : i + 1].argmin() + i - slicer.max_sil_kept
+            if silence_start == 0:
+                sil_tags.append((0, pos_r))
+            else:
+                sil_tags.append((pos_l, pos_r))
+            clip_start = pos_r
+        silence_start = None
+    total_frames = rms_list.shape[0]
+    if silence_start is not None and total_frames - silence_start >= slicer.min_interval:
+        silence_end = min(total_frames, silence_start + slicer.max_sil_kept)
+        pos = rms_list[silence_start : silence_end + 1].argmin() + silence_start
+        sil_tags.append((pos, total_frames + 1))
+    return sil_tags
+
+
+def synth_audio(seconds: float, sr: int, seed: int = 0) -> np.ndarray:
+    ###有声段0.2~8秒、静音段0.05~3秒交替，静音段带很小的底噪
+    rng = np.random.default_rng(seed)
+    n = int(seconds * sr)
+    audio = np.empty(n, dtype=np.float32)
+    pos = 0
+    voiced = bool(rng.integers(2))
+    while pos < n:
+        length = int(sr * (rng.uniform(0.2, 8) if voiced else rng.uniform(0.05, 3)))
+        length = min(length, n - pos)
+        amp = rng.uniform(0.05, 0.5) if voiced else 1e-4
+        audio[pos : pos + length] = rng.standard_normal(length).astype(np.float32) * amp
+        pos += length
+        voiced = not voiced
+    return audio
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument("--seconds", type=float, default=1800)
+    parser.add_argument("--sr", type=int, default=32000)
+    parser.add_argument("--hop_size", type=int, default=10)
+    parser.add_argument("--block_frames", type=int, default=100000)
+    args = parser.parse_args()
+
+    slicer = Slicer(sr=args.sr, threshold=-34, min_length=4000, min_interval=300, hop_size=args.hop_size, max_sil_kept=500)
+    audio = synth_audio(args.seconds, args.sr)
+
+    t0 = time.perf_counter()
+    rms_list = get_rms(y=audio, frame_length=slicer.win_size, hop_length=slicer.hop_size).squeeze(0)
+    t_rms = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    tags_loop = sil_tags_loop(slicer, rms_list)
+    t_loop = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    tags_vec = slicer._get_sil_tags(rms_list)
+    t_vec = time.perf_counter() - t0
+    assert tags_loop == tags_vec, "cut points differ"
+
+    chunks = slicer.slice(audio)
+    print("audio: %.0fs @ %dHz, %d frames, %d cut points, %d chunks" % (args.seconds, args.sr, len(rms_list), len(tags_vec), len(chunks)))
+    print("rms:           %8.3fs  (%7.0fx realtime)" % (t_rms, args.seconds / t_rms))
+    print("loop cuts:     %8.3fs  (%7.0fx realtime)" % (t_loop, args.seconds / t_loop))
+    print("vector cuts:   %8.3fs  (%7.0fx realtime)  speedup %.1fx" % (t_vec, args.seconds / t_vec, t_loop / t_vec))
+
+    import soundfile
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "synth.wav")
+        soundfile.write(path, audio, args.sr, subtype="FLOAT")
+        t0 = time.perf_counter()
+        stream_chunks = list(slicer.slice_stream(path, args.block_frames))
+        t_stream = time.perf_counter() - t0
+    assert [c[1:] for c in stream_chunks] == [c[1:] for c in chunks], "streamed chunk boundaries differ"
+    assert all(np.array_equal(a[0], b[0]) for a, b in zip(stream_chunks, chunks)), "streamed audio differs"
+    print("stream slice:  %8.3fs  (%7.0fx realtime, rms+cuts+reads)" % (t_stream, args.seconds / t_stream))
+
+
+if __name__ == "__main__":
+    main()
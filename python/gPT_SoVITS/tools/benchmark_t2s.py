@@ -0,0 +1,83 @@
+"""
+T2S 解码速度测试：对比 torch.cat 增长的 kv cache 与预分配原地写入的 kv cache，
+输出不同序列长度下的 tokens/s。
+
+python tools/benchmark_t2s.py --device cpu --batch_size 4 --steps 200
+"""
+
+import os
+import sys
+
+now_dir = os.getcwd()
+sys.path.append(now_dir)
+
+import time
+from argparse import ArgumentParser
+
+import torch
+from AR.models.t2s_model import Text2SemanticDecoder, alloc_static_kv_cache
+
+config = {
+    "model": {
+        "hidden_dim": 512,
+        "embedding_dim": 512,
+        "head": 16,
+        "n_layer": 24,
+        "vocab_size": 1025,
+        "phoneme_vocab_size": 732,
+        "dropout": 0,
+        "EOS": 1024,
+    }
+}
+
+
+@torch.no_grad()
+def bench(model: Text2SemanticDecoder, batch_size: int, prompt_len: int, steps: int, static: bool, device):
+    hidden = model.model_dim
+    dtype = model.ar_predict_layer.weight.dtype
+    xy_pos = torch.randn(batch_size, prompt_len, hidden, dtype=dtype, device=device)
+    attn_mask = torch.zeros(batch_size, 1, prompt_len, prompt_len, dtype=torch.bool, device=device)
+    _, k_cache, v_cache = model.t2s_transformer.process_prompt(xy_pos, attn_mask, None)
+    if static:
+        k_cache, v_cache = alloc_static_kv_cache(k_cache, v_cache, prompt_len + steps + 1)
+    x = torch.randn(batch_size, 1, hidden, dtype=dtype, device=device)
+
+    if "cuda" in str(device):
+        torch.cuda.synchronize()
+    t0 = time.perf_counter()
+    for i in range(steps):
+        if static:
+            model.t2s_transformer.decode_next_token_static(x, k_cache, v_cache, prompt_len + i, None)
+        else:
+            _, k_cache, v_cache = model.t2s_transformer.decode_next_token(x, k_cache, v_cache, None)
+    if "cuda" in str(device):
+        torch.cuda.synchronize()
+    return batch_size * steps / (time.perf_counter() - t0)
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument("--device", type=str, default="cpu")
+    parser.add_argument("--batch_size", type=int, default=4)
+    parser.add_argument("--steps", type=int, default=200, help="decode steps per measurement")
+    parser.add_argument("--prompt_lens", type=str, default="128,256,512,1024")
+    parser.add_argument("--half", action="store_true")
+    args = parser.parse_args()
+
+    model = Text2SemanticDecoder(config).eval().to(args.device)
+    if args.half:
+        model = model.half()
+
+    print("%10s%10s%16s%16s%10s" % ("prompt", "total", "cat tok/s", "static tok/s", "speedup"))
+    for prompt_len in [int(i) for i in args.prompt_lens.split(",")]:
+        bench(model, args.batch_size, prompt_len, 8, True, args.device)  ### warmup
+        cat_tps = bench(model, args.batch_size, prompt_len, args.steps, False, args.device)
+        static_tps = bench(model, args.batch_size, prompt_len, args.steps, True, args.device)
+        print(
+            "%10d%10d%16.1f%16.1f%9.2fx"
+            % (prompt_len, prompt_len + args.steps, cat_tps, static_tps, static_tps / cat_tps)
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""
+追加写入的特征库，替代4-cnhubert下每条音频一个.pt的存法。
+
+目录下每个写入方（每个i_part / 每个流水线worker）一段：
+    feats-{part}.bin  特征数据首尾相接
+    feats-{part}.idx  一行一条：name\toffset\tdtype\tshape
+先写数据再写index，中断后重新打开时按index截掉多余的数据和写了一半的index行，已写入的条目不受影响。
+同名条目以最后写入的为准。读取时把所有段的index合在一起，用np.memmap按偏移取数据；
+memmap在每个进程第一次读取时才打开，DataLoader的worker不会把整块数据pickle过去。
+"""
+
+import os
+from glob import glob
+
+import numpy as np
+import torch
+
+STORE_PREFIX = "feats-"
+
+
+def glob_escape(path):
+    return path.replace("[", "[[]")
+
+
+class FeatureStore:
+    def __init__(self, root, part=None):
+        self.root = root
+        self.index = {}  # name -> (segment, offset, dtype, shape)
+        self.maps = {}
+        self.pending = []
+        self.segment = None if part is None else "%s%s" % (STORE_PREFIX, part)
+        for idx_path in sorted(glob("%s/%s*.idx" % (glob_escape(root), STORE_PREFIX))):
+            segment = os.path.basename(idx_path)[:-4]
+            self._load_index(segment, repair=segment == self.segment)
+        if self.segment is not None:
+            os.makedirs(root, exist_ok=True)
+            self.data_f = open(self._path(self.segment, "bin"), "ab")
+            self.index_f = open(self._path(self.segment, "idx"), "a", encoding="utf8")
+
+    @classmethod
+    def open_if_exists(cls, root):
+        if len(glob("%s/%s*.idx" % (glob_escape(root), STORE_PREFIX))) == 0:
+            return None
+        return cls(root)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __getstate__(self):
+        assert self.segment is None, "writable FeatureStore can not be pickled"
+        state = self.__dict__.copy()
+        state["maps"] = {}
+        return state
+
+    def _path(self, segment, ext):
+        return "%s/%s.%s" % (self.root, segment, ext)
+
+    def _load_index(self, segment, repair=False):
+        idx_path = self._path(segment, "idx")
+        with open(idx_path, "r", encoding="utf8") as f:
+            content = f.read()
+        good = content[: content.rfind("\n") + 1]  # 最后一行没写完就丢掉
+        end = 0
+        for line in good.splitlines():
+            name, offset, dtype, shape = line.split("\t")
+            shape = tuple(int(i) for i in shape.split(",")) if shape else ()
+            offset = int(offset)
+            self.index[name] = (segment, offset, dtype, shape)
+            end = max(end, offset + int(np.prod(shape)) * np.dtype(dtype).itemsize)
+        if repair:
+            if len(good) != len(content):
+                with open(idx_path, "w", encoding="utf8") as f:
+                    f.write(good)
+            data_path = self._path(segment, "bin")
+            if os.path.exists(data_path) and os.path.getsize(data_path) > end:
+                with open(data_path, "r+b") as f:
+                    f.truncate(end)
+
+    def __contains__(self, name):
+        return name in self.index
+
+    def __len__(self):
+        return len(self.index)
+
+    def names(self):
+        return list(self.index)
+
+    def shape(self, name):
+        return self.index[name][3]
+
+    def add(self, name, tensor):
+        array = tensor.detach().cpu().contiguous().numpy()
+        offset = self.data_f.tell()
+        self.data_f.write(array.tobytes())
+        self.index[name] = (self.segment, offset, array.dtype.name, array.shape)
+        self.pending.append("%s\t%d\t%s\t%s\n" % (name, offset, array.dtype.name, ",".join(str(i) for i in array.shape)))
+        self.maps.pop(self.segment, None)
+
+    def flush(self):
+        ###数据落盘之后才写index
+        if len(self.pending) == 0:
+            return
+        self.data_f.flush()
+        os.fsync(self.data_f.fileno())
+        self.index_f.write("".join(self.pending))
+        self.index_f.flush()
+        self.pending = []
+
+    def close(self):
+        if self.segment is not None:
+            self.flush()
+            self.data_f.close()
+            self.index_f.close()
+
+    def get(self, name):
+        segment, offset, dtype, shape = self.index[name]
+        if segment not in self.maps:
+            self.maps[segment] = np.memmap(self._path(segment, "bin"), dtype=np.uint8, mode="r")
+        n_bytes = int(np.prod(shape)) * np.dtype(dtype).itemsize
+        array = np.array(self.maps[segment][offset : offset + n_bytes]).view(dtype).reshape(shape)
+        return torch.from_numpy(array)
+
+
+def length_buckets(lengths, max_batch, max_total):
+    """
+    按长度排序后切批：每批不超过max_batch条，且补齐后的总长度（批内最长×条数）不超过max_total。
+    返回下标列表的列表。
+    """
+    order = sorted(range(len(lengths)), key=lambda i: lengths[i])
+    batches = []
+    batch = []
+    for i in order:
+        if len(batch) > 0 and (len(batch) >= max_batch or lengths[i] * (len(batch) + 1) > max_total):
+            batches.append(batch)
+            batch = []
+        batch.append(i)
+    if len(batch) > 0:
+        batches.append(batch)
+    return batches
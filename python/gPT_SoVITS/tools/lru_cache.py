@@ -0,0 +1,138 @@
+"""
+按字节预算淘汰的LRU缓存，文本特征缓存（text/text_cache.py）和参考音频缓存（TTS_infer_pack/ReferenceCache.py）共用。
+
+条目是张量/列表/字典组成的结构，内存里超出max_bytes时从最久未用的开始淘汰。
+设置disk_dir时条目可以落盘（文件名为key的sha1），内存未命中时从盘上读回；什么时候落盘由子类决定。
+"""
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+import torch
+
+
+def nbytes(value: Any) -> int:
+    if isinstance(value, torch.Tensor):
+        return value.element_size() * value.nelement()
+    if isinstance(value, dict):
+        return sum(nbytes(v) for v in value.values())
+    if isinstance(value, (list, tuple)):
+        return sum(nbytes(v) for v in value) + 8 * len(value)
+    if isinstance(value, str):
+        return len(value)
+    return 8
+
+
+def to_device(value: Any, device: Optional[torch.device]) -> Any:
+    if isinstance(value, torch.Tensor):
+        return value.to(device) if device is not None else value.cpu()
+    if isinstance(value, dict):
+        return {k: to_device(v, device) for k, v in value.items()}
+    if isinstance(value, list):
+        return [to_device(v, device) for v in value]
+    if isinstance(value, tuple):
+        return tuple(to_device(v, device) for v in value)
+    return value
+
+
+class ByteLRUCache:
+    def __init__(self, max_bytes: int, disk_dir: str = None):
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        if self.disk_dir is not None:
+            os.makedirs(self.disk_dir, exist_ok=True)
+
+        self.entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self.entry_bytes: Dict[str, int] = {}
+        self.total_bytes: int = 0
+        self.lock = threading.RLock()
+
+        self.hits: int = 0
+        self.disk_hits: int = 0
+        self.misses: int = 0
+        self.evictions: int = 0
+
+    def __contains__(self, key: str) -> bool:
+        """只看有没有，不计入命中统计，也不调整LRU顺序"""
+        with self.lock:
+            if key in self.entries:
+                return True
+        disk_path = self._disk_path(key)
+        return disk_path is not None and os.path.exists(disk_path)
+
+    def get(self, key: str, device: torch.device = None) -> Optional[Dict[str, Any]]:
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key]
+
+            disk_path = self._disk_path(key)
+            if disk_path is not None and os.path.exists(disk_path):
+                try:
+                    entry = to_device(torch.load(disk_path, map_location="cpu", weights_only=False), device)
+                except Exception:
+                    ### 损坏的缓存文件当作未命中
+                    entry = None
+                if entry is not None:
+                    self.disk_hits += 1
+                    self._insert(key, entry)
+                    return entry
+
+            self.misses += 1
+            return None
+
+    def put(self, key: str, entry: Dict[str, Any]):
+        with self.lock:
+            if key in self.entries:
+                self.total_bytes -= self.entry_bytes.pop(key)
+                del self.entries[key]
+            self._insert(key, entry)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.entry_bytes.clear()
+            self.total_bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "entries": len(self.entries),
+                "bytes": self.total_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+            }
+
+    def on_evict(self, key: str, entry: Dict[str, Any]):
+        pass
+
+    def _insert(self, key: str, entry: Dict[str, Any]):
+        size = nbytes(entry)
+        self.entries[key] = entry
+        self.entry_bytes[key] = size
+        self.total_bytes += size
+        while self.total_bytes > self.max_bytes and len(self.entries) > 1:
+            old_key, old_entry = self.entries.popitem(last=False)
+            self.total_bytes -= self.entry_bytes.pop(old_key)
+            self.evictions += 1
+            self.on_evict(old_key, old_entry)
+
+    def _disk_path(self, key: str) -> Optional[str]:
+        if self.disk_dir is None:
+            return None
+        return os.path.join(self.disk_dir, hashlib.sha1(key.encode("utf-8")).hexdigest() + ".pt")
+
+    def _write(self, key: str, entry: Dict[str, Any]):
+        disk_path = self._disk_path(key)
+        tmp_path = "%s.%d.tmp" % (disk_path, os.getpid())
+        torch.save(to_device(entry, None), tmp_path)
+        os.replace(tmp_path, disk_path)
@@ -1,6 +1,10 @@
 import ctypes
 import os
 import sys
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 import ffmpeg
@@ -13,30 +17,129 @@ from tools.i18n.i18n import I18nAuto
 i18n = I18nAuto(language=os.environ.get("language", "Auto"))
 
 
-def load_audio(file, sr):
+### 进程内解码：wav/flac等libsndfile能读的格式用soundfile解码、torchaudio重采样，
+### 其它格式（或audio_backend=ffmpeg）才起ffmpeg子进程
+audio_backend = os.environ.get("audio_backend", "auto")
+SOUNDFILE_EXTS = {".wav", ".flac", ".ogg", ".aiff", ".aif", ".aifc"}
+
+_resamplers = {}
+_stats_lock = threading.Lock()
+_decode_stats = {"files": 0, "audio_seconds": 0.0, "decode_seconds": 0.0, "soundfile": 0, "ffmpeg": 0}
+
+
+def _resample(audio, sr0, sr1):
+    import torch
+    import torchaudio
+
+    key = (sr0, sr1)
+    if key not in _resamplers:
+        _resamplers[key] = torchaudio.transforms.Resample(sr0, sr1)
+    with torch.no_grad():
+        return _resamplers[key](torch.from_numpy(audio).unsqueeze(0)).squeeze(0).numpy()
+
+
+def _load_audio_soundfile(file, sr):
+    import soundfile
+
+    audio, sr0 = soundfile.read(file, dtype="float32", always_2d=True)
+    audio = audio.mean(axis=1) if audio.shape[1] > 1 else audio[:, 0]
+    audio = np.ascontiguousarray(audio, dtype=np.float32)
+    if sr0 != sr:
+        audio = _resample(audio, sr0, sr)
+    return audio
+
+
+def _load_audio_ffmpeg(file, sr):
+    # https://github.com/openai/whisper/blob/main/whisper/audio.py#L26
+    # This launches a subprocess to decode audio while down-mixing and resampling as necessary.
+    # Requires the ffmpeg CLI and `ffmpeg-python` package to be installed.
     try:
-        # https://github.com/openai/whisper/blob/main/whisper/audio.py#L26
-        # This launches a subprocess to decode audio while down-mixing and resampling as necessary.
-        # Requires the ffmpeg CLI and `ffmpeg-python` package to be installed.
-        file = clean_path(file)  # 防止小白拷路径头尾带了空格和"和回车
-        if os.path.exists(file) is False:
-            raise RuntimeError("You input a wrong audio path that does not exists, please fix it!")
         out, _ = (
             ffmpeg.input(file, threads=0)
             .output("-", format="f32le", acodec="pcm_f32le", ac=1, ar=sr)
             .run(cmd=["ffmpeg", "-nostdin"], capture_stdout=True, capture_stderr=True)
         )
-    except Exception:
-        out, _ = (
-            ffmpeg.input(file, threads=0)
-            .output("-", format="f32le", acodec="pcm_f32le", ac=1, ar=sr)
-            .run(cmd=["ffmpeg", "-nostdin"], capture_stdout=True)
-        )  # Expose the Error
+    except ffmpeg.Error as e:
+        ###stderr已经捕获，直接带进报错信息，不用再跑一遍ffmpeg
+        print((e.stderr or b"").decode("utf-8", errors="ignore")[-2000:])
         raise RuntimeError(i18n("音频加载失败"))
-
     return np.frombuffer(out, np.float32).flatten()
 
 
+def load_audio(file, sr):
+    t0 = time.perf_counter()
+    file = clean_path(file)  # 防止小白拷路径头尾带了空格和"和回车
+    if os.path.exists(file) is False:
+        raise RuntimeError("You input a wrong audio path that does not exists, please fix it!")
+    audio = None
+    backend = "ffmpeg"
+    if audio_backend != "ffmpeg" and os.path.splitext(file)[1].lower() in SOUNDFILE_EXTS:
+        try:
+            audio = _load_audio_soundfile(file, sr)
+            backend = "soundfile"
+        except Exception:
+            ###libsndfile不支持的编码（如wav里的adpcm）交给ffmpeg
+            audio = None
+    if audio is None:
+        audio = _load_audio_ffmpeg(file, sr)
+    with _stats_lock:
+        _decode_stats["files"] += 1
+        _decode_stats["audio_seconds"] += len(audio) / sr
+        _decode_stats["decode_seconds"] += time.perf_counter() - t0
+        _decode_stats[backend] += 1
+    return audio
+
+
+def load_many(paths, sr, num_workers=None):
+    """
+    Decodes `paths` on a thread pool (libsndfile and the resampler release the GIL) and
+    returns the arrays in order. A file that fails to decode gives None instead of raising.
+    """
+    num_workers = num_workers or int(os.environ.get("audio_decode_workers", min(8, os.cpu_count() or 1)))
+
+    def load(path):
+        try:
+            return load_audio(path, sr)
+        except Exception:
+            print(path, "->fail->", traceback.format_exc())
+            return None
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=num_workers) as executor:
+        audios = list(executor.map(load, paths))
+    cost = time.perf_counter() - t0
+    seconds = sum(len(audio) for audio in audios if audio is not None) / sr
+    print(
+        "load_many: %d files, %.1fs audio in %.2fs (%.1f files/s, %.0fx realtime)"
+        % (len(paths), seconds, cost, len(paths) / max(cost, 1e-9), seconds / max(cost, 1e-9))
+    )
+    return audios
+
+
+def decode_stats():
+    with _stats_lock:
+        stats = dict(_decode_stats)
+    stats["files_per_second"] = stats["files"] / max(stats["decode_seconds"], 1e-9)
+    stats["realtime_factor"] = stats["audio_seconds"] / max(stats["decode_seconds"], 1e-9)
+    return stats
+
+
+def report_decode_stats():
+    stats = decode_stats()
+    print(
+        "audio decode: %d files (soundfile %d, ffmpeg %d), %.1fs audio, %.2fs decoding, %.1f files/s, %.0fx realtime"
+        % (
+            stats["files"],
+            stats["soundfile"],
+            stats["ffmpeg"],
+            stats["audio_seconds"],
+            stats["decode_seconds"],
+            stats["files_per_second"],
+            stats["realtime_factor"],
+        )
+    )
+
+
 def clean_path(path_str: str):
     if path_str.endswith(("\\", "/")):
         return clean_path(path_str[0:-1])
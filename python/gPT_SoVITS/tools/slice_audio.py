@@ -6,7 +6,7 @@ from scipy.io import wavfile
 
 # parent_directory = os.path.dirname(os.path.abspath(__file__))
 # sys.path.append(parent_directory)
-from tools.my_utils import load_audio
+from tools.my_utils import load_audio, report_decode_stats
 from slicer2 import Slicer
 
 
@@ -47,6 +47,7 @@ def slice(inp, opt_root, threshold, min_length, min_interval, hop_size, max_sil_
                 )
         except:
             print(inp_path, "->fail->", traceback.format_exc())
+    report_decode_stats()
     return "执行完毕，请检查输出文件"
 
 
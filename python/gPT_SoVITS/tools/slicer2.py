@@ -10,7 +10,11 @@ def get_rms(
 ):
     padding = (int(frame_length // 2), int(frame_length // 2))
     y = np.pad(y, padding, mode=pad_mode)
+    return _framed_rms(y, frame_length, hop_length)
 
+
+def _framed_rms(y, frame_length, hop_length):
+    ###y已经补齐过，第j帧覆盖y[j*hop_length : j*hop_length+frame_length]
     axis = -1
     # put our new within-frame axis at the end for now
     out_strides = y.strides + tuple([y.strides[axis]])
@@ -49,6 +53,7 @@ class Slicer:
             raise ValueError("The following condition must be satisfied: min_length >= min_interval >= hop_size")
         if not max_sil_kept >= hop_size:
             raise ValueError("The following condition must be satisfied: max_sil_kept >= hop_size")
+        self.sr = sr
         min_interval = sr * min_interval / 1000
         self.threshold = 10 ** (threshold / 20.0)
         self.hop_size = round(sr * hop_size / 1000)
@@ -72,24 +77,45 @@ class Slicer:
         if samples.shape[0] <= self.min_length:
             return [waveform]
         rms_list = get_rms(y=samples, frame_length=self.win_size, hop_length=self.hop_size).squeeze(0)
+        sil_tags = self._get_sil_tags(rms_list)
+        total_frames = rms_list.shape[0]
+        # Apply and return slices.
+        ####音频+起始时间+终止时间
+        if len(sil_tags) == 0:
+            return [[waveform, 0, int(total_frames * self.hop_size)]]
+        return [
+            [self._apply_slice(waveform, begin, end), int(begin * self.hop_size), int(end * self.hop_size)]
+            for begin, end in self._chunk_ranges(sil_tags, total_frames)
+        ]
+
+    def _get_sil_tags(self, rms_list):
+        """
+        静音段切割点。先对静音帧做游程编码，再用数组运算筛掉不可能切割的静音段；
+        只有剩下的候选段依赖上一个切点（clip_start），逐段处理。结果与逐帧扫描完全一致。
+        """
+        total_frames = rms_list.shape[0]
+        silent = (rms_list < self.threshold).astype(np.int8)
+        edges = np.diff(silent, prepend=0, append=0)
+        # run_starts是静音段第一帧，run_ends是之后第一个非静音帧（可能等于total_frames）
+        run_starts = np.flatnonzero(edges == 1)
+        run_ends = np.flatnonzero(edges == -1)
+        trailing_start = None
+        if len(run_ends) > 0 and run_ends[-1] == total_frames:
+            trailing_start = int(run_starts[-1])
+            run_starts = run_starts[:-1]
+            run_ends = run_ends[:-1]
+        is_leading = (run_starts == 0) & (run_ends > self.max_sil_kept)
+        long_enough = run_ends - run_starts >= self.min_interval
+        candidates = np.flatnonzero(is_leading | long_enough)
+
         sil_tags = []
-        silence_start = None
         clip_start = 0
-        for i, rms in enumerate(rms_list):
-            # Keep looping while frame is silent.
-            if rms < self.threshold:
-                # Record start of silent frames.
-                if silence_start is None:
-                    silence_start = i
-                continue
-            # Keep looping while frame is not silent and silence start has not been recorded.
-            if silence_start is None:
-                continue
+        for silence_start, i, leading in zip(
+            run_starts[candidates].tolist(), run_ends[candidates].tolist(), is_leading[candidates].tolist()
+        ):
             # Clear recorded silence start if interval is not enough or clip is too short
-            is_leading_silence = silence_start == 0 and i > self.max_sil_kept
             need_slice_middle = i - silence_start >= self.min_interval and i - clip_start >= self.min_length
-            if not is_leading_silence and not need_slice_middle:
-                silence_start = None
+            if not leading and not need_slice_middle:
                 continue
             # Need slicing. Record the range of silent frames to be removed.
             if i - silence_start <= self.max_sil_kept:
@@ -118,38 +144,78 @@ class Slicer:
                 else:
                     sil_tags.append((pos_l, pos_r))
                 clip_start = pos_r
-            silence_start = None
         # Deal with trailing silence.
-        total_frames = rms_list.shape[0]
-        if silence_start is not None and total_frames - silence_start >= self.min_interval:
-            silence_end = min(total_frames, silence_start + self.max_sil_kept)
-            pos = rms_list[silence_start : silence_end + 1].argmin() + silence_start
+        if trailing_start is not None and total_frames - trailing_start >= self.min_interval:
+            silence_end = min(total_frames, trailing_start + self.max_sil_kept)
+            pos = rms_list[trailing_start : silence_end + 1].argmin() + trailing_start
             sil_tags.append((pos, total_frames + 1))
-        # Apply and return slices.
-        ####音频+起始时间+终止时间
-        if len(sil_tags) == 0:
-            return [[waveform, 0, int(total_frames * self.hop_size)]]
-        else:
-            chunks = []
-            if sil_tags[0][0] > 0:
-                chunks.append([self._apply_slice(waveform, 0, sil_tags[0][0]), 0, int(sil_tags[0][0] * self.hop_size)])
-            for i in range(len(sil_tags) - 1):
-                chunks.append(
-                    [
-                        self._apply_slice(waveform, sil_tags[i][1], sil_tags[i + 1][0]),
-                        int(sil_tags[i][1] * self.hop_size),
-                        int(sil_tags[i + 1][0] * self.hop_size),
-                    ]
-                )
-            if sil_tags[-1][1] < total_frames:
-                chunks.append(
-                    [
-                        self._apply_slice(waveform, sil_tags[-1][1], total_frames),
-                        int(sil_tags[-1][1] * self.hop_size),
-                        int(total_frames * self.hop_size),
-                    ]
-                )
-            return chunks
+        return sil_tags
+
+    @staticmethod
+    def _chunk_ranges(sil_tags, total_frames):
+        ###切割点之间的有声段，单位是帧
+        ranges = []
+        if sil_tags[0][0] > 0:
+            ranges.append((0, sil_tags[0][0]))
+        for i in range(len(sil_tags) - 1):
+            ranges.append((sil_tags[i][1], sil_tags[i + 1][0]))
+        if sil_tags[-1][1] < total_frames:
+            ranges.append((sil_tags[-1][1], total_frames))
+        return ranges
+
+    def get_rms_stream(self, sf_file, block_frames=100000):
+        """
+        逐块读取soundfile.SoundFile算音量曲线，每次只读block_frames帧对应的采样，
+        帧的划分和get_rms完全相同（两端补零、center对齐）。
+        """
+        n_samples = sf_file.frames
+        half = self.win_size // 2
+        total_frames = 1 + (n_samples + 2 * half - self.win_size) // self.hop_size
+        rms_list = np.empty(total_frames, dtype=np.float32)
+        for j0 in range(0, total_frames, block_frames):
+            j1 = min(total_frames, j0 + block_frames)
+            a = j0 * self.hop_size - half
+            b = (j1 - 1) * self.hop_size - half + self.win_size
+            samples = self._read_mono(sf_file, max(a, 0), min(b, n_samples))
+            samples = np.pad(samples, (max(0, -a), max(0, b - n_samples)), mode="constant")
+            rms_list[j0:j1] = _framed_rms(samples, self.win_size, self.hop_size).squeeze(0)
+        return rms_list
+
+    @staticmethod
+    def _read(sf_file, begin, end):
+        sf_file.seek(begin)
+        data = sf_file.read(frames=end - begin, dtype="float32", always_2d=True)
+        # 与librosa.load(mono=False)一致：多声道为(channels, samples)
+        return data[:, 0] if data.shape[1] == 1 else data.T
+
+    def _read_mono(self, sf_file, begin, end):
+        data = self._read(sf_file, begin, end)
+        return data.mean(axis=0) if len(data.shape) > 1 else data
+
+    def slice_stream(self, path, block_frames=100000):
+        """
+        流式切分长音频：按块读取文件，内存占用与文件长度无关（音量曲线除外，它只有采样数的1/hop_size）。
+        逐个yield [音频, 起始采样, 终止采样]，与slice的结果一致。文件采样率必须等于sr。
+        """
+        import soundfile
+
+        with soundfile.SoundFile(path) as f:
+            if f.samplerate != self.sr:
+                raise ValueError("sample rate of %s is %d, the slicer expects %d" % (path, f.samplerate, self.sr))
+            n_samples = f.frames
+            if n_samples <= self.min_length:
+                yield [self._read(f, 0, n_samples), 0, n_samples]
+                return
+            rms_list = self.get_rms_stream(f, block_frames)
+            sil_tags = self._get_sil_tags(rms_list)
+            total_frames = rms_list.shape[0]
+            if len(sil_tags) == 0:
+                yield [self._read(f, 0, n_samples), 0, int(total_frames * self.hop_size)]
+                return
+            for begin, end in self._chunk_ranges(sil_tags, total_frames):
+                begin_sample = begin * self.hop_size
+                end_sample = min(n_samples, end * self.hop_size)
+                yield [self._read(f, begin_sample, end_sample), int(begin * self.hop_size), int(end * self.hop_size)]
 
 
 def main():
@@ -197,11 +263,19 @@ def main():
         default=500,
         help="The maximum silence length kept around the sliced clip, presented in milliseconds",
     )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Read the audio in blocks instead of loading the whole file, for very long recordings",
+    )
     args = parser.parse_args()
     out = args.out
     if out is None:
         out = os.path.dirname(os.path.abspath(args.audio))
-    audio, sr = librosa.load(args.audio, sr=None, mono=False)
+    if args.stream:
+        sr = soundfile.info(args.audio).samplerate
+    else:
+        audio, sr = librosa.load(args.audio, sr=None, mono=False)
     slicer = Slicer(
         sr=sr,
         threshold=args.db_thresh,
@@ -210,10 +284,12 @@ def main():
         hop_size=args.hop_size,
         max_sil_kept=args.max_sil_kept,
     )
-    chunks = slicer.slice(audio)
+    chunks = slicer.slice_stream(args.audio) if args.stream else slicer.slice(audio)
     if not os.path.exists(out):
         os.makedirs(out)
     for i, chunk in enumerate(chunks):
+        if isinstance(chunk, list):
+            chunk = chunk[0]
         if len(chunk.shape) > 1:
             chunk = chunk.T
         soundfile.write(
@@ -1,4 +1,7 @@
+import os
+import json
 import requests
+import httpx
 from transformers import AutoTokenizer, AutoModelForCausalLM, pipeline
 from transformers import T5Tokenizer
 from modelscope.pipelines import pipeline as modelscope_pipeline
@@ -13,6 +16,11 @@ class LocalModel:
     def __init__(self, model_path, config):
         self.model_path = model_path
         self.config = config
+        # 复用 keep-alive 连接，避免每次请求重新建立 TCP 连接
+        self.session = requests.Session()
+        self.async_client = None
+        self.max_connections = int(os.getenv("LLM_MAX_CONNECTIONS", 100))
+        self.timeout = float(os.getenv("LLM_TIMEOUT", 200))
 
     # def load_model(self):
     #     tokenizer = AutoTokenizer.from_pretrained(self.model_path)
@@ -48,9 +56,62 @@ class LocalModel:
             "messages": message,
             "max_tokens": 20000,
         }
-        resp = requests.post(ip, json=payload, timeout=200)
+        resp = self.session.post(ip, json=payload, timeout=self.timeout)
         resp.raise_for_status()
         data = resp.json()
         result = data["choices"][0]["message"]["content"]
         return result
 
+    def get_async_client(self):
+        # 在事件循环内懒加载，所有请求共用同一个连接池
+        if self.async_client is None or self.async_client.is_closed:
+            self.async_client = httpx.AsyncClient(
+                timeout=httpx.Timeout(self.timeout, connect=10),
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections,
+                ),
+            )
+        return self.async_client
+
+    async def aload_qwe3(self, ip, message):
+        payload = {
+            "model": "qwen3",
+            "messages": message,
+            "max_tokens": 20000,
+        }
+        resp = await self.get_async_client().post(ip, json=payload)
+        resp.raise_for_status()
+        data = resp.json()
+        result = data["choices"][0]["message"]["content"]
+        return result
+
+    async def stream_qwe3(self, ip, message):
+        # OpenAI 兼容接口的 SSE 流式输出，逐段 yield 文本
+        payload = {
+            "model": "qwen3",
+            "messages": message,
+            "max_tokens": 20000,
+            "stream": True,
+        }
+        async with self.get_async_client().stream("POST", ip, json=payload) as resp:
+            resp.raise_for_status()
+            async for line in resp.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    break
+                chunk = json.loads(data)
+                if not chunk.get("choices"):
+                    continue
+                content = chunk["choices"][0].get("delta", {}).get("content")
+                if content:
+                    yield content
+
+    async def aclose(self):
+        if self.async_client is not None:
+            await self.async_client.aclose()
+            self.async_client = None
+        self.session.close()
+
@@ -1,8 +1,35 @@
+import os
+import time
+import asyncio
+import queue
+import sqlite3
 from http.client import HTTPException
+from concurrent.futures import ThreadPoolExecutor
 
 from mysql.connector import pooling, Error
 
 
+# 最近上下文：走 (user_id, session_id, id) 联合索引，按 id 倒序直接取前 10 条
+LAST_CHATS_SQL = """
+SELECT role, content FROM chat
+WHERE user_id = %s AND session_id = %s
+ORDER BY id DESC LIMIT 10
+"""
+
+LAST_PROMPT_SQL = """
+SELECT prompt FROM prompt
+WHERE user_id = %s AND session_id = %s
+ORDER BY id DESC LIMIT 1
+"""
+
+INSERT_PROMPT_SQL = """
+INSERT INTO prompt (user_id, session_id, prompt)
+VALUES (%s, %s, %s)
+"""
+
+DEFAULT_PROMPT = "你是个智能助手"
+
+
 class MySQLPool:
     def __init__(self, host="localhost", user="root", password="20031224", database="chat", pool_name="mysql_pool", pool_size=5):
         self.host = host
@@ -22,21 +49,18 @@ class MySQLPool:
 
     # -----------------------------
     def get_last_five_chats(self, user_id: str, session_id: str):
+        conn = None
+        cursor = None
         try:
             # 从连接池中获取一个连接
             conn = self.pool.get_connection()
-            cursor = conn.cursor(dictionary=True)
+            cursor = conn.cursor()
 
-            query = """
-            SELECT role, content FROM chat
-            WHERE user_id = %s AND session_id = %s
-            ORDER BY id DESC LIMIT 10
-            """
-            cursor.execute(query, (user_id, session_id))
+            cursor.execute(LAST_CHATS_SQL, (user_id, session_id))
             rows = cursor.fetchall()
 
             # 构造上下文消息列表
-            context = [{"role": row["role"], "content": row["content"]} for row in rows]
+            context = [{"role": role, "content": content} for role, content in rows]
 
             return context
 
@@ -51,21 +75,18 @@ class MySQLPool:
                 conn.close()  # 实际上是把连接放回连接池
 
     def get_propmt(self, user_id: str, session_id: str):
+        conn = None
+        cursor = None
         try:
             # 从连接池中获取一个连接
             conn = self.pool.get_connection()
-            cursor = conn.cursor(dictionary=True)
+            cursor = conn.cursor()
 
-            query = """
-            SELECT prompt FROM prompt
-            WHERE user_id = %s AND session_id = %s
-            ORDER BY id DESC LIMIT 1
-            """
-            cursor.execute(query, (user_id, session_id))
+            cursor.execute(LAST_PROMPT_SQL, (user_id, session_id))
             row = cursor.fetchone()
 
             # 构造上下文消息列表
-            prompt = row["prompt"] if row else "你是个智能助手"
+            prompt = row[0] if row else DEFAULT_PROMPT
 
             return prompt
 
@@ -79,16 +100,14 @@ class MySQLPool:
             if conn:
                 conn.close()  # 实际上是把连接放回连接池
     def add_propmt(self, user_id: str, session_id: str, prompt: str):
+        conn = None
+        cursor = None
         try:
             # 从连接池中获取一个连接
             conn = self.pool.get_connection()
             cursor = conn.cursor()
 
-            query = """
-            INSERT INTO prompt (user_id, session_id, prompt)
-            VALUES (%s, %s, %s)
-            """
-            cursor.execute(query, (user_id, session_id, prompt))
+            cursor.execute(INSERT_PROMPT_SQL, (user_id, session_id, prompt))
             conn.commit()
 
         except Error as e:
@@ -101,3 +120,183 @@ class MySQLPool:
             if conn:
                 conn.close()  # 实际上是把连接放回连接池
 
+
+class SQLitePool:
+    """
+    SQLite 替身，接口与 MySQLPool 相同，用于测试和本地运行。
+    sqlite3 会缓存编译好的语句，效果等同于预处理语句。
+    文件库打开 pool_size 个连接；:memory: 每个连接各是一个独立的库，只能共用一个连接。
+    """
+
+    def __init__(self, database=":memory:", pool_size=5):
+        self.database = database
+        self.pool_size = 1 if database == ":memory:" else pool_size
+        self.pool = queue.Queue()
+        for _ in range(self.pool_size):
+            conn = sqlite3.connect(database, check_same_thread=False, timeout=30)
+            if database != ":memory:":
+                # WAL 下读不被写阻塞
+                conn.execute("PRAGMA journal_mode=WAL")
+            self.pool.put(conn)
+        conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS chat (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                session_id INTEGER NOT NULL,
+                user_id INTEGER,
+                role TEXT,
+                content TEXT,
+                answer_id INTEGER,
+                deleted INTEGER DEFAULT 0
+            );
+            CREATE INDEX IF NOT EXISTS idx_user_session_id ON chat (user_id, session_id, id);
+            CREATE TABLE IF NOT EXISTS prompt (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER,
+                session_id INTEGER,
+                prompt TEXT
+            );
+            CREATE INDEX IF NOT EXISTS idx_prompt_user_session_id ON prompt (user_id, session_id, id);
+            """
+        )
+
+    def execute(self, sql, params, commit=False):
+        conn = self.pool.get()
+        try:
+            rows = conn.execute(sql.replace("%s", "?"), params).fetchall()
+            if commit:
+                conn.commit()
+            return rows
+        finally:
+            self.pool.put(conn)
+
+    def get_last_five_chats(self, user_id, session_id):
+        rows = self.execute(LAST_CHATS_SQL, (user_id, session_id))
+        return [{"role": role, "content": content} for role, content in rows]
+
+    def get_propmt(self, user_id, session_id):
+        rows = self.execute(LAST_PROMPT_SQL, (user_id, session_id))
+        return rows[0][0] if rows else DEFAULT_PROMPT
+
+    def add_propmt(self, user_id, session_id, prompt):
+        self.execute(INSERT_PROMPT_SQL, (user_id, session_id, prompt), commit=True)
+
+    def add_chat(self, user_id, session_id, role, content):
+        # 聊天记录由 java 端写入，这里只给测试用
+        self.execute(
+            "INSERT INTO chat (user_id, session_id, role, content) VALUES (%s, %s, %s, %s)",
+            (user_id, session_id, role, content),
+            commit=True,
+        )
+
+
+class AsyncChatStore:
+    """
+    聊天记录的异步仓库层。
+    阻塞的数据库调用放在与连接池同样大小的线程池里执行，不会卡住事件循环；
+    每个 (user, session) 最近的上下文和 prompt 在进程内缓存 cache_ttl 秒。
+    聊天记录由 java 端在拿到回答后写入：回答结束时 mark_pending_write，java 端写完后 confirm_write；
+    等待写入期间该会话不走缓存，java 端没有确认时 pending_write_ttl 秒后恢复缓存。
+    """
+
+    def __init__(self, store, max_workers=None, cache_ttl=None, max_cache_entries=10000, pending_write_ttl=None):
+        self.store = store
+        self.max_cache_entries = max_cache_entries
+        self.max_workers = max_workers or getattr(store, "pool_size", 5)
+        self.cache_ttl = float(os.getenv("CHAT_CACHE_TTL", 2)) if cache_ttl is None else cache_ttl
+        self.pending_write_ttl = (
+            float(os.getenv("CHAT_PENDING_WRITE_TTL", 30)) if pending_write_ttl is None else pending_write_ttl
+        )
+        self.executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="chat_store")
+        self.chat_cache = {}
+        self.prompt_cache = {}
+        self.pending_writes = {}  # (user, session) -> 等待 java 端写入的截止时间
+        self.generations = {}  # (user, session) -> 失效次数，查库期间失效过的结果不放进缓存
+        self.hits = 0
+        self.misses = 0
+
+    async def run(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, func, *args)
+
+    def cache_get(self, cache, key):
+        item = cache.get(key)
+        if item is not None and item[0] > time.monotonic():
+            self.hits += 1
+            return item[1]
+        self.misses += 1
+        return None
+
+    def cache_put(self, cache, key, value):
+        if self.cache_ttl <= 0:
+            return
+        now = time.monotonic()
+        if len(cache) >= self.max_cache_entries:
+            # 清掉过期的条目，防止会话很多时缓存无限增长
+            for k in [k for k, item in cache.items() if item[0] <= now]:
+                del cache[k]
+            if len(cache) >= self.max_cache_entries:
+                cache.clear()
+        cache[key] = (now + self.cache_ttl, value)
+
+    def write_pending(self, key):
+        deadline = self.pending_writes.get(key)
+        if deadline is None:
+            return False
+        if deadline <= time.monotonic():
+            del self.pending_writes[key]
+            return False
+        return True
+
+    async def get_last_five_chats(self, user_id, session_id):
+        key = (user_id, session_id)
+        context = None if self.write_pending(key) else self.cache_get(self.chat_cache, key)
+        if context is None:
+            generation = self.generations.get(key, 0)
+            context = await self.run(self.store.get_last_five_chats, user_id, session_id)
+            if generation == self.generations.get(key, 0) and not self.write_pending(key):
+                self.cache_put(self.chat_cache, key, context)
+        # 调用方会往列表里插入消息，返回副本
+        return list(context)
+
+    async def get_propmt(self, user_id, session_id):
+        key = (user_id, session_id)
+        prompt = self.cache_get(self.prompt_cache, key)
+        if prompt is None:
+            prompt = await self.run(self.store.get_propmt, user_id, session_id)
+            self.cache_put(self.prompt_cache, key, prompt)
+        return prompt
+
+    async def add_propmt(self, user_id, session_id, prompt):
+        await self.run(self.store.add_propmt, user_id, session_id, prompt)
+        self.invalidate(user_id, session_id)
+
+    def invalidate(self, user_id, session_id):
+        # 写入后清掉该会话的缓存，下次读取直接查库
+        key = (user_id, session_id)
+        self.generations[key] = self.generations.get(key, 0) + 1
+        self.chat_cache.pop(key, None)
+        self.prompt_cache.pop(key, None)
+
+    def mark_pending_write(self, user_id, session_id):
+        # 回答已返回、java 端还没写库：在确认写入（或超时）之前读上下文都直接查库
+        self.pending_writes[(user_id, session_id)] = time.monotonic() + self.pending_write_ttl
+        self.invalidate(user_id, session_id)
+
+    def confirm_write(self, user_id, session_id):
+        self.pending_writes.pop((user_id, session_id), None)
+        self.invalidate(user_id, session_id)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "chat_entries": len(self.chat_cache),
+            "prompt_entries": len(self.prompt_cache),
+            "pending_writes": len(self.pending_writes),
+        }
+
+    def close(self):
+        self.executor.shutdown(wait=False)
@@ -0,0 +1,9 @@
+import os
+import sys
+
+# gPT_SoVITS 的模块以 gPT_SoVITS 目录为工作目录互相导入（module.xxx、AR.xxx），部分又以 gPT_SoVITS.xxx 导入
+PYTHON_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SOVITS_DIR = os.path.join(PYTHON_DIR, "gPT_SoVITS")
+for path in [SOVITS_DIR, os.path.join(SOVITS_DIR, "eres2net"), PYTHON_DIR]:
+    if path not in sys.path:
+        sys.path.append(path)
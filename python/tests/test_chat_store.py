@@ -0,0 +1,91 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("mysql.connector")
+
+from python.mysql import DEFAULT_PROMPT, AsyncChatStore, SQLitePool
+
+
+def test_last_chats_newest_first():
+    store = SQLitePool()
+    for i in range(12):
+        store.add_chat(1, 1, "user", "q%d" % i)
+    store.add_chat(1, 2, "user", "other session")
+
+    context = store.get_last_five_chats(1, 1)
+    assert [item["content"] for item in context] == ["q%d" % i for i in range(11, 1, -1)]
+
+
+def test_pool_size(tmp_path):
+    assert SQLitePool().pool_size == 1
+    store = SQLitePool(str(tmp_path / "chat.db"), pool_size=3)
+    assert store.pool_size == 3
+    assert store.pool.qsize() == 3
+    store.add_propmt(1, 1, "p")
+    assert store.get_propmt(1, 1) == "p"
+
+
+def test_cache_and_invalidate():
+    async def main():
+        sqlite = SQLitePool()
+        db = AsyncChatStore(sqlite, cache_ttl=60)
+        try:
+            sqlite.add_chat(1, 1, "user", "a")
+            assert await db.get_last_five_chats(1, 1) == [{"role": "user", "content": "a"}]
+
+            # 缓存期内读到的是旧上下文，invalidate 之后重新查库
+            sqlite.add_chat(1, 1, "assistant", "b")
+            assert len(await db.get_last_five_chats(1, 1)) == 1
+            db.invalidate(1, 1)
+            assert len(await db.get_last_five_chats(1, 1)) == 2
+
+            assert await db.get_propmt(1, 1) == DEFAULT_PROMPT
+            await db.add_propmt(1, 1, "new prompt")
+            assert await db.get_propmt(1, 1) == "new prompt"
+            assert db.stats()["hits"] == 1
+        finally:
+            db.close()
+
+    asyncio.run(main())
+
+
+def test_no_cache_while_write_pending():
+    async def main():
+        sqlite = SQLitePool()
+        db = AsyncChatStore(sqlite, cache_ttl=60, pending_write_ttl=60)
+        try:
+            sqlite.add_chat(1, 1, "user", "a")
+            assert len(await db.get_last_five_chats(1, 1)) == 1
+
+            # 回答结束、java 端还没写库：期间读到的上下文不进缓存
+            db.mark_pending_write(1, 1)
+            assert len(await db.get_last_five_chats(1, 1)) == 1
+            sqlite.add_chat(1, 1, "assistant", "b")
+            assert len(await db.get_last_five_chats(1, 1)) == 2
+
+            # 确认写入后重新缓存
+            db.confirm_write(1, 1)
+            assert len(await db.get_last_five_chats(1, 1)) == 2
+            sqlite.add_chat(1, 1, "user", "c")
+            assert len(await db.get_last_five_chats(1, 1)) == 2
+            assert db.stats()["pending_writes"] == 0
+        finally:
+            db.close()
+
+    asyncio.run(main())
+
+
+def test_pending_write_expires():
+    async def main():
+        sqlite = SQLitePool()
+        db = AsyncChatStore(sqlite, cache_ttl=60, pending_write_ttl=0)
+        try:
+            db.mark_pending_write(1, 1)
+            assert await db.get_last_five_chats(1, 1) == []
+            sqlite.add_chat(1, 1, "user", "a")
+            assert await db.get_last_five_chats(1, 1) == []
+        finally:
+            db.close()
+
+    asyncio.run(main())
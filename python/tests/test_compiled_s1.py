@@ -0,0 +1,82 @@
+import os
+
+import pytest
+
+torch = pytest.importorskip("torch")
+np = pytest.importorskip("numpy")
+pytest.importorskip("pandas")
+dataset_module = pytest.importorskip("AR.data.dataset")
+
+PHONES = ["n", "i2", "h", "ao3", "a1", "ai4"]
+
+
+def make_exp_dir(root):
+    ### (名字, 音素数, semantic token 数, 有没有bert)；max_sec=4 时 25hz 下最多 100 个 token
+    items = [
+        ("ok0.wav", 4, 30, True),
+        ("ok1.wav", 6, 50, True),
+        ("no_bert.wav", 5, 40, False),
+        ("too_long.wav", 6, 120, True),
+        ("bad_ps.wav", 2, 90, True),
+        ("missing.wav", 0, 20, True),
+    ]
+    os.makedirs("%s/3-bert" % root)
+    rng = np.random.default_rng(0)
+    text_lines = []
+    semantic_lines = ["item_name\tsemantic_audio"]
+    for name, n_phones, n_semantic, has_bert in items:
+        semantic_lines.append("%s\t%s" % (name, " ".join(str(t) for t in rng.integers(0, 1024, n_semantic))))
+        if n_phones == 0:
+            continue
+        phones = [PHONES[i % len(PHONES)] for i in range(n_phones)]
+        text_lines.append("%s\t%s\t[]\tnorm" % (name, " ".join(phones)))
+        if has_bert:
+            ### 编译格式里 bert 存 fp16，这里先取整到 fp16 才能逐位比较
+            bert = torch.from_numpy(rng.standard_normal((1024, n_phones))).half().float()
+            torch.save(bert, "%s/3-bert/%s.pt" % (root, name))
+    with open("%s/2-name2text.txt" % root, "w", encoding="utf8") as f:
+        f.write("\n".join(text_lines))
+    with open("%s/6-name2semantic.tsv" % root, "w", encoding="utf8") as f:
+        f.write("\n".join(semantic_lines))
+    return "%s/2-name2text.txt" % root, "%s/6-name2semantic.tsv" % root
+
+
+def test_compiled_matches_tsv(tmp_path):
+    phoneme_path, semantic_path = make_exp_dir(str(tmp_path))
+    tsv = dataset_module.Text2SemanticDataset(phoneme_path, semantic_path, max_sec=4)
+    assert tsv.compiled is None
+
+    meta = dataset_module.compile_s1_dataset(phoneme_path, semantic_path)
+    assert meta["count"] == 5 and meta["num_not_in"] == 1
+    compiled = dataset_module.Text2SemanticDataset(phoneme_path, semantic_path, max_sec=4)
+    assert compiled.compiled is not None
+
+    ### 过滤后剩 3 条，不足 100 条时两条路径都重复 int(100 / 3) 遍
+    assert sorted(set(tsv.item_names)) == ["no_bert.wav", "ok0.wav", "ok1.wav"]
+    assert len(tsv) == len(compiled) == 3 * 33
+    assert compiled.item_names == tsv.item_names
+    for idx in range(len(tsv)):
+        a = tsv[idx]
+        b = compiled[idx]
+        assert list(a["phoneme_ids"]) == list(b["phoneme_ids"])
+        assert list(a["semantic_ids"]) == list(b["semantic_ids"])
+        assert a["semantic_ids_len"] == b["semantic_ids_len"]
+        assert tsv.get_sample_length(idx) == compiled.get_sample_length(idx)
+        if a["bert_feature"] is None:
+            assert b["bert_feature"] is None
+        else:
+            assert torch.equal(a["bert_feature"], b["bert_feature"].float())
+
+    batch_a = tsv.collate([tsv[i] for i in range(3)])
+    batch_b = compiled.collate([compiled[i] for i in range(3)])
+    for key in ["phoneme_ids", "phoneme_ids_len", "semantic_ids", "semantic_ids_len", "bert_feature"]:
+        assert torch.equal(batch_a[key], batch_b[key]), key
+
+
+def test_stale_compiled_is_ignored(tmp_path):
+    phoneme_path, semantic_path = make_exp_dir(str(tmp_path))
+    dataset_module.compile_s1_dataset(phoneme_path, semantic_path)
+    with open(semantic_path, "a", encoding="utf8") as f:
+        f.write("\nextra.wav\t1 2 3")
+    os.utime(semantic_path, (0, 0))
+    assert dataset_module.Text2SemanticDataset(phoneme_path, semantic_path, max_sec=4).compiled is None
@@ -0,0 +1,86 @@
+import os
+import pickle
+
+import pytest
+
+torch = pytest.importorskip("torch")
+feature_store = pytest.importorskip("tools.feature_store")
+
+FeatureStore = feature_store.FeatureStore
+length_buckets = feature_store.length_buckets
+
+
+def test_append_and_read(tmp_path):
+    root = str(tmp_path / "4-cnhubert")
+    assert FeatureStore.open_if_exists(root) is None
+    a = torch.randn(1, 768, 13)
+    b = torch.arange(7)
+    c = torch.randn(5, 3).half()
+    with FeatureStore(root, part=0) as store:
+        store.add("a.wav", a)
+        store.add("b.wav", b)
+        store.flush()
+        store.add("c.wav", c)
+    with FeatureStore(root, part=1) as store:
+        store.add("d.wav", torch.tensor(3.5))
+        store.add("a.wav", a * 2)  # 同名条目以最后写入的为准
+
+    store = FeatureStore.open_if_exists(root)
+    assert sorted(store.names()) == ["a.wav", "b.wav", "c.wav", "d.wav"]
+    assert store.shape("a.wav") == (1, 768, 13)
+    assert torch.equal(store.get("a.wav"), a * 2)
+    assert torch.equal(store.get("b.wav"), b)
+    assert store.get("c.wav").dtype == torch.float16 and torch.equal(store.get("c.wav"), c)
+    assert store.get("d.wav").item() == 3.5
+
+    ### 只读的库可以pickle给DataLoader的worker，memmap在worker里重新打开
+    copy = pickle.loads(pickle.dumps(store))
+    assert copy.maps == {}
+    assert torch.equal(copy.get("b.wav"), b)
+    with pytest.raises(AssertionError):
+        pickle.dumps(FeatureStore(root, part=2))
+
+
+def test_repair_after_interrupted_write(tmp_path):
+    root = str(tmp_path)
+    a = torch.randn(4, 6)
+    with FeatureStore(root, part=0) as store:
+        store.add("a.wav", a)
+    data_size = os.path.getsize("%s/feats-0.bin" % root)
+
+    ### 模拟中断：数据写了但index没写完（最后一行没有换行）
+    with open("%s/feats-0.bin" % root, "ab") as f:
+        f.write(b"\0" * 100)
+    with open("%s/feats-0.idx" % root, "a", encoding="utf8") as f:
+        f.write("b.wav\t%d\tfloat32\t5," % data_size)
+
+    ### 只读打开不修改文件，写了一半的条目不可见
+    reader = FeatureStore(root)
+    assert reader.names() == ["a.wav"]
+    assert os.path.getsize("%s/feats-0.bin" % root) == data_size + 100
+
+    ### 同一段以写入方式重新打开时截掉多余数据和半行index，之后继续追加
+    b = torch.randn(5, 5)
+    with FeatureStore(root, part=0) as store:
+        assert store.names() == ["a.wav"]
+        assert os.path.getsize("%s/feats-0.bin" % root) == data_size
+        store.add("b.wav", b)
+    with open("%s/feats-0.idx" % root, "r", encoding="utf8") as f:
+        assert len(f.read().splitlines()) == 2
+    store = FeatureStore(root)
+    assert torch.equal(store.get("a.wav"), a)
+    assert torch.equal(store.get("b.wav"), b)
+
+
+def test_length_buckets():
+    lengths = [50, 10, 300, 20, 20, 90, 400, 15, 60, 5]
+    batches = length_buckets(lengths, max_batch=3, max_total=200)
+    assert sorted(i for batch in batches for i in batch) == list(range(len(lengths)))
+    flat = [lengths[i] for batch in batches for i in batch]
+    assert flat == sorted(lengths)
+    for batch in batches:
+        assert len(batch) <= 3
+        ### 单条超过max_total时自成一批
+        assert len(batch) == 1 or max(lengths[i] for i in batch) * len(batch) <= 200
+    assert [len(batch) for batch in batches] == [3, 3, 2, 1, 1]
+    assert length_buckets([], 4, 100) == []
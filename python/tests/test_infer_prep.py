@@ -0,0 +1,57 @@
+import pytest
+
+torch = pytest.importorskip("torch")
+models = pytest.importorskip("module.models")
+
+from module.infer_prep import check_equivalence, copy_model, fold_weight_norm, prepare_for_inference
+
+
+def small_sovits(version="v2"):
+    torch.manual_seed(0)
+    model = models.SynthesizerTrn(
+        1025,
+        20,
+        inter_channels=192,
+        hidden_channels=192,
+        filter_channels=64,
+        n_heads=2,
+        n_layers=1,
+        kernel_size=3,
+        p_dropout=0.1,
+        resblock="1",
+        resblock_kernel_sizes=[3],
+        resblock_dilation_sizes=[[1, 3, 5]],
+        upsample_rates=[4, 4],
+        upsample_initial_channel=32,
+        upsample_kernel_sizes=[8, 8],
+        gin_channels=512,
+        semantic_frame_rate="25hz",
+        freeze_quantizer=True,
+        version=version,
+    )
+    return model.eval()
+
+
+def test_fold_generator_weight_norm():
+    torch.manual_seed(0)
+    dec = models.Generator(16, "1", [3], [[1, 3, 5]], [4, 4], 32, [8, 8], gin_channels=16).eval()
+    x = torch.randn(1, 16, 12)
+    g = torch.randn(1, 16, 1)
+    with torch.no_grad():
+        expected = dec(x, g=g)
+    folded = fold_weight_norm(dec)
+    with torch.no_grad():
+        actual = dec(x, g=g)
+    assert folded > 0
+    assert not any(len(module._forward_pre_hooks) for module in dec.modules())
+    assert torch.allclose(expected, actual, atol=1e-5)
+
+
+def test_prepare_matches_unprepared():
+    model = small_sovits()
+    reference = copy_model(model)
+    prepared = prepare_for_inference(model, verify=True)
+    assert prepared is model
+    assert not hasattr(prepared, "enc_q")
+    ok, max_err, rel_err = check_equivalence(reference, prepared)
+    assert ok, (max_err, rel_err)
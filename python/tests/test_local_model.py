@@ -0,0 +1,63 @@
+import asyncio
+import json
+
+import pytest
+
+httpx = pytest.importorskip("httpx")
+local_model = pytest.importorskip("python.local_model")
+
+URL = "http://llm.test/v1/chat/completions"
+
+
+def sse(*chunks):
+    lines = [": keep-alive"]
+    for chunk in chunks:
+        lines.append("data: " + (chunk if isinstance(chunk, str) else json.dumps(chunk)))
+        lines.append("")
+    return ("\n".join(lines) + "\n").encode("utf-8")
+
+
+def delta(content):
+    return {"choices": [{"delta": {"content": content}}]}
+
+
+def make_model(handler):
+    model = local_model.LocalModel(None, "cpu")
+    model.async_client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return model
+
+
+async def collect(model):
+    try:
+        return [content async for content in model.stream_qwe3(URL, [{"role": "user", "content": "hi"}])]
+    finally:
+        await model.aclose()
+
+
+def test_stream_chunk_order():
+    requests = []
+
+    def handler(request):
+        requests.append(json.loads(request.content))
+        body = sse(delta("你"), {"choices": []}, delta(""), delta("好"), delta("！"), "[DONE]", delta("after done"))
+        return httpx.Response(200, content=body, headers={"content-type": "text/event-stream"})
+
+    assert asyncio.run(collect(make_model(handler))) == ["你", "好", "！"]
+    assert requests[0]["stream"] is True
+    assert requests[0]["messages"] == [{"role": "user", "content": "hi"}]
+
+
+def test_stream_http_error():
+    def handler(request):
+        return httpx.Response(500, content=b"upstream failed")
+
+    with pytest.raises(httpx.HTTPStatusError):
+        asyncio.run(collect(make_model(handler)))
+
+
+def test_stream_bad_chunk():
+    def handler(request):
+        return httpx.Response(200, content=sse(delta("a"), "{not json"))
+
+    with pytest.raises(json.JSONDecodeError):
+        asyncio.run(collect(make_model(handler)))
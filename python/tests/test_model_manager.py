@@ -0,0 +1,94 @@
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("torch")
+pytest.importorskip("soundfile")
+tts_model = pytest.importorskip("TTSModel")
+
+
+class FakeModel:
+    loads = []
+    active = 0
+    max_active = 0
+    lock = threading.Lock()
+
+    def __init__(self, version, gpt_path, sovits_path):
+        with FakeModel.lock:
+            FakeModel.loads.append(gpt_path)
+            FakeModel.active += 1
+            FakeModel.max_active = max(FakeModel.max_active, FakeModel.active)
+        time.sleep(0.3)
+        with FakeModel.lock:
+            FakeModel.active -= 1
+        self.gpt_path = gpt_path
+        self.released = False
+
+    def voice_bytes(self):
+        return 1
+
+    def release(self):
+        self.released = True
+
+
+@pytest.fixture
+def manager(monkeypatch):
+    monkeypatch.setattr(tts_model, "TTSModel", FakeModel)
+    FakeModel.loads, FakeModel.active, FakeModel.max_active = [], 0, 0
+    manager = tts_model.ModelManager(memory_budget_mb=1)
+    manager.register("a", "v2", "a.ckpt", "a.pth")
+    manager.register("b", "v2", "b.ckpt", "b.pth")
+    return manager
+
+
+def run_threads(targets):
+    results = [None] * len(targets)
+
+    def call(i, target):
+        results[i] = target()
+
+    threads = [threading.Thread(target=call, args=(i, target)) for i, target in enumerate(targets)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def test_load_outside_lock(manager):
+    # 加载 a 时 b 可以并行加载，已加载的角色不受影响；同名并发请求只加载一次
+    results = run_threads([lambda: manager.get("a"), lambda: manager.get("a"), lambda: manager.get("b")])
+    assert FakeModel.max_active == 2
+    assert sorted(FakeModel.loads) == ["a.ckpt", "b.ckpt"]
+    assert results[0] is results[1]
+    with manager.lock:
+        assert manager.loading == {}
+
+
+def test_reregister_while_loading(manager):
+    thread = threading.Thread(target=lambda: manager.get("a"))
+    thread.start()
+    time.sleep(0.1)
+    manager.register("a", "v2", "a2.ckpt", "a2.pth")
+    thread.join()
+    assert manager.get("a").gpt_path == "a2.ckpt"
+    assert FakeModel.loads == ["a.ckpt", "a2.ckpt"]
+
+
+def test_failed_load_wakes_waiters(manager, monkeypatch):
+    def broken(*args):
+        time.sleep(0.2)
+        raise RuntimeError("bad weights")
+
+    monkeypatch.setattr(tts_model, "TTSModel", broken)
+
+    def get():
+        try:
+            manager.get("a")
+        except RuntimeError as e:
+            return str(e)
+
+    assert run_threads([get, get]) == ["bad weights", "bad weights"]
+    with manager.lock:
+        assert manager.loading == {}
@@ -0,0 +1,139 @@
+import os
+
+import pytest
+
+torch = pytest.importorskip("torch")
+pytest.importorskip("onnx")
+pytest.importorskip("onnxruntime")
+t2s_model_onnx = pytest.importorskip("AR.models.t2s_model_onnx")
+
+from TTS_infer_pack.OnnxBackend import OnnxBackend
+
+### patched_mha_with_cache_onnx 里 KV cache 的占位写死了 512 维
+CONFIG = {
+    "model": {
+        "hidden_dim": 512,
+        "embedding_dim": 512,
+        "head": 4,
+        "n_layer": 2,
+        "vocab_size": 50,
+        "phoneme_vocab_size": 20,
+        "dropout": 0.0,
+        "EOS": 49,
+    }
+}
+
+
+class Encoder(torch.nn.Module):
+    """与 onnx_export.T2SEncoder 同样的输入输出，参考的 semantic 不经过 vits，直接给占位输出"""
+
+    def __init__(self, encoder):
+        super().__init__()
+        self.encoder = encoder
+
+    def forward(self, ref_seq, text_seq, ref_bert, text_bert, ssl_content):
+        bert = torch.cat([ref_bert.transpose(0, 1), text_bert.transpose(0, 1)], 1).unsqueeze(0)
+        return self.encoder(torch.cat([ref_seq, text_seq], 1), bert), ssl_content.mean()
+
+
+def export(model, onnx_dir, name):
+    os.makedirs(onnx_dir)
+    g = torch.Generator().manual_seed(0)
+    ref_seq = torch.randint(0, 20, (1, 3), generator=g)
+    text_seq = torch.randint(0, 20, (1, 5), generator=g)
+    ref_bert = torch.randn(3, 1024, generator=g)
+    text_bert = torch.randn(5, 1024, generator=g)
+    ssl_content = torch.randn(1, 768, 2, generator=g)
+    encoder = Encoder(model.onnx_encoder)
+    torch.onnx.export(
+        encoder,
+        (ref_seq, text_seq, ref_bert, text_bert, ssl_content),
+        os.path.join(onnx_dir, "%s_t2s_encoder.onnx" % name),
+        input_names=["ref_seq", "text_seq", "ref_bert", "text_bert", "ssl_content"],
+        output_names=["x", "prompts"],
+        dynamic_axes={
+            "ref_seq": {1: "ref_length"},
+            "text_seq": {1: "text_length"},
+            "ref_bert": {0: "ref_length"},
+            "text_bert": {0: "text_length"},
+            "ssl_content": {2: "ssl_length"},
+        },
+        opset_version=16,
+        dynamo=False,
+    )
+    x, _ = encoder(ref_seq, text_seq, ref_bert, text_bert, ssl_content)
+    prompts = torch.randint(0, 49, (1, 4), generator=g)
+    torch.onnx.export(
+        model.first_stage_decoder,
+        (x, prompts),
+        os.path.join(onnx_dir, "%s_t2s_fsdec.onnx" % name),
+        input_names=["x", "prompts"],
+        output_names=["y", "k", "v", "y_emb", "x_example"],
+        dynamic_axes={"x": {1: "x_length"}, "prompts": {1: "prompts_length"}},
+        opset_version=16,
+        dynamo=False,
+    )
+    y, k, v, y_emb, x_example = model.first_stage_decoder(x, prompts)
+    torch.onnx.export(
+        model.stage_decoder,
+        (y, k, v, y_emb, x_example),
+        os.path.join(onnx_dir, "%s_t2s_sdec.onnx" % name),
+        input_names=["iy", "ik", "iv", "iy_emb", "ix_example"],
+        output_names=["y", "k", "v", "y_emb", "logits", "samples"],
+        dynamic_axes={
+            "iy": {1: "iy_length"},
+            "ik": {1: "ik_length"},
+            "iv": {1: "iv_length"},
+            "iy_emb": {1: "iy_emb_length"},
+            "ix_example": {1: "ix_example_length"},
+        },
+        opset_version=16,
+        dynamo=False,
+    )
+
+
+def torch_logits(model, phones, prompt, bert, y):
+    ### 沿 ONNX 解码出的 y 逐步跑 torch 的 stage decoder（每步传入整段 y），返回每步的 logits
+    x = model.onnx_encoder(phones.unsqueeze(0), bert.unsqueeze(0))
+    _, k, v, y_emb, x_example = model.first_stage_decoder(x, prompt.unsqueeze(0))
+    logits_list = []
+    for end in range(prompt.shape[0] + 1, y.shape[0] + 1):
+        _, k, v, y_emb, logits, _ = model.stage_decoder(y[:end].unsqueeze(0), k, v, y_emb, x_example)
+        logits_list.append(logits)
+    return logits_list
+
+
+def test_matches_torch_decoder(tmp_path):
+    torch.manual_seed(0)
+    model = t2s_model_onnx.Text2SemanticDecoder(CONFIG)
+    model.init_onnx()
+    onnx_dir = str(tmp_path / "tiny")
+    with torch.no_grad():
+        export(model, onnx_dir, "tiny")
+    ### init_onnx 新建的包装模块是训练模式，导出结束时会把共享的子模块也恢复成训练模式（dropout）
+    model.eval()
+    backend = OnnxBackend(onnx_dir, torch.device("cpu"), eos=CONFIG["model"]["EOS"])
+
+    steps = []
+    run = backend.stage_decoder.run
+
+    def record_stage(inputs):
+        outputs = run(inputs)
+        steps.append((inputs["iy"].shape[1], torch.from_numpy(outputs[4].numpy()).float()))
+        return outputs
+
+    backend.stage_decoder.run = record_stage
+
+    g = torch.Generator().manual_seed(1)
+    for x_len, prompt_len in [(6, 4), (11, 7)]:
+        phones = torch.randint(0, 20, (x_len,), generator=g)
+        bert = torch.randn(1024, x_len, generator=g)
+        prompt = torch.randint(0, 49, (prompt_len,), generator=g)
+        steps.clear()
+        with torch.no_grad():
+            y, idx = backend.infer_one(phones, prompt, bert, 1, 1, 30, 1.0, 1.35)
+            expected = torch_logits(model, phones, prompt, bert, y)
+        assert idx == len(steps) > 1
+        assert all(width == 2 for width, _ in steps)  # 每步只传最后两个 token
+        for step, ((_, logits), logits0) in enumerate(zip(steps, expected)):
+            assert torch.allclose(logits, logits0, atol=1e-4), step
@@ -0,0 +1,79 @@
+import os
+from types import SimpleNamespace
+
+import pytest
+
+torch = pytest.importorskip("torch")
+np = pytest.importorskip("numpy")
+soundfile = pytest.importorskip("soundfile")
+data_utils = pytest.importorskip("module.data_utils")
+
+HPARAMS = {"sampling_rate": 32000, "filter_length": 2048, "hop_length": 640, "win_length": 2048, "max_wav_value": 32768.0}
+PHONES = ["n", "i2", "h", "ao3", "a1", "ai4"]
+
+
+def make_exp_dir(root, count=4):
+    os.makedirs("%s/4-cnhubert" % root)
+    os.makedirs("%s/5-wav32k" % root)
+    rng = np.random.default_rng(0)
+    lines = []
+    for i in range(count):
+        name = "utt%d.wav" % i
+        seconds = 1 + 0.5 * i
+        audio = (rng.standard_normal(int(seconds * 32000)) * 3000).astype(np.int16)
+        soundfile.write("%s/5-wav32k/%s" % (root, name), audio, 32000)
+        frames = len(audio) // 640
+        torch.save(torch.randn(1, 768, frames), "%s/4-cnhubert/%s.pt" % (root, name))
+        lines.append("%s\t%s\t[]\tnorm" % (name, " ".join(PHONES[: 2 + i])))
+    with open("%s/2-name2text.txt" % root, "w", encoding="utf8") as f:
+        f.write("\n".join(lines))
+
+
+def loader(root):
+    return data_utils.TextAudioSpeakerLoader(SimpleNamespace(exp_dir=str(root), **HPARAMS), version="v2")
+
+
+def by_name(dataset, names):
+    items = {}
+    for i, (key, _) in enumerate(dataset.audiopaths_sid_text):
+        items.setdefault(names(key), dataset[i])
+    return items
+
+
+def test_pack_then_load(tmp_path):
+    make_exp_dir(tmp_path)
+    plain = loader(tmp_path)
+    assert plain.packed is None
+
+    meta = data_utils.pack_s2_dataset(str(tmp_path), HPARAMS, version="v2", shard_size=3)
+    assert [shard["count"] for shard in meta["shards"]] == [3, 1]
+    packed = loader(tmp_path)
+    assert packed.packed is not None
+    assert len(packed) == len(plain)
+
+    shard_names = []
+    for shard in meta["shards"]:
+        with open("%s/%s/%s/names.txt" % (tmp_path, data_utils.PACKED_S2_DIR, shard["dir"]), encoding="utf8") as f:
+            shard_names.append(f.read().split("\n"))
+    expected = by_name(plain, lambda name: name)
+    actual = by_name(packed, lambda key: shard_names[key[0]][key[1]])
+    assert expected.keys() == actual.keys()
+    for name, (ssl, spec, wav, text) in actual.items():
+        ssl0, spec0, wav0, text0 = expected[name]
+        assert torch.equal(text, text0)
+        assert torch.allclose(wav, wav0, atol=1e-4)
+        assert torch.allclose(spec, spec0, atol=1e-3)
+        assert torch.allclose(ssl.float(), ssl0, atol=1e-2)
+
+
+def test_stale_pack_is_ignored(tmp_path):
+    make_exp_dir(tmp_path)
+    data_utils.pack_s2_dataset(str(tmp_path), HPARAMS, version="v2")
+    packed_dir = "%s/%s" % (tmp_path, data_utils.PACKED_S2_DIR)
+    assert data_utils.PackedS2Shards.is_fresh(packed_dir, str(tmp_path), "v2")
+    assert not data_utils.PackedS2Shards.is_fresh(packed_dir, str(tmp_path), "v1")
+
+    with open("%s/2-name2text.txt" % tmp_path, "a", encoding="utf8") as f:
+        f.write("\nextra.wav\tn a1\t[]\tnorm")
+    assert not data_utils.PackedS2Shards.is_fresh(packed_dir, str(tmp_path), "v2")
+    assert loader(tmp_path).packed is None
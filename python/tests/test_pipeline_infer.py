@@ -0,0 +1,82 @@
+from types import SimpleNamespace
+
+import pytest
+
+torch = pytest.importorskip("torch")
+t2s_model = pytest.importorskip("AR.models.t2s_model")
+models = pytest.importorskip("module.models")
+tts_module = pytest.importorskip("TTS_infer_pack.TTS")
+
+CONFIG = {
+    "model": {
+        "hidden_dim": 32,
+        "embedding_dim": 32,
+        "head": 2,
+        "n_layer": 2,
+        "vocab_size": 50,
+        "phoneme_vocab_size": 20,
+        "dropout": 0.0,
+        "EOS": 49,
+    }
+}
+
+
+def make_tts():
+    tts = object.__new__(tts_module.TTS)
+    tts.configs = SimpleNamespace(device=torch.device("cpu"))
+    tts.stop_flag = False
+    return tts
+
+
+def make_batches(count=4):
+    g = torch.Generator().manual_seed(0)
+    batches = []
+    for i in range(count):
+        x_len = 5 + 2 * i
+        batches.append(
+            {
+                "x": torch.randint(0, 20, (1, x_len), generator=g),
+                "bert": torch.randn(1, 1024, x_len, generator=g),
+                "prompt": torch.randint(0, 49, (1, 4), generator=g),
+            }
+        )
+    return batches
+
+
+def synthesize(pipeline_infer):
+    ### 与 TTS.run 相同的分工：T2S 采样在 stage 里（开启流水线时在后台线程），声码器在调用方
+    torch.manual_seed(0)
+    decoder = t2s_model.Text2SemanticDecoder(CONFIG).eval()
+    embedding = torch.nn.Embedding(50, 16)
+    vocoder = models.Generator(16, "1", [3], [[1, 3, 5]], [4, 4], 32, [8, 8]).eval()
+
+    def decode_semantic(batch):
+        y, idx = decoder.infer_panel_naive(
+            batch["x"],
+            torch.LongTensor([batch["x"].shape[1]]),
+            batch["prompt"],
+            batch["bert"],
+            top_k=5,
+            temperature=1.0,
+            early_stop_num=20,
+        )
+        return y[:, -idx:] if idx > 0 else y[:, :0]
+
+    torch.manual_seed(1234)
+    audio = []
+    with torch.no_grad():
+        for semantic in make_tts().pipelined(decode_semantic, make_batches(), pipeline_infer, 1):
+            if semantic.shape[1] == 0:
+                audio.append(torch.zeros(0))
+                continue
+            audio.append(vocoder(embedding(semantic).transpose(1, 2))[0, 0])
+    return audio
+
+
+def test_pipelined_matches_serial():
+    serial = synthesize(False)
+    pipelined = synthesize(True)
+    assert len(serial) == len(pipelined) == 4
+    assert any(a.numel() > 0 for a in serial)
+    for a, b in zip(serial, pipelined):
+        assert torch.equal(a, b)
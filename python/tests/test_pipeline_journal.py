@@ -0,0 +1,48 @@
+import json
+import os
+from types import SimpleNamespace
+
+import pytest
+
+pipeline = pytest.importorskip("prepare_datasets.pipeline")
+
+
+def make_args(root, stages):
+    with open("%s/list.txt" % root, "w", encoding="utf8") as f:
+        f.write("a.wav|spk|zh|你好\nb.wav|spk|zh|再见\n")
+    return SimpleNamespace(inp_text="%s/list.txt" % root, inp_wav_dir="", opt_dir=str(root), stages=stages)
+
+
+def write_journal(root, rank, records):
+    os.makedirs("%s/.pipeline" % root, exist_ok=True)
+    journal = pipeline.Journal("%s/.pipeline/worker-%d.jsonl" % (root, rank))
+    journal.write(records)
+    journal.close()
+
+
+def test_stages_merge_across_runs(tmp_path):
+    # 先跑 --stages text（两个worker），再用一个worker跑 --stages hubert,semantic
+    write_journal(tmp_path, 0, [{"name": "a.wav", "stages": ["text"], "text_line": "a.wav\tn i2\t[1]\t你好"}])
+    write_journal(tmp_path, 1, [{"name": "b.wav", "stages": ["text"], "text_line": "b.wav\tz ai4\t[1]\t再见"}])
+    with open("%s/.pipeline/worker-0.jsonl" % tmp_path, "a", encoding="utf8") as f:
+        f.write('{"name": "b.wav", "sta')  # 中断时写了一半的行
+    write_journal(tmp_path, 0, [{"name": "a.wav", "stages": ["hubert", "semantic"], "semantic": "1 2 3"}])
+
+    done = pipeline.load_journals(str(tmp_path))
+    assert set(done["a.wav"]["stages"]) == {"text", "hubert", "semantic"}
+    assert done["b.wav"]["stages"] == ["text"]
+    assert {"hubert", "semantic"} <= set(done["a.wav"]["stages"])
+    assert not {"hubert", "semantic"} <= set(done["b.wav"]["stages"])
+
+    pipeline.merge(make_args(tmp_path, "text,hubert,semantic"))
+    with open("%s/2-name2text.txt" % tmp_path, encoding="utf8") as f:
+        assert f.read().split("\n")[:2] == ["a.wav\tn i2\t[1]\t你好", "b.wav\tz ai4\t[1]\t再见"]
+    with open("%s/6-name2semantic.tsv" % tmp_path, encoding="utf8") as f:
+        assert f.read().split("\n") == ["item_name\tsemantic_audio", "a.wav\t1 2 3"]
+
+
+def test_legacy_records_are_redone(tmp_path):
+    os.makedirs("%s/.pipeline" % tmp_path)
+    with open("%s/.pipeline/worker-0.jsonl" % tmp_path, "w", encoding="utf8") as f:
+        f.write(json.dumps({"name": "a.wav", "text_line": None, "semantic": None}) + "\n")
+    assert pipeline.load_journals(str(tmp_path))["a.wav"]["stages"] == []
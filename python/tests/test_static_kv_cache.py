@@ -0,0 +1,98 @@
+import pytest
+
+torch = pytest.importorskip("torch")
+t2s_model = pytest.importorskip("AR.models.t2s_model")
+
+CONFIG = {
+    "model": {
+        "hidden_dim": 32,
+        "embedding_dim": 32,
+        "head": 2,
+        "n_layer": 2,
+        "vocab_size": 50,
+        "phoneme_vocab_size": 20,
+        "dropout": 0.0,
+        "EOS": 49,
+    }
+}
+
+
+def tiny_decoder():
+    torch.manual_seed(0)
+    return t2s_model.Text2SemanticDecoder(CONFIG).double().eval()
+
+
+class CatTransformer:
+    """decode_next_token_static 的接口，内部走 torch.cat 增长的 decode_next_token（预分配之前的做法）"""
+
+    def __init__(self, transformer):
+        self.transformer = transformer
+
+    def process_prompt(self, x, attn_mask, padding_mask=None):
+        return self.transformer.process_prompt(x, attn_mask, padding_mask)
+
+    def decode_next_token_static(self, x, k_cache, v_cache, cache_len, attn_mask=None):
+        assert k_cache[0].shape[1] == cache_len
+        x, k_new, v_new = self.transformer.decode_next_token(x, list(k_cache), list(v_cache), attn_mask)
+        k_cache[:] = k_new
+        v_cache[:] = v_new
+        return x
+
+
+def cat_alloc(k_cache, v_cache, max_len):
+    return k_cache, v_cache
+
+
+def cat_compact(k_cache, v_cache, index):
+    return [k[index] for k in k_cache], [v[index] for v in v_cache]
+
+
+def make_batch(count=3):
+    g = torch.Generator().manual_seed(1)
+    x, bert = [], []
+    for i in range(count):
+        x_len = 5 + 4 * i
+        x.append(torch.randint(0, 20, (x_len,), generator=g))
+        bert.append(torch.randn(1024, x_len, generator=g, dtype=torch.float64))
+    prompts = torch.randint(0, 49, (count, 6), generator=g)
+    return x, torch.LongTensor([item.shape[0] for item in x]), prompts, bert
+
+
+def decode(model, seed, **kwargs):
+    x, x_lens, prompts, bert = make_batch()
+    torch.manual_seed(seed)
+    with torch.no_grad():
+        return model.infer_panel_batch_infer(x, x_lens, prompts, bert, **kwargs)
+
+
+@pytest.mark.parametrize("top_k, early_stop_num", [(1, -1), (5, 200)])
+def test_static_cache_matches_cat(monkeypatch, top_k, early_stop_num):
+    model = tiny_decoder()
+    y_static, idx_static = decode(model, 1234, top_k=top_k, early_stop_num=early_stop_num)
+
+    monkeypatch.setattr(model, "t2s_transformer", CatTransformer(model.t2s_transformer))
+    monkeypatch.setattr(t2s_model, "alloc_static_kv_cache", cat_alloc)
+    monkeypatch.setattr(t2s_model, "compact_static_kv_cache", cat_compact)
+    y_cat, idx_cat = decode(model, 1234, top_k=top_k, early_stop_num=early_stop_num)
+
+    assert idx_static == idx_cat
+    ### 有句子提前结束才会走到 compact_static_kv_cache
+    assert len(set(idx_static)) > 1
+    for a, b in zip(y_static, y_cat):
+        assert torch.equal(a, b)
+
+
+def test_alloc_and_compact():
+    k = [torch.randn(3, 4, 8) for _ in range(2)]
+    v = [torch.randn(3, 4, 8) for _ in range(2)]
+    k_static, v_static = t2s_model.alloc_static_kv_cache(k, v, 10)
+    assert k_static[0].shape == (3, 10, 8)
+    assert torch.equal(k_static[1][:, :4], k[1]) and torch.equal(v_static[0][:, :4], v[0])
+    assert not k_static[0][:, 4:].any()
+
+    buffer = k_static[0]
+    index = torch.LongTensor([2, 0])
+    k_static, v_static = t2s_model.compact_static_kv_cache(k_static, v_static, index)
+    assert k_static[0].data_ptr() == buffer.data_ptr()  # 不重新分配
+    assert torch.equal(k_static[0][:, :4], k[0][index])
+    assert torch.equal(v_static[1][:, :4], v[1][index])
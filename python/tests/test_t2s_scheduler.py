@@ -0,0 +1,106 @@
+import time
+
+import pytest
+
+torch = pytest.importorskip("torch")
+t2s_model = pytest.importorskip("AR.models.t2s_model")
+scheduler_module = pytest.importorskip("TTS_infer_pack.T2SScheduler")
+
+T2SScheduler = scheduler_module.T2SScheduler
+CONFIG = {
+    "model": {
+        "hidden_dim": 32,
+        "embedding_dim": 32,
+        "head": 2,
+        "n_layer": 2,
+        "vocab_size": 50,
+        "phoneme_vocab_size": 20,
+        "dropout": 0.0,
+        "EOS": 49,
+    }
+}
+
+
+def tiny_decoder():
+    torch.manual_seed(0)
+    return t2s_model.Text2SemanticDecoder(CONFIG).double().eval()
+
+
+def make_request(seed, x_len, prompt_len):
+    g = torch.Generator().manual_seed(seed)
+    x = torch.randint(0, 20, (x_len,), generator=g)
+    bert = torch.randn(1024, x_len, generator=g, dtype=torch.float64)
+    prompt = torch.randint(0, 49, (prompt_len,), generator=g)
+    return x, bert, prompt
+
+
+def decode_alone(model, request, early_stop_num):
+    scheduler = T2SScheduler(model, max_batch_size=1, max_steps=40)
+    try:
+        y, idx = scheduler.submit(*request, top_k=1, early_stop_num=early_stop_num).wait(30)
+    finally:
+        scheduler.stop()
+    return y, idx
+
+
+def test_join_and_leave_mid_batch():
+    model = tiny_decoder()
+    requests = [make_request(i, 5 + 3 * i, 4 + 2 * i) for i in range(4)]
+    early_stops = [6, 25, 12, -1]
+    expected = [decode_alone(model, request, stop) for request, stop in zip(requests, early_stops)]
+
+    scheduler = T2SScheduler(model, max_batch_size=4, max_steps=40)
+    handles = [None] * len(requests)
+    submitted = [1]  # 第 0 句由主线程提交，解码线程可能在 handles[0] 赋值前就开始 step
+    batch_sizes = []
+    step = scheduler._step
+
+    def step_and_join():
+        ### 每解码 3 步加入一句，early_stop_num 不同的句子在不同步离开
+        batch_sizes.append(len(scheduler.running))
+        if len(batch_sizes) % 3 == 0 and submitted[0] < len(requests):
+            i = submitted[0]
+            submitted[0] += 1
+            handles[i] = scheduler.submit(*requests[i], top_k=1, early_stop_num=early_stops[i])
+        step()
+
+    scheduler._step = step_and_join
+    try:
+        handles[0] = scheduler.submit(*requests[0], top_k=1, early_stop_num=early_stops[0])
+        while any(handle is None for handle in handles):
+            time.sleep(0.01)
+        results = [handle.wait(30) for handle in handles]
+    finally:
+        scheduler.stop()
+    assert max(batch_sizes) >= 3
+    for (y, idx), (y0, idx0) in zip(results, expected):
+        assert idx == idx0
+        assert torch.equal(y, y0)
+
+
+def test_stop_fails_running_and_pending():
+    model = tiny_decoder()
+    scheduler = T2SScheduler(model, max_batch_size=1, max_steps=40)
+    handles = [scheduler.submit(*make_request(i, 6, 4), top_k=1) for i in range(6)]
+    scheduler.stop()
+    failed = 0
+    for handle in handles:
+        assert handle.done.is_set()
+        try:
+            handle.wait(0)
+        except RuntimeError:
+            failed += 1
+    assert failed > 0
+    with pytest.raises(RuntimeError):
+        scheduler.submit(*make_request(0, 6, 4))
+
+
+def test_wait_timeout_cancels_request():
+    model = tiny_decoder()
+    scheduler = T2SScheduler(model, max_batch_size=1, max_steps=40, wait_timeout=0)
+    try:
+        x, bert, prompt = make_request(0, 6, 4)
+        with pytest.raises(TimeoutError):
+            scheduler.infer_panel([x], None, prompt.unsqueeze(0), [bert], top_k=1)
+    finally:
+        scheduler.stop()